@@ -0,0 +1,150 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Shape sweep of the packed GEMM used by the matmul kernels against the
+// naive triple loop it replaced. Thread count follows
+// FLAGS_custom_cpu_num_threads.
+//
+//   ./gemm_benchmark [max_naive_flops]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+
+namespace {
+
+template <typename T>
+void NaiveGEMM(bool trans_x,
+               bool trans_y,
+               size_t M,
+               size_t K,
+               size_t N,
+               const T* x,
+               const T* y,
+               T* out) {
+  memset(out, 0, M * N * sizeof(T));
+  for (size_t m = 0; m < M; ++m) {
+    for (size_t n = 0; n < N; ++n) {
+      auto* out_data = &out[m * N + n];
+      for (size_t k = 0; k < K; ++k) {
+        auto x_dat = trans_x ? x[k * M + m] : x[m * K + k];
+        auto y_dat = trans_y ? y[n * K + k] : y[k * N + n];
+        *out_data += x_dat * y_dat;
+      }
+    }
+  }
+}
+
+template <typename F>
+double TimeIt(const F& fn, double flops) {
+  // Repeat until at least ~0.2s of work has been measured.
+  int repeat = std::max(1, static_cast<int>(2e8 / std::max(flops, 1.0)));
+  fn();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    fn();
+  }
+  auto end = std::chrono::steady_clock::now();
+  return std::chrono::duration<double>(end - start).count() / repeat;
+}
+
+template <typename T>
+void Run(const char* dtype,
+         int64_t M,
+         int64_t K,
+         int64_t N,
+         bool trans_x,
+         bool trans_y,
+         double max_naive_flops) {
+  std::mt19937 gen(2023);
+  std::uniform_real_distribution<T> dist(-1, 1);
+  std::vector<T> x(M * K), y(K * N), out(M * N), ref(M * N);
+  for (auto& v : x) v = dist(gen);
+  for (auto& v : y) v = dist(gen);
+
+  double flops = 2.0 * M * N * K;
+  double packed = TimeIt(
+      [&] {
+        custom_kernel::gemm::Gemm<T>(
+            trans_x, trans_y, M, K, N, x.data(), y.data(), out.data());
+      },
+      flops);
+
+  double naive = -1;
+  double max_err = 0;
+  if (flops <= max_naive_flops) {
+    naive = TimeIt(
+        [&] {
+          NaiveGEMM<T>(
+              trans_x, trans_y, M, K, N, x.data(), y.data(), ref.data());
+        },
+        flops);
+    for (int64_t i = 0; i < M * N; ++i) {
+      max_err = std::max<double>(max_err, std::abs(out[i] - ref[i]));
+    }
+  }
+
+  printf("%-7s %5ld %5ld %5ld   %d   %d  %9.2f  ",
+         dtype,
+         static_cast<long>(M),  // NOLINT
+         static_cast<long>(K),  // NOLINT
+         static_cast<long>(N),  // NOLINT
+         trans_x,
+         trans_y,
+         flops / packed * 1e-9);
+  if (naive > 0) {
+    printf(
+        "%9.2f  %7.1fx  %.2e\n", flops / naive * 1e-9, naive / packed, max_err);
+  } else {
+    printf("%9s  %8s  %8s\n", "-", "-", "-");
+  }
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  double max_naive_flops = argc > 1 ? atof(argv[1]) : 2.0 * 512 * 512 * 512;
+  printf("threads: %d\n", custom_kernel::GetNumThreads());
+  printf(
+      "dtype       M     K     N  t_x t_y  packed GF/s  naive GF/s  "
+      "speedup  max_err\n");
+
+  const int64_t shapes[][3] = {{64, 784, 128},
+                               {64, 128, 10},
+                               {128, 128, 128},
+                               {256, 256, 256},
+                               {512, 512, 512},
+                               {1024, 1024, 1024},
+                               {1, 4096, 4096},
+                               {4096, 4096, 1},
+                               {32, 4096, 1024},
+                               {2048, 64, 2048}};
+  for (auto& s : shapes) {
+    Run<float>("float32", s[0], s[1], s[2], false, false, max_naive_flops);
+  }
+  for (auto& s : shapes) {
+    Run<double>("float64", s[0], s[1], s[2], false, false, max_naive_flops);
+  }
+  for (int t = 1; t < 4; ++t) {
+    Run<float>("float32", 256, 256, 256, t & 1, t & 2, max_naive_flops);
+  }
+  return 0;
+}
@@ -0,0 +1,155 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Large elementwise add and sum reduction on device memory of the caching
+// allocator, with 4 KiB pages, with transparent huge pages and with huge
+// pages faulted in by the thread pool at allocation. Every mode runs in a
+// fresh process so that the allocator picks up its flags. "first" is the
+// allocation plus the first pass writing the tensors, faults are the minor
+// page faults of the whole run. Thread count follows
+// FLAGS_custom_cpu_num_threads.
+//
+//   ./hugepage_benchmark [tensor_mb] [repeat]
+
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "runtime/allocator.h"
+
+namespace {
+
+constexpr int64_t kGrain = 1 << 16;
+
+double Now() {
+  return std::chrono::duration<double>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+long MinorFaults() {  // NOLINT
+  rusage usage;
+  getrusage(RUSAGE_SELF, &usage);
+  return usage.ru_minflt;
+}
+
+void Add(const float* x, const float* y, float* out, int64_t numel) {
+  custom_kernel::ParallelFor(0, numel, kGrain, [&](int64_t begin, int64_t end) {
+    for (auto i = begin; i < end; ++i) {
+      out[i] = x[i] + y[i];
+    }
+  });
+}
+
+double Sum(const float* x, int64_t numel) {
+  auto num_threads = custom_kernel::GetNumThreads();
+  auto chunk = (numel + num_threads - 1) / num_threads;
+  std::vector<double> partial(num_threads, 0);
+  custom_kernel::ParallelRun(num_threads, [&](int64_t t) {
+    auto end = std::min(numel, (t + 1) * chunk);
+    double sum = 0;
+    for (auto i = t * chunk; i < end; ++i) {
+      sum += x[i];
+    }
+    partial[t] = sum;
+  });
+  double sum = 0;
+  for (auto v : partial) sum += v;
+  return sum;
+}
+
+void Run(const char* mode, size_t bytes, int repeat) {
+  auto& allocator = custom_cpu::CachingAllocator::Device(0);
+  auto numel = static_cast<int64_t>(bytes / sizeof(float));
+  auto faults = MinorFaults();
+
+  double start = Now();
+  auto* x = static_cast<float*>(allocator.Allocate(bytes));
+  auto* y = static_cast<float*>(allocator.Allocate(bytes));
+  auto* out = static_cast<float*>(allocator.Allocate(bytes));
+  if (!x || !y || !out) {
+    printf("%-14s out of memory\n", mode);
+    return;
+  }
+  custom_kernel::ParallelFor(0, numel, kGrain, [&](int64_t begin, int64_t end) {
+    for (auto i = begin; i < end; ++i) {
+      x[i] = static_cast<float>(i % 7);
+      y[i] = 1.f;
+    }
+  });
+  Add(x, y, out, numel);
+  double first = Now() - start;
+
+  start = Now();
+  for (int i = 0; i < repeat; ++i) {
+    Add(x, y, out, numel);
+  }
+  double add = (Now() - start) / repeat;
+  start = Now();
+  double sum = 0;
+  for (int i = 0; i < repeat; ++i) {
+    sum += Sum(out, numel);
+  }
+  double reduce = (Now() - start) / repeat;
+  faults = MinorFaults() - faults;
+
+  printf("%-14s %10.1f  %10ld  %8.2f  %9.2f  (checksum %.0f)\n",
+         mode,
+         first * 1e3,
+         faults,
+         3.0 * bytes / add / 1e9,
+         1.0 * bytes / reduce / 1e9,
+         sum / repeat);
+  allocator.Free(x, bytes);
+  allocator.Free(y, bytes);
+  allocator.Free(out, bytes);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  size_t tensor_mb = argc > 1 ? atol(argv[1]) : 256;
+  int repeat = argc > 2 ? atoi(argv[2]) : 10;
+  struct Mode {
+    const char* name;
+    const char* threshold_mb;
+    const char* prefault;
+  } modes[] = {
+      {"4k pages", "0", "0"},
+      {"thp", "32", "0"},
+      {"thp+prefault", "32", "1"},
+  };
+  printf("3 x %zu MiB float32 tensors\n", tensor_mb);
+  printf("mode            first ms      faults  add GB/s  reduce GB/s\n");
+  fflush(stdout);
+  for (auto& mode : modes) {
+    auto pid = fork();
+    if (pid == 0) {
+      setenv("FLAGS_custom_cpu_hugepage_threshold_mb", mode.threshold_mb, 1);
+      setenv("FLAGS_custom_cpu_hugepage_prefault", mode.prefault, 1);
+      Run(mode.name, tensor_mb << 20, repeat);
+      fflush(stdout);
+      _exit(0);
+    }
+    waitpid(pid, nullptr, 0);
+  }
+  return 0;
+}
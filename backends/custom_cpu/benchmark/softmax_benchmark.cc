@@ -0,0 +1,133 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Sequence length sweep of the softmax used by the softmax kernels on
+// attention shaped scores [heads, seq_len, seq_len], against the per
+// position loop it replaced. Thread count follows
+// FLAGS_custom_cpu_num_threads.
+//
+//   ./softmax_benchmark [heads] [max_seq_len]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/softmax_function.h"
+
+namespace {
+
+template <typename T>
+T ValueClip(const T& x) {
+  const T kThreshold = static_cast<T>(-64.);
+  return x < kThreshold ? kThreshold : x;
+}
+
+template <typename T>
+void NaiveSoftmax(int axis_dim, const T* in, T* out, size_t M, size_t N) {
+  auto remain = N / axis_dim;
+  for (size_t i = 0; i < M; ++i) {
+    for (size_t k = 0; k < remain; ++k) {
+      T max_val = in[i * N + k];
+      for (size_t j = 0; j < axis_dim; ++j) {
+        max_val = std::max(max_val, in[i * N + j * remain + k]);
+      }
+      auto exps = new T[axis_dim];
+      for (size_t j = 0; j < axis_dim; ++j) {
+        exps[j] = std::exp(ValueClip(in[i * N + j * remain + k] - max_val));
+      }
+      T sum = 0;
+      for (size_t j = 0; j < axis_dim; ++j) {
+        sum += exps[j];
+      }
+      for (size_t j = 0; j < axis_dim; ++j) {
+        out[i * N + j * remain + k] = exps[j] / sum;
+      }
+      delete[] exps;
+    }
+  }
+}
+
+template <typename F>
+double TimeIt(const F& fn, double elements) {
+  // Repeat until at least ~0.2s of work has been measured.
+  int repeat = std::max(1, static_cast<int>(2e7 / std::max(elements, 1.0)));
+  fn();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    fn();
+  }
+  auto end = std::chrono::steady_clock::now();
+  return std::chrono::duration<double>(end - start).count() / repeat;
+}
+
+template <typename T>
+void Run(const char* dtype, int64_t heads, int64_t seq_len, bool last_axis) {
+  std::mt19937 gen(2023);
+  std::uniform_real_distribution<T> dist(-8, 8);
+  int64_t numel = heads * seq_len * seq_len;
+  std::vector<T> x(numel), out(numel), ref(numel);
+  for (auto& v : x) v = dist(gen);
+
+  // [heads, seq_len, seq_len] reduced over the last or the middle axis.
+  int64_t outer = last_axis ? heads * seq_len : heads;
+  int64_t inner = last_axis ? 1 : seq_len;
+  double fast = TimeIt(
+      [&] {
+        custom_kernel::Softmax<T>(x.data(), out.data(), outer, seq_len, inner);
+      },
+      numel);
+  double naive = TimeIt(
+      [&] {
+        NaiveSoftmax<T>(seq_len, x.data(), ref.data(), outer, seq_len * inner);
+      },
+      numel);
+  double max_err = 0;
+  for (int64_t i = 0; i < numel; ++i) {
+    max_err = std::max<double>(max_err, std::abs(out[i] - ref[i]));
+  }
+  printf("%-7s %5s %6ld %8ld  %10.3f  %10.3f  %7.1fx  %.2e\n",
+         dtype,
+         last_axis ? "last" : "mid",
+         static_cast<long>(seq_len),  // NOLINT
+         static_cast<long>(heads),    // NOLINT
+         fast * 1e3,
+         naive * 1e3,
+         naive / fast,
+         max_err);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int64_t heads = argc > 1 ? atol(argv[1]) : 8;
+  int64_t max_seq_len = argc > 2 ? atol(argv[2]) : 2048;
+  printf("threads: %d\n", custom_kernel::GetNumThreads());
+  printf(
+      "dtype    axis seqlen    heads     fast ms    naive ms  speedup  "
+      "max_err\n");
+  for (int64_t seq_len = 64; seq_len <= max_seq_len; seq_len *= 2) {
+    Run<float>("float32", heads, seq_len, true);
+  }
+  for (int64_t seq_len = 64; seq_len <= max_seq_len; seq_len *= 2) {
+    Run<double>("float64", heads, seq_len, true);
+  }
+  for (int64_t seq_len = 64; seq_len <= max_seq_len; seq_len *= 4) {
+    Run<float>("float32", heads, seq_len, false);
+  }
+  return 0;
+}
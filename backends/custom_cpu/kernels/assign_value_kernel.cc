@@ -14,6 +14,7 @@
 
 #include <cmath>
 
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
@@ -31,7 +32,7 @@ void AssignValueKernel(const phi::Context& dev_ctx,
            "argument dtype is %s, kernel dtype is %s.",
            dtype,
            template_dtype);
-  auto out_data = dev_ctx.template Alloc<T>(out);
+  auto out_data = AllocOverwrite<T>(dev_ctx, out);
   for (auto i = 0; i < values.size(); ++i) {
     out_data[i] = values[i].to<T>();
   }
@@ -42,9 +43,12 @@ template <typename T>
 void AssignKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& x,
                   phi::DenseTensor* out) {
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto x_data = x.data<T>();
-  std::memcpy(out_data, x_data, sizeof(T) * x.numel());
+  phi::DenseTensor x_src;
+  auto out_data = AllocInplace<T>(dev_ctx, x, out, &x_src);
+  auto x_data = x_src.data<T>();
+  if (out_data != x_data) {
+    std::memcpy(out_data, x_data, sizeof(T) * x_src.numel());
+  }
 }
 
 }  // namespace custom_kernel
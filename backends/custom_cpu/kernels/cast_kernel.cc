@@ -12,92 +12,187 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <algorithm>
+#include <cstring>
+
+#include "kernels/funcs/cast_function.h"
+#include "kernels/funcs/inplace.h"
+#include "kernels/funcs/parallel.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
 namespace custom_kernel {
 
+using float16 = phi::dtype::float16;
+using bfloat16 = phi::dtype::bfloat16;
+
+static_assert(sizeof(float16) == sizeof(uint16_t) &&
+                  sizeof(bfloat16) == sizeof(uint16_t),
+              "half types must be stored as 16 bits");
+
+// Elements of a half tensor that are widened to (or narrowed from) float on
+// the stack at a time when the other side is not float.
+constexpr int64_t kCastBlock = 512;
+
+// y[i] = Dst(x[i]) for i in [0, n), one specialized loop per (Src, Dst)
+// pair. Non-half pairs convert directly, so int64 and double keep their
+// precision. Half types go through bulk float conversions.
+template <typename Src, typename Dst>
+void CastRange(const Src* x, Dst* y, int64_t n) {
+  for (int64_t i = 0; i < n; ++i) {
+    y[i] = static_cast<Dst>(x[i]);
+  }
+}
+
+template <typename T>
+void CastRange(const T* x, T* y, int64_t n) {
+  std::memcpy(y, x, n * sizeof(T));
+}
+
+inline void CastRange(const float* x, float16* y, int64_t n) {
+  FloatToHalf(x, reinterpret_cast<uint16_t*>(y), n);
+}
+
+inline void CastRange(const float16* x, float* y, int64_t n) {
+  HalfToFloat(reinterpret_cast<const uint16_t*>(x), y, n);
+}
+
+inline void CastRange(const float* x, bfloat16* y, int64_t n) {
+  FloatToBFloat16(x, reinterpret_cast<uint16_t*>(y), n);
+}
+
+inline void CastRange(const bfloat16* x, float* y, int64_t n) {
+  BFloat16ToFloat(reinterpret_cast<const uint16_t*>(x), y, n);
+}
+
+// Half source or destination paired with anything but float: go through a
+// float block.
+template <typename Dst>
+void CastRange(const float16* x, Dst* y, int64_t n) {
+  float buffer[kCastBlock];
+  for (int64_t i = 0; i < n; i += kCastBlock) {
+    auto len = std::min(kCastBlock, n - i);
+    CastRange(x + i, buffer, len);
+    CastRange(static_cast<const float*>(buffer), y + i, len);
+  }
+}
+
+template <typename Dst>
+void CastRange(const bfloat16* x, Dst* y, int64_t n) {
+  float buffer[kCastBlock];
+  for (int64_t i = 0; i < n; i += kCastBlock) {
+    auto len = std::min(kCastBlock, n - i);
+    CastRange(x + i, buffer, len);
+    CastRange(static_cast<const float*>(buffer), y + i, len);
+  }
+}
+
+template <typename Src>
+void CastRange(const Src* x, float16* y, int64_t n) {
+  float buffer[kCastBlock];
+  for (int64_t i = 0; i < n; i += kCastBlock) {
+    auto len = std::min(kCastBlock, n - i);
+    CastRange(x + i, buffer, len);
+    CastRange(static_cast<const float*>(buffer), y + i, len);
+  }
+}
+
+template <typename Src>
+void CastRange(const Src* x, bfloat16* y, int64_t n) {
+  float buffer[kCastBlock];
+  for (int64_t i = 0; i < n; i += kCastBlock) {
+    auto len = std::min(kCastBlock, n - i);
+    CastRange(x + i, buffer, len);
+    CastRange(static_cast<const float*>(buffer), y + i, len);
+  }
+}
+
+inline void CastRange(const float16* x, bfloat16* y, int64_t n) {
+  CastRange<bfloat16>(x, y, n);
+}
+
+inline void CastRange(const bfloat16* x, float16* y, int64_t n) {
+  CastRange<float16>(x, y, n);
+}
+
+inline void CastRange(const float16* x, float16* y, int64_t n) {
+  std::memcpy(y, x, n * sizeof(float16));
+}
+
+inline void CastRange(const bfloat16* x, bfloat16* y, int64_t n) {
+  std::memcpy(y, x, n * sizeof(bfloat16));
+}
+
+template <typename T, typename Dst>
+void CastTo(const phi::Context& dev_ctx,
+            const phi::DenseTensor& x,
+            phi::DenseTensor* out) {
+  phi::DenseTensor x_src;
+  Dst* out_data = AllocInplace<Dst>(dev_ctx, x, out, &x_src);
+  const T* x_data = x_src.data<T>();
+  auto numel = x_src.numel();
+  // An in-place cast_ keeps x's buffer for out. Chunks of a same size cast
+  // only touch their own bytes. A narrowing cast is safe front to back,
+  // element i never overwrites bytes of a later one, but parallel chunks
+  // would, so it runs as one pass. Any other overlap is cast from a copy.
+  auto x_bytes = reinterpret_cast<const char*>(x_data);
+  auto out_bytes = reinterpret_cast<const char*>(out_data);
+  bool same_elements = out_bytes == x_bytes && sizeof(Dst) == sizeof(T);
+  phi::DenseTensor x_copy;
+  if (!same_elements && out_bytes < x_bytes + numel * sizeof(T) &&
+      x_bytes < out_bytes + numel * sizeof(Dst)) {
+    if (out_bytes == x_bytes && sizeof(Dst) < sizeof(T)) {
+      CastRange(x_data, out_data, numel);
+      return;
+    }
+    x_copy.Resize(x_src.dims());
+    auto copy_data = dev_ctx.template Alloc<T>(&x_copy);
+    std::memcpy(copy_data, x_data, numel * sizeof(T));
+    x_data = copy_data;
+  }
+  constexpr int64_t kGrainSize = 1 << 16;
+  ParallelFor(0, numel, kGrainSize, [&](int64_t begin, int64_t end) {
+    CastRange(x_data + begin, out_data + begin, end - begin);
+  });
+}
+
 template <typename T>
 void CastKernel(const phi::Context& dev_ctx,
                 const phi::DenseTensor& x,
                 phi::DataType out_dtype,
                 phi::DenseTensor* out) {
-  auto x_data = x.data<T>();
   out->Resize(x.dims());
-  auto numel = x.numel();
   switch (out_dtype) {
-    case phi::DataType::BFLOAT16: {
-      auto out_data = dev_ctx.template Alloc<phi::dtype::bfloat16>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] =
-            static_cast<phi::dtype::bfloat16>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::BFLOAT16:
+      CastTo<T, bfloat16>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::FLOAT16: {
-      auto out_data = dev_ctx.template Alloc<phi::dtype::float16>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] =
-            static_cast<phi::dtype::float16>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::FLOAT16:
+      CastTo<T, float16>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::FLOAT32: {
-      auto out_data = dev_ctx.template Alloc<float>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<float>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::FLOAT32:
+      CastTo<T, float>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::FLOAT64: {
-      auto out_data = dev_ctx.template Alloc<double>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<double>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::FLOAT64:
+      CastTo<T, double>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::INT8: {
-      auto out_data = dev_ctx.template Alloc<int8_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int8_t>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::INT8:
+      CastTo<T, int8_t>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::INT16: {
-      auto out_data = dev_ctx.template Alloc<int16_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int16_t>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::INT16:
+      CastTo<T, int16_t>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::INT32: {
-      auto out_data = dev_ctx.template Alloc<int32_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int32_t>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::INT32:
+      CastTo<T, int32_t>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::INT64: {
-      auto out_data = dev_ctx.template Alloc<int64_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int64_t>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::INT64:
+      CastTo<T, int64_t>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::UINT8: {
-      auto out_data = dev_ctx.template Alloc<uint8_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<uint8_t>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::UINT8:
+      CastTo<T, uint8_t>(dev_ctx, x, out);
       break;
-    }
-    case phi::DataType::BOOL: {
-      auto out_data = dev_ctx.template Alloc<bool>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<bool>(static_cast<float>(x_data[i]));
-      }
+    case phi::DataType::BOOL:
+      CastTo<T, bool>(dev_ctx, x, out);
       break;
-    }
     default:
       break;
   }
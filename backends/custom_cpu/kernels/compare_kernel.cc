@@ -13,38 +13,82 @@
 // limitations under the License.
 
 #include <cmath>
+#include <type_traits>
 
+#include "kernels/funcs/elementwise_base.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
 namespace custom_kernel {
 
+template <typename T>
+struct NotEqualFunctor {
+  inline bool operator()(const T a, const T b) const {
+    if (std::is_floating_point<T>::value) {
+      return fabs(static_cast<double>(a - b)) >= 1e-8;
+    }
+    return a != b;
+  }
+};
+
+template <typename T>
+struct EqualFunctor {
+  inline bool operator()(const T a, const T b) const {
+    if (std::is_floating_point<T>::value) {
+      return fabs(static_cast<double>(a - b)) < 1e-8;
+    }
+    return a == b;
+  }
+};
+
+template <typename T>
+struct LessThanFunctor {
+  inline bool operator()(const T a, const T b) const { return a < b; }
+};
+
+template <typename T>
+struct LessEqualFunctor {
+  inline bool operator()(const T a, const T b) const { return a <= b; }
+};
+
+template <typename T>
+struct GreaterThanFunctor {
+  inline bool operator()(const T a, const T b) const { return a > b; }
+};
+
+template <typename T>
+struct GreaterEqualFunctor {
+  inline bool operator()(const T a, const T b) const { return a >= b; }
+};
+
+template <typename T, typename Functor>
+void CompareCompute(const phi::Context& dev_ctx,
+                    const phi::DenseTensor& x,
+                    const phi::DenseTensor& y,
+                    int axis,
+                    const Functor& func,
+                    phi::DenseTensor* out) {
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
+  auto rank = static_cast<int64_t>(dst_dims.size());
+  auto out_data = dev_ctx.template Alloc<bool>(out);
+  BinaryElementwise(AlignBroadcastDims(x_dims, rank, axis),
+                    AlignBroadcastDims(y_dims, rank, axis),
+                    dst_dims,
+                    x.data<T>(),
+                    y.data<T>(),
+                    out_data,
+                    func);
+}
+
 template <typename T>
 void NotEqualRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) >= 1e-8);
-    } else {
-      out_data[i] = x_data[i] != y_data[i];
-    }
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, NotEqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -61,26 +105,7 @@ void EqualRawKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& y,
                     int axis,
                     phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) < 1e-8);
-    } else {
-      out_data[i] = x_data[i] == y_data[i];
-    }
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, EqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -97,20 +122,7 @@ void LessThanRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] < y_data[i];
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, LessThanFunctor<T>(), out);
 }
 
 template <typename T>
@@ -127,20 +139,7 @@ void LessEqualRawKernel(const phi::Context& dev_ctx,
                         const phi::DenseTensor& y,
                         int axis,
                         phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] <= y_data[i];
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, LessEqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -157,20 +156,7 @@ void GreaterThanRawKernel(const phi::Context& dev_ctx,
                           const phi::DenseTensor& y,
                           int axis,
                           phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] > y_data[i];
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, GreaterThanFunctor<T>(), out);
 }
 
 template <typename T>
@@ -187,20 +173,7 @@ void GreaterEqualRawKernel(const phi::Context& dev_ctx,
                            const phi::DenseTensor& y,
                            int axis,
                            phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] >= y_data[i];
-  }
+  CompareCompute<T>(dev_ctx, x, y, axis, GreaterEqualFunctor<T>(), out);
 }
 
 template <typename T>
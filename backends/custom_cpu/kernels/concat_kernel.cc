@@ -12,6 +12,9 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <vector>
+
+#include "kernels/funcs/strided_copy.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
@@ -37,20 +40,21 @@ void ConcatKernel(const phi::Context& dev_ctx,
     }
   }
   out->Resize(out_dims);
-  dev_ctx.template Alloc<T>(out);
+  T* out_data = dev_ctx.template Alloc<T>(out);
 
-  auto M = std::accumulate(
-      out_dims.cbegin(), out_dims.cbegin() + axis, 1, std::multiplies<int>());
-  auto N = std::accumulate(
-      out_dims.cbegin() + axis + 1, out_dims.cend(), 1, std::multiplies<int>());
-  auto out_offset = 0;
-  for (auto i = 0; i < M; ++i) {
-    for (auto j = 0; j < x.size(); ++j) {
-      memcpy(out->data<T>() + out_offset,
-             x[j]->data<T>() + i * N * x[j]->dims()[axis],
-             (N * x[j]->dims()[axis]) * sizeof(T));
-      out_offset += N * x[j]->dims()[axis];
-    }
+  // Every input is a strided copy into its slab of the output, which
+  // coalesces into one run per outer row covering all the input's trailing
+  // axes.
+  auto out_strides = ContiguousStrides(out_dims);
+  int64_t axis_offset = 0;
+  for (auto j = 0; j < x.size(); ++j) {
+    auto x_dims = x[j]->dims();
+    StridedCopy(x_dims,
+                ContiguousStrides(x_dims),
+                out_strides,
+                x[j]->data<T>(),
+                out_data + axis_offset * out_strides[axis]);
+    axis_offset += x_dims[axis];
   }
 }
 
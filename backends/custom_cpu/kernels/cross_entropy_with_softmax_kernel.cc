@@ -13,26 +13,54 @@
 // limitations under the License.
 
 #include "kernels.h"  //NOLINT
+#include "kernels/funcs/cross_entropy_function.h"
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
 namespace custom_kernel {
 
+template <typename LabelT>
+void CheckHardLabel(const LabelT* label,
+                    int64_t numel,
+                    int64_t axis_dim,
+                    int ignore_index) {
+  for (int64_t i = 0; i < numel; ++i) {
+    auto lbl = static_cast<int64_t>(label[i]);
+    if (lbl != ignore_index) {
+      PD_CHECK(lbl >= 0,
+               "label value should >= 0 when label "
+               "value(%ld) not equal to ignore_index(%d)",
+               lbl,
+               ignore_index);
+      PD_CHECK(lbl < axis_dim,
+               "label value should less than the shape of axis dimension "
+               "when label value(%ld) not equal to ignore_index(%d), But "
+               "received label value as %ld and shape of axis dimension "
+               "is %ld",
+               lbl,
+               ignore_index,
+               lbl,
+               axis_dim);
+    }
+  }
+}
+
 template <typename T, typename U>
 void CrossEntropy(const T* prob,
                   const U* label,
                   bool soft_label,
-                  size_t batch_size,
-                  size_t num_classes,
+                  int64_t batch_size,
+                  int64_t num_classes,
                   int ignore_index,
-                  int axis_dim,
+                  int64_t axis_dim,
                   T* out) {
   auto num_remain = num_classes / axis_dim;
   if (soft_label) {
-    for (auto i = 0; i < batch_size; ++i) {
-      for (auto k = 0; k < num_remain; ++k) {
+    for (int64_t i = 0; i < batch_size; ++i) {
+      for (int64_t k = 0; k < num_remain; ++k) {
         out[i * num_remain + k] = 0;
-        for (auto j = 0; j < axis_dim; ++j) {
+        for (int64_t j = 0; j < axis_dim; ++j) {
           auto idx = i * num_classes + j * num_remain + k;
           out[i * num_remain + k] -=
               label[idx] * phi::TolerableValue<T>(std::log(prob[idx]));
@@ -40,27 +68,12 @@ void CrossEntropy(const T* prob,
       }
     }
   } else {
-    for (int i = 0; i < batch_size; ++i) {
-      for (int j = 0; j < num_remain; j++) {
-        int lbl = static_cast<int>(label[i * num_remain + j]);
-        if (lbl != ignore_index) {
-          PD_CHECK(lbl >= 0,
-                   "label value should >= 0 when label "
-                   "value(%f) not equal to ignore_index(%f)",
-                   lbl,
-                   ignore_index);
-          PD_CHECK(lbl < axis_dim,
-                   "label value should less than the shape of axis dimension "
-                   "when label value(%f) not equal to ignore_index(%f), But "
-                   "received label value as %ld and shape of axis dimension "
-                   "is %d",
-                   lbl,
-                   ignore_index,
-                   lbl,
-                   axis_dim);
-        }
-        int index = i * num_classes + lbl * num_remain + j;
-        int loss_idx = i * num_remain + j;
+    CheckHardLabel(label, batch_size * num_remain, axis_dim, ignore_index);
+    for (int64_t i = 0; i < batch_size; ++i) {
+      for (int64_t j = 0; j < num_remain; j++) {
+        auto lbl = static_cast<int64_t>(label[i * num_remain + j]);
+        auto index = i * num_classes + lbl * num_remain + j;
+        auto loss_idx = i * num_remain + j;
         out[loss_idx] = lbl == ignore_index
                             ? 0
                             : -phi::TolerableValue<T>(std::log(prob[index]));
@@ -80,22 +93,22 @@ void CrossEntropyKernel(const phi::Context& dev_ctx,
   auto x_dims = x.dims();
   const int rank = x_dims.size();
   const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
-  int axis_dim = x_dims[axis_v];
+  int64_t axis_dim = x_dims[axis_v];
 
   PD_CHECK(axis_dim > 0,
            "The axis dimention should be larger than 0, but received "
-           "axis dimention is %d.",
+           "axis dimention is %ld.",
            axis_dim);
 
   auto out_data = dev_ctx.template Alloc<T>(out);
 
-  const int n = phi::funcs::SizeToAxis(axis_v, x.dims());
+  const int64_t n = phi::funcs::SizeToAxis(axis_v, x.dims());
   PD_CHECK(n > 0,
            "The size of axis should be larger than 0, but received "
-           "SizeToAxis of softmax is %d.",
+           "SizeToAxis of softmax is %ld.",
            n);
 
-  const int d = phi::funcs::SizeFromAxis(axis_v, x.dims());
+  const int64_t d = phi::funcs::SizeFromAxis(axis_v, x.dims());
   if (soft_label) {
     CrossEntropy<T, T>(x.data<T>(),
                        label.data<T>(),
@@ -155,6 +168,53 @@ void CrossEntropyKernel(const phi::Context& dev_ctx,
   }
 }
 
+// Softmax and loss of the logits in one pass: the loss is taken from the
+// log-sum-exp of every softmax, never from log(softmax).
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropy(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& logits,
+                         const phi::DenseTensor& label,
+                         bool soft_label,
+                         int ignore_index,
+                         int axis,
+                         phi::DenseTensor* softmax,
+                         phi::DenseTensor* loss) {
+  auto dims = logits.dims();
+  const int rank = dims.size();
+  const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
+  const int64_t axis_dim = dims[axis_v];
+  PD_CHECK(axis_dim > 0,
+           "The axis dimention should be larger than 0, but received "
+           "axis dimention is %ld.",
+           axis_dim);
+  const int64_t n = phi::funcs::SizeToAxis(axis_v, dims);
+  const int64_t inner = phi::funcs::SizeOutAxis(axis_v, dims);
+
+  phi::DenseTensor logits_src;
+  auto softmax_data = AllocInplace<T>(dev_ctx, logits, softmax, &logits_src);
+  auto loss_data = dev_ctx.template Alloc<T>(loss);
+  if (soft_label) {
+    SoftmaxCrossEntropySoftLabel(logits_src.data<T>(),
+                                 label.data<T>(),
+                                 n,
+                                 axis_dim,
+                                 inner,
+                                 softmax_data,
+                                 loss_data);
+  } else {
+    auto label_data = label.data<LabelT>();
+    CheckHardLabel(label_data, n * inner, axis_dim, ignore_index);
+    SoftmaxCrossEntropyHardLabel(logits_src.data<T>(),
+                                 label_data,
+                                 n,
+                                 axis_dim,
+                                 inner,
+                                 static_cast<int64_t>(ignore_index),
+                                 softmax_data,
+                                 loss_data);
+  }
+}
+
 template <typename T>
 void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
                                    const phi::DenseTensor& logits,
@@ -168,16 +228,37 @@ void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
                                    phi::DenseTensor* loss) {
   // do not with softmax op, and input is softmax
   if (!use_softmax) {
-    auto softmax_data = dev_ctx.template Alloc<T>(softmax);
+    phi::DenseTensor logits_src;
+    auto softmax_data = AllocInplace<T>(dev_ctx, logits, softmax, &logits_src);
     CrossEntropyKernel<T>(
-        dev_ctx, logits, label, soft_label, ignore_index, axis, loss);
-    memcpy(softmax_data, logits.data<T>(), sizeof(T) * logits.numel());
+        dev_ctx, logits_src, label, soft_label, ignore_index, axis, loss);
+    if (softmax_data != logits_src.data<T>()) {
+      memcpy(softmax_data, logits_src.data<T>(), sizeof(T) * logits.numel());
+    }
     return;
   }
 
-  custom_kernel::SoftmaxKernel<T>(dev_ctx, logits, axis, softmax);
-  CrossEntropyKernel<T>(
-      dev_ctx, *softmax, label, soft_label, ignore_index, axis, loss);
+  if (soft_label) {
+    SoftmaxCrossEntropy<T, T>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else if (label.dtype() == phi::DataType::INT32) {
+    SoftmaxCrossEntropy<T, int32_t>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else if (label.dtype() == phi::DataType::INT64) {
+    SoftmaxCrossEntropy<T, int64_t>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else if (label.dtype() == phi::DataType::INT16) {
+    SoftmaxCrossEntropy<T, int16_t>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else if (label.dtype() == phi::DataType::INT8) {
+    SoftmaxCrossEntropy<T, int8_t>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else if (label.dtype() == phi::DataType::UINT8) {
+    SoftmaxCrossEntropy<T, uint8_t>(
+        dev_ctx, logits, label, soft_label, ignore_index, axis, softmax, loss);
+  } else {
+    PD_CHECK(false, "The dtype of label must be int.");
+  }
 }
 
 template <typename T, typename LabelT>
@@ -191,139 +272,92 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
                                           int ignore_index,
                                           int axis,
                                           phi::DenseTensor* logits_grad) {
-  const phi::DenseTensor* out_grad = &loss_grad;
-  phi::DenseTensor* logit_grad = logits_grad;
   logits_grad->Resize(softmax.dims());
-  dev_ctx.template Alloc<T>(logits_grad);
-  auto logits_grad_data = logits_grad->data<T>();
-  auto softmax_data = softmax.data<T>();
+  phi::DenseTensor softmax_src;
+  auto logit_grad_data =
+      AllocInplace<T>(dev_ctx, softmax, logits_grad, &softmax_src);
+  auto softmax_data = softmax_src.data<T>();
 
-  if (logit_grad != &softmax || !use_softmax) {
-    memcpy(logits_grad_data, softmax_data, softmax.numel() * sizeof(T));
-  }
-
-  const int rank = logit_grad->dims().size();
+  auto dims = softmax.dims();
+  const int rank = dims.size();
   const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
-  int axis_dim = logit_grad->dims()[axis_v];
+  const int64_t axis_dim = dims[axis_v];
   PD_CHECK(axis_dim > 0,
            "The axis dimention should be larger than 0, but received "
-           "axis dimention is %d.",
+           "axis dimention is %ld.",
            axis_dim);
 
-  const int n = phi::funcs::SizeToAxis(axis_v, logit_grad->dims());
+  const int64_t n = phi::funcs::SizeToAxis(axis_v, dims);
   PD_CHECK(n > 0,
            "The size of axis should be larger than 0, but received "
-           "SizeToAxis of logit_grad is %d.",
+           "SizeToAxis of logit_grad is %ld.",
            n);
 
-  const int d = phi::funcs::SizeFromAxis(axis_v, logit_grad->dims());
-  int remain = d / axis_dim;
+  const int64_t d = phi::funcs::SizeFromAxis(axis_v, dims);
+  const int64_t remain = d / axis_dim;
 
-  auto out_grad_data = out_grad->data<T>();
+  auto out_grad_data = loss_grad.data<T>();
   auto label_data = label.data<LabelT>();
-  auto logit_grad_data = logit_grad->data<T>();
-  if (!use_softmax) {
-    // use_softmax step1
+  if (use_softmax) {
+    // dx = dy * (softmax - label), written straight from softmax in one sweep.
     if (soft_label) {
-      for (auto i = 0; i < n; ++i) {
-        for (auto j = 0; j < axis_dim; ++j) {
-          for (auto k = 0; k < remain; ++k) {
-            auto index = i * d + j * remain + k;
-            auto l_index = i * remain + k;
-            logit_grad_data[index] = -label_data[index] /
-                                     logit_grad_data[index] *
-                                     out_grad_data[l_index];
-          }
-        }
-      }
+      // when soft_label = True, ignore_index is not supported
+      SoftmaxCrossEntropySoftLabelGrad(softmax_data,
+                                       label.data<T>(),
+                                       out_grad_data,
+                                       n,
+                                       axis_dim,
+                                       remain,
+                                       logit_grad_data);
     } else {
-      // use_softmax step2
-      const int remain = d / axis_dim;
-      for (int i = 0; i < n; ++i) {         // for each sample_1_dim
-        for (int j = 0; j < remain; j++) {  // for each sample_other_dims
-          int idx = i * remain + j;  // this sample's label_idx. for 1d case,
-                                     // remain=1 and j=0, so, idx = i
-          auto lbl = static_cast<int64_t>(label_data[idx]);
-          if (lbl == ignore_index) {
-            for (int k = 0; k < axis_dim; ++k) {  // for each class id's label
-              logit_grad_data[i * d + k * remain + j] = 0;
-            }
-          } else {
-            // only for this sample's label_idx, the label is 1, others is 0,
-            // so, only compute this label_idx's class
-            logit_grad_data[i * d + lbl * remain + j] =
-                (-1 / logit_grad_data[i * d + lbl * remain + j]) *
-                out_grad_data[idx];
-            for (int k = 0; k < axis_dim; ++k) {  // for each class id's label
-              if (k !=
-                  label_data[idx]) {  // label_data[idx]: this sample's label
-                logit_grad_data[i * d + k * remain + j] = 0;
-              }
-            }
-          }
-        }
-      }
+      SoftmaxCrossEntropyHardLabelGrad(softmax_data,
+                                       label_data,
+                                       out_grad_data,
+                                       n,
+                                       axis_dim,
+                                       remain,
+                                       static_cast<int64_t>(ignore_index),
+                                       logit_grad_data);
     }
     return;
   }
-  // for use_softmax=False, continue
 
+  // input is the probability itself: dx = -dy * label / prob
+  if (logit_grad_data != softmax_data) {
+    memcpy(logit_grad_data, softmax_data, softmax.numel() * sizeof(T));
+  }
   if (soft_label) {
-    // when soft_label = True, ignore_index is not supported
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
+    for (int64_t i = 0; i < n; ++i) {
+      for (int64_t j = 0; j < axis_dim; ++j) {
+        for (int64_t k = 0; k < remain; ++k) {
           auto index = i * d + j * remain + k;
           auto l_index = i * remain + k;
-          logit_grad_data[index] = out_grad_data[l_index] *
-                                   (logit_grad_data[index] - label_data[index]);
+          logit_grad_data[index] = -label_data[index] / logit_grad_data[index] *
+                                   out_grad_data[l_index];
         }
       }
     }
-
-    // for each sample, i is sample id
-    // 1) compute dy/dx by p_j - y_j or P-Y, where j is class id,
-    // P=logit_grad_mat[i] is all class's probs, Y=lbl_mat[i] is
-    // all class's label
-    // 2) compute dy * dy/dx by   Chain rule, dy=out_grad_mat[i]
-    // for high dims, e.g. (n,c) or (n,d1,...,dm, c), compute grad by matrix
-    // operation
-
   } else {
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
-          auto index = i * d + j * remain + k;
-          auto l_index = i * remain + k;
-
-          logit_grad_data[index] =
-              out_grad_data[l_index] * logit_grad_data[index];
-        }
-      }
-    }
-    for (int i = 0; i < n; ++i) {         // for each sample_1_dim
-      for (int j = 0; j < remain; j++) {  // for each sample_other_dims
-        int idx = i * remain + j;  // this sample's label_idx. for 1d case,
-                                   // remain=1 and j=0, so, idx = i
+    for (int64_t i = 0; i < n; ++i) {         // for each sample_1_dim
+      for (int64_t j = 0; j < remain; j++) {  // for each sample_other_dims
+        auto idx = i * remain + j;  // this sample's label_idx. for 1d case,
+                                    // remain=1 and j=0, so, idx = i
         auto lbl = static_cast<int64_t>(label_data[idx]);
         if (lbl == ignore_index) {
-          for (int k = 0; k < axis_dim; ++k) {  // for each class id's label
+          for (int64_t k = 0; k < axis_dim; ++k) {  // for each class id's label
             logit_grad_data[i * d + k * remain + j] = 0;
           }
         } else {
           // only for this sample's label_idx, the label is 1, others is 0,
           // so, only compute this label_idx's class
-          // for 1d case, remain=1 and j=0, so, [i * d + label_data[idx] *
-          // remain + j] = [i * d + label_data[idx]]
-          // let idx_x = i * d + label_data[idx] * remain + j,
-          //   logit_grad_data[idx_x] = logit_grad_data[idx_x] -
-          //   out_grad_data[idx]
-          // note: logit_grad_mat = logit_grad_mat * out_grad_mat
-          // so: logit_grad_data[idx_x] =  (logit_grad_data[idx_x] - 1) *
-          // out_grad_data[idx]
-          // means:           dy/dp * dy=   ( p - y ) * dy
-
-          logit_grad_data[i * d + lbl * remain + j] -= out_grad_data[idx];
+          logit_grad_data[i * d + lbl * remain + j] =
+              (-1 / logit_grad_data[i * d + lbl * remain + j]) *
+              out_grad_data[idx];
+          for (int64_t k = 0; k < axis_dim; ++k) {  // for each class id's label
+            if (k != lbl) {
+              logit_grad_data[i * d + k * remain + j] = 0;
+            }
+          }
         }
       }
     }
@@ -12,31 +12,57 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/elementwise_base.h"
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
 namespace custom_kernel {
 
+template <typename T>
+struct MulFunctor {
+  inline T operator()(const T a, const T b) const { return a * b; }
+};
+
+template <typename T>
+struct AddFunctor {
+  inline T operator()(const T a, const T b) const { return a + b; }
+};
+
+template <typename T>
+struct MaxFunctor {
+  inline T operator()(const T a, const T b) const { return a < b ? b : a; }
+};
+
+template <typename T, typename Functor>
+void ElementwiseCompute(const phi::Context& dev_ctx,
+                        const phi::DenseTensor& x,
+                        const phi::DenseTensor& y,
+                        int axis,
+                        const Functor& func,
+                        phi::DenseTensor* out) {
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
+  auto rank = static_cast<int64_t>(dst_dims.size());
+  phi::DenseTensor x_src;
+  auto out_data = AllocInplace<T>(dev_ctx, x, out, &x_src);
+  BinaryElementwise(AlignBroadcastDims(x_dims, rank, axis),
+                    AlignBroadcastDims(y_dims, rank, axis),
+                    dst_dims,
+                    x_src.data<T>(),
+                    y.data<T>(),
+                    out_data,
+                    func);
+}
+
 template <typename T>
 void MultiplyRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] * y_data[i];
-  }
+  ElementwiseCompute<T>(dev_ctx, x, y, axis, MulFunctor<T>(), out);
 }
 
 template <typename T>
@@ -54,21 +80,7 @@ void AddRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] + y_data[i];
-  }
+  ElementwiseCompute<T>(dev_ctx, x, y, axis, AddFunctor<T>(), out);
 }
 
 template <typename T>
@@ -86,21 +98,7 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = std::max(x_data[i], y_data[i]);
-  }
+  ElementwiseCompute<T>(dev_ctx, x, y, axis, MaxFunctor<T>(), out);
 }
 
 template <typename T>
@@ -12,6 +12,7 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -20,7 +21,7 @@ template <typename T, typename VType>
 void FullValue(const phi::Context& dev_ctx,
                phi::DenseTensor* tensor,
                VType val) {
-  auto t = dev_ctx.template Alloc<T>(tensor);
+  auto t = AllocOverwrite<T>(dev_ctx, tensor);
   for (auto i = 0; i < tensor->numel(); ++i) {
     t[i] = val;
   }
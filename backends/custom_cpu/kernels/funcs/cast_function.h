@@ -0,0 +1,171 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstdint>
+#include <cstring>
+
+#include "kernels/funcs/simd.h"
+
+namespace custom_kernel {
+
+// Bulk conversions between float and the bit patterns of IEEE half and
+// bfloat16. The vector loops work on kVectorBytes of float at a time with
+// the same integer formulas as the scalar tails, so both give identical
+// bits.
+//
+// float -> half rounds to nearest even, overflows to inf and keeps NaN a
+// (quiet) NaN, which matches the F16C instructions and numpy. Half -> float
+// is exact. float -> bfloat16 truncates the low 16 bits like the CPU
+// constructor of phi::dtype::bfloat16.
+
+namespace detail {
+
+// The magic numbers follow the branch-free conversions of F. Giesen.
+constexpr int32_t kHalfSubnormalLimit = 113 << 23;  // 2^-14
+constexpr int32_t kHalfOverflow = 143 << 23;        // 2^16
+constexpr int32_t kHalfDenormMagic = ((127 - 15) + (23 - 10) + 1) << 23;
+constexpr int32_t kFloatInfBits = 0x7f800000;
+constexpr int32_t kHalfExpMask = 0x7c00 << 13;
+
+inline int32_t FloatBits(float f) {
+  int32_t bits;
+  std::memcpy(&bits, &f, sizeof(bits));
+  return bits;
+}
+
+inline float BitsFloat(int32_t bits) {
+  float f;
+  std::memcpy(&f, &bits, sizeof(f));
+  return f;
+}
+
+}  // namespace detail
+
+inline uint16_t FloatToHalfBits(float value) {
+  using namespace detail;  // NOLINT
+  int32_t f = FloatBits(value);
+  int32_t sign = (f >> 16) & 0x8000;
+  f &= 0x7fffffff;
+  int32_t o;
+  if (f >= kHalfOverflow) {
+    o = f > kFloatInfBits ? 0x7e00 : 0x7c00;
+  } else if (f < kHalfSubnormalLimit) {
+    o = FloatBits(BitsFloat(f) + BitsFloat(kHalfDenormMagic)) -
+        kHalfDenormMagic;
+  } else {
+    o = (f - (112 << 23) + 0xfff + ((f >> 13) & 1)) >> 13;
+  }
+  return static_cast<uint16_t>(o | sign);
+}
+
+inline float HalfBitsToFloat(uint16_t h) {
+  using namespace detail;  // NOLINT
+  int32_t o = (h & 0x7fff) << 13;
+  int32_t exp = o & kHalfExpMask;
+  o += 112 << 23;
+  if (exp == kHalfExpMask) {
+    o += 112 << 23;  // inf / NaN
+  } else if (exp == 0) {
+    o = FloatBits(BitsFloat(o + (1 << 23)) - BitsFloat(kHalfSubnormalLimit));
+  }
+  return BitsFloat(o | ((h & 0x8000) << 16));
+}
+
+inline uint16_t FloatToBFloat16Bits(float value) {
+  return static_cast<uint16_t>(
+      static_cast<uint32_t>(detail::FloatBits(value)) >> 16);
+}
+
+inline float BFloat16BitsToFloat(uint16_t h) {
+  return detail::BitsFloat(
+      static_cast<int32_t>(static_cast<uint32_t>(h) << 16));
+}
+
+inline void FloatToHalf(const float* x, uint16_t* y, int64_t n) {
+  using namespace detail;  // NOLINT
+  using Vec = Simd<float>::Vec;
+  using IntVec = Simd<float>::IntVec;
+  typedef uint16_t HalfVec __attribute__((vector_size(kVectorBytes / 2)));
+  constexpr int64_t kWidth = Simd<float>::kWidth;
+  int64_t i = 0;
+  for (; i + kWidth <= n; i += kWidth) {
+    IntVec f;
+    std::memcpy(&f, x + i, sizeof(f));
+    IntVec sign = (f >> 16) & 0x8000;
+    f &= 0x7fffffff;
+    IntVec normal = (f - (112 << 23) + 0xfff + ((f >> 13) & 1)) >> 13;
+    Vec fl;
+    std::memcpy(&fl, &f, sizeof(fl));
+    fl += BitsFloat(kHalfDenormMagic);
+    IntVec subnormal;
+    std::memcpy(&subnormal, &fl, sizeof(subnormal));
+    subnormal -= kHalfDenormMagic;
+    IntVec special = f > kFloatInfBits ? IntVec() + 0x7e00 : IntVec() + 0x7c00;
+    IntVec o = f < kHalfSubnormalLimit ? subnormal : normal;
+    o = f >= kHalfOverflow ? special : o;
+    HalfVec h = __builtin_convertvector(o | sign, HalfVec);
+    std::memcpy(y + i, &h, sizeof(h));
+  }
+  for (; i < n; ++i) {
+    y[i] = FloatToHalfBits(x[i]);
+  }
+}
+
+inline void HalfToFloat(const uint16_t* x, float* y, int64_t n) {
+  using namespace detail;  // NOLINT
+  using Vec = Simd<float>::Vec;
+  using IntVec = Simd<float>::IntVec;
+  typedef uint16_t HalfVec __attribute__((vector_size(kVectorBytes / 2)));
+  constexpr int64_t kWidth = Simd<float>::kWidth;
+  int64_t i = 0;
+  for (; i + kWidth <= n; i += kWidth) {
+    HalfVec hv;
+    std::memcpy(&hv, x + i, sizeof(hv));
+    IntVec h = __builtin_convertvector(hv, IntVec);
+    IntVec o = (h & 0x7fff) << 13;
+    IntVec exp = o & kHalfExpMask;
+    o += 112 << 23;
+    o = exp == kHalfExpMask ? o + (112 << 23) : o;
+    Vec fl;
+    IntVec biased = o + (1 << 23);
+    std::memcpy(&fl, &biased, sizeof(fl));
+    fl -= BitsFloat(kHalfSubnormalLimit);
+    IntVec subnormal;
+    std::memcpy(&subnormal, &fl, sizeof(subnormal));
+    o = exp == 0 ? subnormal : o;
+    o |= (h & 0x8000) << 16;
+    std::memcpy(y + i, &o, sizeof(o));
+  }
+  for (; i < n; ++i) {
+    y[i] = HalfBitsToFloat(x[i]);
+  }
+}
+
+inline void FloatToBFloat16(const float* x, uint16_t* y, int64_t n) {
+  const uint32_t* bits = reinterpret_cast<const uint32_t*>(x);
+  for (int64_t i = 0; i < n; ++i) {
+    y[i] = static_cast<uint16_t>(bits[i] >> 16);
+  }
+}
+
+inline void BFloat16ToFloat(const uint16_t* x, float* y, int64_t n) {
+  uint32_t* bits = reinterpret_cast<uint32_t*>(y);
+  for (int64_t i = 0; i < n; ++i) {
+    bits[i] = static_cast<uint32_t>(x[i]) << 16;
+  }
+}
+
+}  // namespace custom_kernel
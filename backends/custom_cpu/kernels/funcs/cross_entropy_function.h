@@ -0,0 +1,216 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/softmax_function.h"
+
+namespace custom_kernel {
+
+// Softmax of a contiguous [outer, axis_dim, inner] tensor along axis_dim that
+// also hands the log-sum-exp of every softmax to
+// loss_fn(i, col_begin, cols, lse), where lse[c] belongs to position
+// (i, col_begin + c) of the [outer, inner] loss. The loss is computed from
+// the logits as lse - logit, so log(softmax) is never taken.
+template <typename T, typename LossFn>
+void SoftmaxWithLogSumExp(const T* logits,
+                          T* softmax,
+                          int64_t outer,
+                          int64_t axis_dim,
+                          int64_t inner,
+                          const LossFn& loss_fn) {
+  if (outer * axis_dim * inner == 0) {
+    return;
+  }
+  if (inner == 1) {
+    ParallelFor(0,
+                outer,
+                std::max<int64_t>(1, kSoftmaxGrainSize / axis_dim),
+                [&](int64_t begin, int64_t end) {
+                  for (auto i = begin; i < end; ++i) {
+                    T lse = SoftmaxRow(logits + i * axis_dim,
+                                       softmax + i * axis_dim,
+                                       axis_dim);
+                    loss_fn(i, 0, 1, &lse);
+                  }
+                });
+    return;
+  }
+  auto chunks = (inner + kSoftmaxColumns - 1) / kSoftmaxColumns;
+  auto work_per_task = axis_dim * std::min(inner, kSoftmaxColumns);
+  ParallelFor(0,
+              outer * chunks,
+              std::max<int64_t>(1, kSoftmaxGrainSize / work_per_task),
+              [&](int64_t begin, int64_t end) {
+                T lse[kSoftmaxColumns];
+                for (auto task = begin; task < end; ++task) {
+                  auto i = task / chunks;
+                  auto col_begin = task % chunks * kSoftmaxColumns;
+                  auto cols = std::min(kSoftmaxColumns, inner - col_begin);
+                  SoftmaxColumns(logits + i * axis_dim * inner,
+                                 softmax + i * axis_dim * inner,
+                                 axis_dim,
+                                 inner,
+                                 col_begin,
+                                 cols,
+                                 lse);
+                  loss_fn(i, col_begin, cols, lse);
+                }
+              });
+}
+
+// Fused softmax + negative log likelihood with hard labels of shape
+// [outer, inner]: loss = lse - logits[label]. Positions whose label equals
+// ignore_index get a zero loss. Labels must be valid class ids otherwise.
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropyHardLabel(const T* logits,
+                                  const LabelT* label,
+                                  int64_t outer,
+                                  int64_t axis_dim,
+                                  int64_t inner,
+                                  int64_t ignore_index,
+                                  T* softmax,
+                                  T* loss) {
+  SoftmaxWithLogSumExp(
+      logits,
+      softmax,
+      outer,
+      axis_dim,
+      inner,
+      [&](int64_t i, int64_t col_begin, int64_t cols, const T* lse) {
+        for (int64_t c = 0; c < cols; ++c) {
+          auto idx = i * inner + col_begin + c;
+          auto lbl = static_cast<int64_t>(label[idx]);
+          loss[idx] =
+              lbl == ignore_index
+                  ? static_cast<T>(0)
+                  : lse[c] -
+                        logits[(i * axis_dim + lbl) * inner + col_begin + c];
+        }
+      });
+}
+
+// Fused softmax + cross entropy with soft labels of the logits' shape:
+// loss = sum_j label_j * (lse - logits_j).
+template <typename T>
+void SoftmaxCrossEntropySoftLabel(const T* logits,
+                                  const T* label,
+                                  int64_t outer,
+                                  int64_t axis_dim,
+                                  int64_t inner,
+                                  T* softmax,
+                                  T* loss) {
+  SoftmaxWithLogSumExp(
+      logits,
+      softmax,
+      outer,
+      axis_dim,
+      inner,
+      [&](int64_t i, int64_t col_begin, int64_t cols, const T* lse) {
+        T* dst = loss + i * inner + col_begin;
+        std::fill(dst, dst + cols, static_cast<T>(0));
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          auto offset = (i * axis_dim + j) * inner + col_begin;
+          const T* x = logits + offset;
+          const T* y = label + offset;
+          for (int64_t c = 0; c < cols; ++c) {
+            dst[c] += y[c] * (lse[c] - x[c]);
+          }
+        }
+      });
+}
+
+// logits_grad = loss_grad * (softmax - onehot(label)), one [axis_dim, inner]
+// slab per row: the slab is scaled by loss_grad in a single sweep and the
+// label entries are then corrected. Positions whose label equals
+// ignore_index get a zero gradient. softmax and logits_grad may be the same
+// buffer.
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropyHardLabelGrad(const T* softmax,
+                                      const LabelT* label,
+                                      const T* loss_grad,
+                                      int64_t outer,
+                                      int64_t axis_dim,
+                                      int64_t inner,
+                                      int64_t ignore_index,
+                                      T* logits_grad) {
+  ParallelFor(0,
+              outer,
+              std::max<int64_t>(1, kSoftmaxGrainSize / (axis_dim * inner)),
+              [&](int64_t begin, int64_t end) {
+                for (auto i = begin; i < end; ++i) {
+                  auto offset = i * axis_dim * inner;
+                  const T* p = softmax + offset;
+                  const T* dy = loss_grad + i * inner;
+                  T* dx = logits_grad + offset;
+                  if (inner == 1) {
+                    const T scale = dy[0];
+                    for (int64_t j = 0; j < axis_dim; ++j) {
+                      dx[j] = scale * p[j];
+                    }
+                  } else {
+                    for (int64_t j = 0; j < axis_dim; ++j) {
+                      for (int64_t c = 0; c < inner; ++c) {
+                        dx[j * inner + c] = dy[c] * p[j * inner + c];
+                      }
+                    }
+                  }
+                  for (int64_t c = 0; c < inner; ++c) {
+                    auto lbl = static_cast<int64_t>(label[i * inner + c]);
+                    if (lbl == ignore_index) {
+                      for (int64_t j = 0; j < axis_dim; ++j) {
+                        dx[j * inner + c] = static_cast<T>(0);
+                      }
+                    } else {
+                      dx[lbl * inner + c] -= dy[c];
+                    }
+                  }
+                }
+              });
+}
+
+// logits_grad = loss_grad * (softmax - label) for soft labels.
+template <typename T>
+void SoftmaxCrossEntropySoftLabelGrad(const T* softmax,
+                                      const T* label,
+                                      const T* loss_grad,
+                                      int64_t outer,
+                                      int64_t axis_dim,
+                                      int64_t inner,
+                                      T* logits_grad) {
+  ParallelFor(0,
+              outer,
+              std::max<int64_t>(1, kSoftmaxGrainSize / (axis_dim * inner)),
+              [&](int64_t begin, int64_t end) {
+                for (auto i = begin; i < end; ++i) {
+                  auto offset = i * axis_dim * inner;
+                  const T* p = softmax + offset;
+                  const T* y = label + offset;
+                  const T* dy = loss_grad + i * inner;
+                  T* dx = logits_grad + offset;
+                  for (int64_t j = 0; j < axis_dim; ++j) {
+                    for (int64_t c = 0; c < inner; ++c) {
+                      auto idx = j * inner + c;
+                      dx[idx] = dy[c] * (p[idx] - y[idx]);
+                    }
+                  }
+                }
+              });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,197 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+
+namespace custom_kernel {
+
+// Pads in_dims with ones so that it has out_rank dimensions, in_dims is
+// placed at axis (axis == -1 aligns the trailing dimensions). axis only
+// applies to the lower rank operand, a full rank one is returned as is.
+inline std::vector<int64_t> AlignBroadcastDims(
+    const std::vector<int64_t>& in_dims, int64_t out_rank, int axis) {
+  auto in_rank = static_cast<int64_t>(in_dims.size());
+  if (in_rank >= out_rank) {
+    return in_dims;
+  }
+  int64_t begin = axis == -1 ? out_rank - in_rank : axis;
+  std::vector<int64_t> dims(out_rank, 1);
+  for (int64_t i = 0; i < in_rank && begin + i < out_rank; ++i) {
+    dims[begin + i] = in_dims[i];
+  }
+  return dims;
+}
+
+// Strides (in elements) used to read a contiguous tensor of shape in_dims as
+// if it had shape out_dims. Broadcast axes get a zero stride, so the input
+// is never materialized at the output shape.
+inline std::vector<int64_t> BroadcastStrides(
+    const std::vector<int64_t>& in_dims, const std::vector<int64_t>& out_dims) {
+  std::vector<int64_t> strides(out_dims.size(), 0);
+  int64_t stride = 1;
+  for (auto i = static_cast<int64_t>(out_dims.size()) - 1; i >= 0; --i) {
+    strides[i] = (in_dims[i] == 1 && out_dims[i] != 1) ? 0 : stride;
+    stride *= in_dims[i];
+  }
+  return strides;
+}
+
+// Drops size-1 dimensions and merges adjacent dimensions that every operand
+// either walks contiguously or broadcasts as a whole, e.g. adding a [N] bias
+// to a [B, H, W, N] activation becomes a [B * H * W, N] problem.
+inline void CoalesceDims(std::vector<int64_t>* dims,
+                         const std::vector<std::vector<int64_t>*>& strides) {
+  std::vector<int64_t> new_dims;
+  std::vector<std::vector<int64_t>> new_strides(strides.size());
+  for (size_t i = 0; i < dims->size(); ++i) {
+    auto dim = (*dims)[i];
+    if (dim == 1) {
+      continue;
+    }
+    bool mergeable = !new_dims.empty();
+    for (size_t k = 0; mergeable && k < strides.size(); ++k) {
+      mergeable = new_strides[k].back() == (*strides[k])[i] * dim;
+    }
+    if (mergeable) {
+      new_dims.back() *= dim;
+      for (size_t k = 0; k < strides.size(); ++k) {
+        new_strides[k].back() = (*strides[k])[i];
+      }
+    } else {
+      new_dims.push_back(dim);
+      for (size_t k = 0; k < strides.size(); ++k) {
+        new_strides[k].push_back((*strides[k])[i]);
+      }
+    }
+  }
+  if (new_dims.empty()) {
+    new_dims.push_back(1);
+    for (auto& s : new_strides) {
+      s.push_back(0);
+    }
+  }
+  *dims = new_dims;
+  for (size_t k = 0; k < strides.size(); ++k) {
+    *strides[k] = new_strides[k];
+  }
+}
+
+// Innermost loop of a binary op. The contiguous and scalar-broadcast cases
+// are written as plain unit-stride loops so that they get vectorized.
+template <typename T, typename OutT, typename Functor>
+inline void BinaryInnerLoop(int64_t n,
+                            const T* x,
+                            int64_t x_stride,
+                            const T* y,
+                            int64_t y_stride,
+                            OutT* out,
+                            const Functor& func) {
+  if (x_stride == 1 && y_stride == 1) {
+    for (int64_t i = 0; i < n; ++i) {
+      out[i] = func(x[i], y[i]);
+    }
+  } else if (x_stride == 1 && y_stride == 0) {
+    const T y_value = *y;
+    for (int64_t i = 0; i < n; ++i) {
+      out[i] = func(x[i], y_value);
+    }
+  } else if (x_stride == 0 && y_stride == 1) {
+    const T x_value = *x;
+    for (int64_t i = 0; i < n; ++i) {
+      out[i] = func(x_value, y[i]);
+    }
+  } else {
+    for (int64_t i = 0; i < n; ++i) {
+      out[i] = func(x[i * x_stride], y[i * y_stride]);
+    }
+  }
+}
+
+// out = func(x, y) with broadcasting. x_dims and y_dims must be aligned to
+// the rank of out_dims (see AlignBroadcastDims). The output is contiguous,
+// the problem is coalesced first and then split by rows of the innermost
+// dimension across threads.
+template <typename T, typename OutT, typename Functor>
+void BinaryElementwise(const std::vector<int64_t>& x_dims,
+                       const std::vector<int64_t>& y_dims,
+                       const std::vector<int64_t>& out_dims,
+                       const T* x,
+                       const T* y,
+                       OutT* out,
+                       const Functor& func) {
+  int64_t numel = 1;
+  for (auto dim : out_dims) {
+    numel *= dim;
+  }
+  if (numel == 0) {
+    return;
+  }
+
+  auto dims = out_dims;
+  auto x_strides = BroadcastStrides(x_dims, out_dims);
+  auto y_strides = BroadcastStrides(y_dims, out_dims);
+  auto out_strides = BroadcastStrides(out_dims, out_dims);
+  CoalesceDims(&dims, {&x_strides, &y_strides, &out_strides});
+
+  auto rank = static_cast<int64_t>(dims.size());
+  auto inner = dims.back();
+  auto x_inner = x_strides.back();
+  auto y_inner = y_strides.back();
+  auto rows = numel / inner;
+
+  constexpr int64_t kGrainSize = 32768;
+  ParallelFor(0,
+              rows,
+              std::max<int64_t>(1, kGrainSize / inner),
+              [&](int64_t row_begin, int64_t row_end) {
+                // Offsets of the first row, later rows are reached with an
+                // odometer over the outer dimensions.
+                std::vector<int64_t> index(rank, 0);
+                int64_t x_offset = 0, y_offset = 0;
+                auto rem = row_begin;
+                for (auto d = rank - 2; d >= 0; --d) {
+                  index[d] = rem % dims[d];
+                  rem /= dims[d];
+                  x_offset += index[d] * x_strides[d];
+                  y_offset += index[d] * y_strides[d];
+                }
+                for (auto row = row_begin; row < row_end; ++row) {
+                  BinaryInnerLoop(inner,
+                                  x + x_offset,
+                                  x_inner,
+                                  y + y_offset,
+                                  y_inner,
+                                  out + row * inner,
+                                  func);
+                  for (auto d = rank - 2; d >= 0; --d) {
+                    x_offset += x_strides[d];
+                    y_offset += y_strides[d];
+                    if (++index[d] < dims[d]) {
+                      break;
+                    }
+                    x_offset -= x_strides[d] * dims[d];
+                    y_offset -= y_strides[d] * dims[d];
+                    index[d] = 0;
+                  }
+                }
+              });
+}
+
+}  // namespace custom_kernel
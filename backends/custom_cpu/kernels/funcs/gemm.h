@@ -0,0 +1,520 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/simd.h"
+
+namespace custom_kernel {
+namespace gemm {
+
+// Blocking parameters of the packed GEMM. The MR x NR micro tile is kept in
+// registers (MR x 2 vectors, which leaves room for the B row and the A
+// broadcast within 16 vector registers), a packed MR x KC sliver of A lives in
+// L1 and a packed KC x NC panel of B lives in L2.
+template <typename AccT>
+struct Blocking {
+  static constexpr int64_t MR = Simd<AccT>::kEnabled ? 6 : 4;
+  static constexpr int64_t NR =
+      Simd<AccT>::kEnabled ? 2 * Simd<AccT>::kWidth : 4;
+  static constexpr int64_t MC = 16 * MR;
+  static constexpr int64_t KC = 256;
+  static constexpr int64_t NC = 32 * NR;
+};
+
+// A strided view of a matrix, element (i, j) is data[i * rs + j * cs].
+template <typename T>
+struct MatrixRef {
+  const T* data;
+  int64_t rs;
+  int64_t cs;
+};
+
+// Packs an mc x kc block of A into slivers of MR rows, each sliver stores
+// MR consecutive values per k. Rows beyond mc are zero padded.
+template <typename T, typename AccT, int64_t MR>
+inline void PackA(const MatrixRef<T>& a, int64_t mc, int64_t kc, AccT* packed) {
+  for (int64_t i = 0; i < mc; i += MR) {
+    auto mr = std::min(MR, mc - i);
+    for (int64_t p = 0; p < kc; ++p) {
+      const T* src = a.data + i * a.rs + p * a.cs;
+      for (int64_t ii = 0; ii < mr; ++ii) {
+        packed[ii] = static_cast<AccT>(src[ii * a.rs]);
+      }
+      for (int64_t ii = mr; ii < MR; ++ii) {
+        packed[ii] = static_cast<AccT>(0);
+      }
+      packed += MR;
+    }
+  }
+}
+
+// Packs a kc x nc block of B into slivers of NR columns, each sliver stores
+// NR consecutive values per k. Columns beyond nc are zero padded.
+template <typename T, typename AccT, int64_t NR>
+inline void PackB(const MatrixRef<T>& b, int64_t kc, int64_t nc, AccT* packed) {
+  for (int64_t j = 0; j < nc; j += NR) {
+    auto nr = std::min(NR, nc - j);
+    for (int64_t p = 0; p < kc; ++p) {
+      const T* src = b.data + p * b.rs + j * b.cs;
+      if (b.cs == 1 && nr == NR) {
+        for (int64_t jj = 0; jj < NR; ++jj) {
+          packed[jj] = static_cast<AccT>(src[jj]);
+        }
+      } else {
+        for (int64_t jj = 0; jj < nr; ++jj) {
+          packed[jj] = static_cast<AccT>(src[jj * b.cs]);
+        }
+        for (int64_t jj = nr; jj < NR; ++jj) {
+          packed[jj] = static_cast<AccT>(0);
+        }
+      }
+      packed += NR;
+    }
+  }
+}
+
+// Computes the MR x NR product of two packed slivers into tile.
+template <typename AccT, int64_t MR, int64_t NR, bool kSimd>
+struct MicroKernel {
+  static void Run(int64_t kc, const AccT* a, const AccT* b, AccT* tile) {
+    AccT acc[MR][NR];
+    for (int64_t i = 0; i < MR; ++i) {
+      for (int64_t j = 0; j < NR; ++j) {
+        acc[i][j] = static_cast<AccT>(0);
+      }
+    }
+    for (int64_t p = 0; p < kc; ++p) {
+      for (int64_t i = 0; i < MR; ++i) {
+        auto a_i = a[i];
+        for (int64_t j = 0; j < NR; ++j) {
+          acc[i][j] += a_i * b[j];
+        }
+      }
+      a += MR;
+      b += NR;
+    }
+    for (int64_t i = 0; i < MR; ++i) {
+      for (int64_t j = 0; j < NR; ++j) {
+        tile[i * NR + j] = acc[i][j];
+      }
+    }
+  }
+};
+
+template <typename AccT, int64_t MR, int64_t NR>
+struct MicroKernel<AccT, MR, NR, true> {
+  using Vec = typename Simd<AccT>::Vec;
+  static constexpr int64_t kWidth = Simd<AccT>::kWidth;
+  static constexpr int64_t kCols = NR / kWidth;
+
+  static void Run(int64_t kc, const AccT* a, const AccT* b, AccT* tile) {
+    Vec acc[MR][kCols];
+    for (int64_t i = 0; i < MR; ++i) {
+      for (int64_t j = 0; j < kCols; ++j) {
+        acc[i][j] = Vec{};
+      }
+    }
+    for (int64_t p = 0; p < kc; ++p) {
+      Vec b_row[kCols];
+      for (int64_t j = 0; j < kCols; ++j) {
+        memcpy(&b_row[j], b + j * kWidth, sizeof(Vec));
+      }
+      for (int64_t i = 0; i < MR; ++i) {
+        Vec a_i = Vec() + a[i];
+        for (int64_t j = 0; j < kCols; ++j) {
+          acc[i][j] += a_i * b_row[j];
+        }
+      }
+      a += MR;
+      b += NR;
+    }
+    for (int64_t i = 0; i < MR; ++i) {
+      for (int64_t j = 0; j < kCols; ++j) {
+        memcpy(tile + i * NR + j * kWidth, &acc[i][j], sizeof(Vec));
+      }
+    }
+  }
+};
+
+// Writes the top-left mr x nr corner of tile, whose rows are ld apart, to C
+// as alpha * tile + beta * C.
+template <typename T, typename AccT>
+inline void StoreTile(const AccT* tile,
+                      int64_t ld,
+                      T* c,
+                      int64_t rs_c,
+                      int64_t cs_c,
+                      int64_t mr,
+                      int64_t nr,
+                      AccT alpha,
+                      AccT beta) {
+  for (int64_t i = 0; i < mr; ++i) {
+    for (int64_t j = 0; j < nr; ++j) {
+      T* dst = c + i * rs_c + j * cs_c;
+      auto value = alpha * tile[i * ld + j];
+      if (beta != static_cast<AccT>(0)) {
+        value += beta * static_cast<AccT>(*dst);
+      }
+      *dst = static_cast<T>(value);
+    }
+  }
+}
+
+// Adds the top-left mr x nr corner of tile to acc, whose rows are ld apart,
+// or copies it there for the first block of K.
+template <typename AccT, int64_t NR>
+inline void AccumulateTile(const AccT* tile,
+                           AccT* acc,
+                           int64_t ld,
+                           int64_t mr,
+                           int64_t nr,
+                           bool first) {
+  for (int64_t i = 0; i < mr; ++i) {
+    for (int64_t j = 0; j < nr; ++j) {
+      acc[i * ld + j] =
+          first ? tile[i * NR + j] : acc[i * ld + j] + tile[i * NR + j];
+    }
+  }
+}
+
+// Matrix-vector products (M == 1 or N == 1) are memory bound, packing does
+// not pay off for them. Row-major A is reduced with dot products, any other
+// layout is accumulated column by column so that A is still read in order.
+template <typename T, typename AccT, typename OutT>
+void Gemv(int64_t M,
+          int64_t K,
+          const MatrixRef<T>& a,
+          const T* x,
+          int64_t inc_x,
+          AccT alpha,
+          AccT beta,
+          OutT* y,
+          int64_t inc_y) {
+  auto store = [&](int64_t i, AccT sum) {
+    OutT* dst = y + i * inc_y;
+    auto value = alpha * sum;
+    if (beta != static_cast<AccT>(0)) {
+      value += beta * static_cast<AccT>(*dst);
+    }
+    *dst = static_cast<OutT>(value);
+  };
+  auto grain = std::max<int64_t>(16, 32768 / std::max<int64_t>(K, 1));
+
+  if (a.cs == 1 || a.rs != 1) {
+    ParallelFor(0, M, grain, [&](int64_t begin, int64_t end) {
+      for (int64_t i = begin; i < end; ++i) {
+        const T* row = a.data + i * a.rs;
+        AccT sum = static_cast<AccT>(0);
+        for (int64_t p = 0; p < K; ++p) {
+          sum += static_cast<AccT>(row[p * a.cs]) *
+                 static_cast<AccT>(x[p * inc_x]);
+        }
+        store(i, sum);
+      }
+    });
+    return;
+  }
+
+  ParallelFor(0, M, grain, [&](int64_t begin, int64_t end) {
+    ScratchScope scratch;
+    AccT* sum = scratch.Get<AccT>(end - begin);
+    std::fill(sum, sum + (end - begin), static_cast<AccT>(0));
+    for (int64_t p = 0; p < K; ++p) {
+      const T* col = a.data + p * a.cs + begin;
+      auto x_p = static_cast<AccT>(x[p * inc_x]);
+      for (int64_t i = 0; i < end - begin; ++i) {
+        sum[i] += static_cast<AccT>(col[i]) * x_p;
+      }
+    }
+    for (int64_t i = begin; i < end; ++i) {
+      store(i, sum[i - begin]);
+    }
+  });
+}
+
+// Scales the M x N matrix C by beta, used when K == 0.
+template <typename T, typename AccT>
+void ScaleC(int64_t M, int64_t N, AccT beta, T* c, int64_t rs_c, int64_t cs_c) {
+  for (int64_t i = 0; i < M; ++i) {
+    for (int64_t j = 0; j < N; ++j) {
+      T* dst = c + i * rs_c + j * cs_c;
+      *dst = beta == static_cast<AccT>(0)
+                 ? static_cast<T>(0)
+                 : static_cast<T>(beta * static_cast<AccT>(*dst));
+    }
+  }
+}
+
+// C = alpha * A * B + beta * C, where A is M x K, B is K x N and C is M x N.
+// All matrices are given as strided views, which covers every combination of
+// transposed inputs and outputs. beta == 0 never reads C. Multiplication is
+// done in AccT, which allows float16 inputs to be accumulated in float. C
+// is of type OutT, T unless the caller keeps sums in AccT itself.
+//
+// The output is split into MC x NC tiles which are computed in parallel. Each
+// task packs its own panels of A and B into thread local buffers, so tasks
+// never synchronize with each other. When T is narrower than AccT and K
+// spans several KC blocks, the sums of a tile are kept in AccT across the
+// blocks and rounded to T once, as a single accumulator would be.
+template <typename T, typename AccT = T, typename OutT = T>
+void Gemm(int64_t M,
+          int64_t N,
+          int64_t K,
+          AccT alpha,
+          const MatrixRef<T>& a,
+          const MatrixRef<T>& b,
+          AccT beta,
+          OutT* c,
+          int64_t rs_c,
+          int64_t cs_c) {
+  if (M <= 0 || N <= 0) {
+    return;
+  }
+  if (K <= 0) {
+    ScaleC<OutT, AccT>(M, N, beta, c, rs_c, cs_c);
+    return;
+  }
+  if (N == 1) {
+    Gemv<T, AccT, OutT>(M, K, a, b.data, b.rs, alpha, beta, c, rs_c);
+    return;
+  }
+  if (M == 1) {
+    MatrixRef<T> b_t{b.data, b.cs, b.rs};
+    Gemv<T, AccT, OutT>(N, K, b_t, a.data, a.cs, alpha, beta, c, cs_c);
+    return;
+  }
+
+  using Block = Blocking<AccT>;
+  constexpr int64_t MR = Block::MR;
+  constexpr int64_t NR = Block::NR;
+  constexpr int64_t MC = Block::MC;
+  constexpr int64_t KC = Block::KC;
+  constexpr int64_t NC = Block::NC;
+  constexpr bool kAccumulate = !std::is_same<OutT, AccT>::value;
+
+  // Shrink the tiles when there are fewer tiles than threads, but keep them
+  // a multiple of the micro tile.
+  auto num_threads = static_cast<int64_t>(GetNumThreads());
+  int64_t mc = MC;
+  int64_t nc = NC;
+  auto num_tiles = [&]() { return ((M + mc - 1) / mc) * ((N + nc - 1) / nc); };
+  while (num_tiles() < num_threads && nc > 4 * NR) {
+    nc = std::max<int64_t>(4 * NR, (nc / 2 + NR - 1) / NR * NR);
+    if (num_tiles() >= num_threads || mc <= 4 * MR) {
+      break;
+    }
+    mc = std::max<int64_t>(4 * MR, (mc / 2 + MR - 1) / MR * MR);
+  }
+  auto tiles_m = (M + mc - 1) / mc;
+  auto tiles_n = (N + nc - 1) / nc;
+
+  auto compute_tile = [&](int64_t tile) {
+    ScratchScope scratch;
+    AccT c_tile[MR * NR];
+    auto ic = (tile % tiles_m) * mc;
+    auto jc = (tile / tiles_m) * nc;
+    auto cur_mc = std::min(mc, M - ic);
+    auto cur_nc = std::min(nc, N - jc);
+    auto kc_max = std::min(KC, K);
+    AccT* packed_a = scratch.Get<AccT>(((cur_mc + MR - 1) / MR) * MR * kc_max);
+    AccT* packed_b = scratch.Get<AccT>(((cur_nc + NR - 1) / NR) * NR * kc_max);
+    AccT* c_acc =
+        kAccumulate && K > KC ? scratch.Get<AccT>(cur_mc * cur_nc) : nullptr;
+
+    for (int64_t pc = 0; pc < K; pc += KC) {
+      auto kc = std::min(KC, K - pc);
+      auto cur_beta = pc == 0 ? beta : static_cast<AccT>(1);
+      MatrixRef<T> b_block{b.data + pc * b.rs + jc * b.cs, b.rs, b.cs};
+      PackB<T, AccT, NR>(b_block, kc, cur_nc, packed_b);
+      MatrixRef<T> a_block{a.data + ic * a.rs + pc * a.cs, a.rs, a.cs};
+      PackA<T, AccT, MR>(a_block, cur_mc, kc, packed_a);
+
+      for (int64_t jr = 0; jr < cur_nc; jr += NR) {
+        auto nr = std::min(NR, cur_nc - jr);
+        const AccT* b_sliver = packed_b + jr * kc;
+        for (int64_t ir = 0; ir < cur_mc; ir += MR) {
+          auto mr = std::min(MR, cur_mc - ir);
+          const AccT* a_sliver = packed_a + ir * kc;
+          MicroKernel<AccT, MR, NR, Simd<AccT>::kEnabled>::Run(
+              kc, a_sliver, b_sliver, c_tile);
+          if (c_acc) {
+            AccumulateTile<AccT, NR>(
+                c_tile, c_acc + ir * cur_nc + jr, cur_nc, mr, nr, pc == 0);
+            continue;
+          }
+          StoreTile<OutT, AccT>(c_tile,
+                                NR,
+                                c + (ic + ir) * rs_c + (jc + jr) * cs_c,
+                                rs_c,
+                                cs_c,
+                                mr,
+                                nr,
+                                alpha,
+                                cur_beta);
+        }
+      }
+    }
+    if (c_acc) {
+      StoreTile<OutT, AccT>(c_acc,
+                            cur_nc,
+                            c + ic * rs_c + jc * cs_c,
+                            rs_c,
+                            cs_c,
+                            cur_mc,
+                            cur_nc,
+                            alpha,
+                            beta);
+    }
+  };
+
+  auto total_tiles = tiles_m * tiles_n;
+  ParallelFor(0, total_tiles, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t tile = begin; tile < end; ++tile) {
+      compute_tile(tile);
+    }
+  });
+}
+
+// Convenience wrapper using the layout flags of the matmul kernels: x is
+// stored as [M, K] ([K, M] if trans_x), y as [K, N] ([N, K] if trans_y) and
+// out as [M, N] ([N, M] if trans_out).
+template <typename T, typename AccT = T>
+void Gemm(bool trans_x,
+          bool trans_y,
+          int64_t M,
+          int64_t K,
+          int64_t N,
+          const T* x,
+          const T* y,
+          T* out,
+          bool trans_out = false,
+          AccT alpha = static_cast<AccT>(1),
+          AccT beta = static_cast<AccT>(0)) {
+  MatrixRef<T> a = trans_x ? MatrixRef<T>{x, 1, M} : MatrixRef<T>{x, K, 1};
+  MatrixRef<T> b = trans_y ? MatrixRef<T>{y, 1, K} : MatrixRef<T>{y, N, 1};
+  int64_t rs_c = trans_out ? 1 : N;
+  int64_t cs_c = trans_out ? M : 1;
+  Gemm<T, AccT>(M, N, K, alpha, a, b, beta, out, rs_c, cs_c);
+}
+
+// Offsets (in elements) of the operands of one GEMM in a batch.
+struct BatchOffset {
+  int64_t a;
+  int64_t b;
+  int64_t c;
+};
+
+// Runs C[c] = alpha * A[a] * B[b] for every entry of the batch, entries that
+// share the same C offset are summed up, which is how broadcast batch
+// dimensions are reduced in backward. When T is narrower than AccT such a
+// sum is kept in AccT and rounded to T once. Outputs are independent of each
+// other, so they are spread over the threads when there are enough of them or
+// when every single GEMM is too small to be split, otherwise each GEMM runs in
+// parallel on its own.
+template <typename T, typename AccT = T>
+void BatchedGemm(int64_t M,
+                 int64_t N,
+                 int64_t K,
+                 AccT alpha,
+                 const MatrixRef<T>& a,
+                 const MatrixRef<T>& b,
+                 T* c,
+                 int64_t rs_c,
+                 int64_t cs_c,
+                 std::vector<BatchOffset> batch) {
+  if (batch.empty()) {
+    return;
+  }
+  std::stable_sort(batch.begin(),
+                   batch.end(),
+                   [](const BatchOffset& lhs, const BatchOffset& rhs) {
+                     return lhs.c < rhs.c;
+                   });
+  std::vector<int64_t> groups;
+  for (int64_t i = 0; i < static_cast<int64_t>(batch.size()); ++i) {
+    if (i == 0 || batch[i].c != batch[i - 1].c) {
+      groups.push_back(i);
+    }
+  }
+  groups.push_back(batch.size());
+  auto num_groups = static_cast<int64_t>(groups.size()) - 1;
+
+  auto run_group = [&](int64_t group) {
+    auto first = groups[group];
+    auto last = groups[group + 1];
+    if (!std::is_same<T, AccT>::value && last - first > 1) {
+      ScratchScope scratch;
+      AccT* sum = scratch.Get<AccT>(M * N);
+      for (auto i = first; i < last; ++i) {
+        const auto& offset = batch[i];
+        Gemm<T, AccT, AccT>(
+            M,
+            N,
+            K,
+            alpha,
+            MatrixRef<T>{a.data + offset.a, a.rs, a.cs},
+            MatrixRef<T>{b.data + offset.b, b.rs, b.cs},
+            i == first ? static_cast<AccT>(0) : static_cast<AccT>(1),
+            sum,
+            N,
+            1);
+      }
+      T* out = c + batch[first].c;
+      for (int64_t i = 0; i < M; ++i) {
+        for (int64_t j = 0; j < N; ++j) {
+          out[i * rs_c + j * cs_c] = static_cast<T>(sum[i * N + j]);
+        }
+      }
+      return;
+    }
+    for (auto i = first; i < last; ++i) {
+      const auto& offset = batch[i];
+      Gemm<T, AccT>(M,
+                    N,
+                    K,
+                    alpha,
+                    MatrixRef<T>{a.data + offset.a, a.rs, a.cs},
+                    MatrixRef<T>{b.data + offset.b, b.rs, b.cs},
+                    i == first ? static_cast<AccT>(0) : static_cast<AccT>(1),
+                    c + offset.c,
+                    rs_c,
+                    cs_c);
+    }
+  };
+
+  constexpr int64_t kSmallGemmFlops = 64 * 64 * 64;
+  if (num_groups > 1 &&
+      (num_groups >= GetNumThreads() || M * N * K <= kSmallGemmFlops)) {
+    ParallelFor(0, num_groups, 1, [&](int64_t begin, int64_t end) {
+      for (auto group = begin; group < end; ++group) {
+        run_group(group);
+      }
+    });
+  } else {
+    for (int64_t group = 0; group < num_groups; ++group) {
+      run_group(group);
+    }
+  }
+}
+
+}  // namespace gemm
+}  // namespace custom_kernel
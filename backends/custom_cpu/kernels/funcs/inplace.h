@@ -0,0 +1,52 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include "paddle/phi/capi/all.h"
+#include "runtime/zero_copy.h"
+
+namespace custom_kernel {
+
+// Allocates the output of a kernel that overwrites it without reading it,
+// e.g. fill_ or uniform_. With zero-copy transfers the buffer of out may be
+// aliased by a host tensor; out then gets a buffer of its own.
+template <typename T>
+T* AllocOverwrite(const phi::Context& dev_ctx, phi::DenseTensor* out) {
+  if (out->initialized() && custom_cpu::SharedBuffers::Instance().Contains(
+                                out->data<T>(), out->memory_size())) {
+    phi::DenseTensor fresh;
+    fresh.Resize(out->dims());
+    dev_ctx.template Alloc<T>(&fresh);
+    out->ShareDataWith(fresh);
+  }
+  return dev_ctx.template Alloc<T>(out);
+}
+
+// Allocates the output of a kernel that may run in place, out being the
+// same tensor as x or sharing its buffer, e.g. add_ or sgd. The kernel must
+// read x through *src afterwards: allocating out may give it another
+// buffer, copied on write as in AllocOverwrite or of another place after a
+// zero-copy host to device transfer, and *src keeps the old one alive for
+// reading. Otherwise out keeps its buffer and the kernel runs in place.
+template <typename T>
+T* AllocInplace(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                phi::DenseTensor* out,
+                phi::DenseTensor* src) {
+  src->ShareDataWith(x);
+  return AllocOverwrite<T>(dev_ctx, out);
+}
+
+}  // namespace custom_kernel
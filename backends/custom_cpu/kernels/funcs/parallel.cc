@@ -0,0 +1,408 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/parallel.h"
+
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdlib>
+#include <deque>
+#include <memory>
+#include <mutex>
+#include <new>
+#include <thread>
+#include <vector>
+
+#include "runtime/flags.h"
+#include "runtime/topology.h"
+
+namespace custom_kernel {
+
+namespace {
+
+thread_local bool in_parallel_region = false;
+
+class ParallelRegionGuard {
+ public:
+  ParallelRegionGuard() : prev_(in_parallel_region) {
+    in_parallel_region = true;
+  }
+  ~ParallelRegionGuard() { in_parallel_region = prev_; }
+
+ private:
+  bool prev_;
+};
+
+int NumThreadsOf(size_t device_id) {
+  static const int num_threads =
+      static_cast<int>(EnvToInt("FLAGS_custom_cpu_num_threads", 0));
+  if (num_threads > 0) {
+    return num_threads;
+  }
+  auto& cpus = custom_cpu::GetLogicalDevice(device_id).cpus;
+  return std::max(static_cast<int>(cpus.size()), 1);
+}
+
+// A parallel loop over a range. Every participating thread owns a slice of
+// the range and works through it from the front, one chunk at a time. A
+// thread whose slice is empty steals the back half of the largest slice
+// left, so threads that start late or get slow chunks do not hold up the
+// others.
+class Loop {
+ public:
+  using Fn = std::function<void(int64_t, int64_t)>;
+
+  Loop(int64_t begin, int64_t end, int64_t chunk, int num_slices, const Fn* fn)
+      : chunk_(chunk),
+        fn_(fn),
+        num_slices_(num_slices),
+        slices_(new Slice[num_slices]),
+        remaining_(end - begin) {
+    auto per_slice = (end - begin + num_slices - 1) / num_slices;
+    for (int i = 0; i < num_slices; ++i) {
+      slices_[i].begin = std::min(end, begin + i * per_slice);
+      slices_[i].end = std::min(end, slices_[i].begin + per_slice);
+    }
+  }
+
+  // Claims a slice and works until the whole range is taken. Returns false
+  // when there was no slice left to claim.
+  bool Join() {
+    if (remaining_.load(std::memory_order_relaxed) == 0) {
+      return false;
+    }
+    auto slice = next_slice_++;
+    if (slice >= num_slices_) {
+      return false;
+    }
+    Work(&slices_[slice]);
+    return true;
+  }
+
+  void Wait() {
+    std::unique_lock<std::mutex> lock(mutex_);
+    cv_.wait(lock, [this] { return remaining_.load() == 0; });
+  }
+
+ private:
+  struct Slice {
+    std::mutex mutex;
+    int64_t begin = 0;
+    int64_t end = 0;
+  };
+
+  void Work(Slice* own) {
+    ParallelRegionGuard guard;
+    while (true) {
+      int64_t begin = 0;
+      int64_t end = 0;
+      {
+        std::lock_guard<std::mutex> lock(own->mutex);
+        if (own->begin < own->end) {
+          begin = own->begin;
+          end = std::min(own->end, begin + chunk_);
+          own->begin = end;
+        }
+      }
+      if (begin < end) {
+        (*fn_)(begin, end);
+        Finish(end - begin);
+      } else if (!Steal(own)) {
+        return;
+      }
+    }
+  }
+
+  bool Steal(Slice* own) {
+    while (true) {
+      Slice* victim = nullptr;
+      int64_t largest = 0;
+      for (int i = 0; i < num_slices_; ++i) {
+        std::lock_guard<std::mutex> lock(slices_[i].mutex);
+        auto size = slices_[i].end - slices_[i].begin;
+        if (size > largest) {
+          largest = size;
+          victim = &slices_[i];
+        }
+      }
+      if (!victim) {
+        return false;
+      }
+      int64_t begin, end;
+      {
+        std::lock_guard<std::mutex> lock(victim->mutex);
+        auto size = victim->end - victim->begin;
+        if (size <= 0) {
+          // Taken in the meantime, look again.
+          continue;
+        }
+        end = victim->end;
+        begin = size <= chunk_ ? victim->begin : end - size / 2;
+        victim->end = begin;
+      }
+      std::lock_guard<std::mutex> lock(own->mutex);
+      own->begin = begin;
+      own->end = end;
+      return true;
+    }
+  }
+
+  void Finish(int64_t done) {
+    if (remaining_ -= done) {
+      return;
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    cv_.notify_all();
+  }
+
+  const int64_t chunk_;
+  const Fn* const fn_;
+  const int num_slices_;
+  std::unique_ptr<Slice[]> slices_;
+  std::atomic<int> next_slice_{0};
+  std::atomic<int64_t> remaining_;
+  std::mutex mutex_;
+  std::condition_variable cv_;
+};
+
+// Every logical device has its own pool, with the workers pinned to the
+// cores of the device.
+class ThreadPool {
+ public:
+  static ThreadPool& ForDevice(size_t device_id) {
+    static auto* pools = new std::vector<std::atomic<ThreadPool*>>(
+        custom_cpu::GetLogicalDevices().size());
+    static std::mutex mutex;
+    auto& slot = (*pools)[device_id % pools->size()];
+    auto* pool = slot.load(std::memory_order_acquire);
+    if (!pool) {
+      std::lock_guard<std::mutex> lock(mutex);
+      pool = slot.load(std::memory_order_relaxed);
+      if (!pool) {
+        pool = new ThreadPool(NumThreadsOf(device_id), device_id);
+        slot.store(pool, std::memory_order_release);
+      }
+    }
+    return *pool;
+  }
+
+  ~ThreadPool() {
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      stop_ = true;
+    }
+    cv_.notify_all();
+    for (auto& worker : workers_) {
+      worker.join();
+    }
+  }
+
+  // Worker threads do not survive fork(), the child process has to run
+  // parallel loops on the calling thread.
+  bool Available() const { return !workers_.empty() && getpid() == pid_; }
+
+  void Run(const std::shared_ptr<Loop>& loop) {
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      loops_.push_back(loop);
+    }
+    cv_.notify_all();
+
+    loop->Join();
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      auto it = std::find(loops_.begin(), loops_.end(), loop);
+      if (it != loops_.end()) {
+        loops_.erase(it);
+      }
+    }
+    loop->Wait();
+  }
+
+ private:
+  ThreadPool(int num_threads, size_t device_id) : pid_(getpid()) {
+    for (int i = 1; i < num_threads; ++i) {
+      workers_.emplace_back([this] { WorkerLoop(); });
+      custom_cpu::BindThreadToDevice(workers_.back().native_handle(),
+                                     device_id);
+    }
+  }
+
+  void WorkerLoop() {
+    in_parallel_region = true;
+    while (true) {
+      std::shared_ptr<Loop> loop;
+      {
+        std::unique_lock<std::mutex> lock(mutex_);
+        cv_.wait(lock, [this] { return stop_ || !loops_.empty(); });
+        if (stop_) {
+          return;
+        }
+        loop = loops_.front();
+      }
+      if (!loop->Join()) {
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (!loops_.empty() && loops_.front() == loop) {
+          loops_.pop_front();
+        }
+      }
+    }
+  }
+
+  const pid_t pid_;
+  std::vector<std::thread> workers_;
+  std::deque<std::shared_ptr<Loop>> loops_;
+  std::mutex mutex_;
+  std::condition_variable cv_;
+  bool stop_ = false;
+};
+
+// Blocks of the scratch memory of a thread. Scopes hand out memory from the
+// current block and move to the next one, allocated on demand, when it is
+// full. Once the outermost scope ends, several blocks are merged into one
+// that fits them all, so that a thread settles on a single block.
+class ScratchArena {
+ public:
+  static constexpr size_t kAlignment = 64;
+  static constexpr size_t kMinBlockSize = 64 << 10;
+
+  struct Block {
+    char* data;
+    size_t size;
+  };
+
+  ~ScratchArena() {
+    for (auto& block : blocks_) {
+      free(block.data);
+    }
+  }
+
+  void* Allocate(size_t bytes, size_t* block, size_t* offset) {
+    bytes = (bytes + kAlignment - 1) / kAlignment * kAlignment;
+    while (*block < blocks_.size() && *offset + bytes > blocks_[*block].size) {
+      ++*block;
+      *offset = 0;
+    }
+    if (*block == blocks_.size()) {
+      auto size = std::max(bytes, kMinBlockSize);
+      if (!blocks_.empty()) {
+        size = std::max(size, 2 * blocks_.back().size);
+      }
+      void* data = nullptr;
+      if (posix_memalign(&data, kAlignment, size) != 0) {
+        throw std::bad_alloc();
+      }
+      blocks_.push_back({static_cast<char*>(data), size});
+    }
+    auto* ptr = blocks_[*block].data + *offset;
+    *offset += bytes;
+    return ptr;
+  }
+
+  void Compact() {
+    if (blocks_.size() <= 1) {
+      return;
+    }
+    size_t total = 0;
+    for (auto& block : blocks_) {
+      total += block.size;
+      free(block.data);
+    }
+    blocks_.clear();
+    void* data = nullptr;
+    if (posix_memalign(&data, kAlignment, total) == 0) {
+      blocks_.push_back({static_cast<char*>(data), total});
+    }
+  }
+
+  int depth = 0;
+  // Where the innermost scope hands out memory next.
+  size_t block = 0;
+  size_t offset = 0;
+
+ private:
+  std::vector<Block> blocks_;
+};
+
+constexpr size_t ScratchArena::kAlignment;
+constexpr size_t ScratchArena::kMinBlockSize;
+
+thread_local ScratchArena scratch_arena;
+
+}  // namespace
+
+int GetNumThreads() { return NumThreadsOf(custom_cpu::GetCurrentDevice()); }
+
+bool InParallelRegion() { return in_parallel_region; }
+
+void ParallelRange(int64_t begin,
+                   int64_t end,
+                   int64_t grain_size,
+                   int num_threads,
+                   const std::function<void(int64_t, int64_t)>& fn) {
+  if (begin >= end) {
+    return;
+  }
+  auto& pool = ThreadPool::ForDevice(custom_cpu::GetCurrentDevice());
+  if (num_threads <= 1 || in_parallel_region || !pool.Available()) {
+    ParallelRegionGuard guard;
+    fn(begin, end);
+    return;
+  }
+  // A few chunks per slice leave something to steal without making the
+  // chunks so small that per chunk setup of the callers adds up.
+  constexpr int64_t kChunksPerSlice = 4;
+  auto chunk = std::max<int64_t>(
+      grain_size, (end - begin) / (num_threads * kChunksPerSlice));
+  pool.Run(std::make_shared<Loop>(begin, end, chunk, num_threads, &fn));
+}
+
+void ParallelRun(int64_t num_tasks, const std::function<void(int64_t)>& fn) {
+  if (num_tasks <= 0) {
+    return;
+  }
+  auto num_threads = std::min<int64_t>(GetNumThreads(), num_tasks);
+  ParallelRange(0,
+                num_tasks,
+                1,
+                static_cast<int>(num_threads),
+                [&](int64_t begin, int64_t end) {
+                  for (auto task_id = begin; task_id < end; ++task_id) {
+                    fn(task_id);
+                  }
+                });
+}
+
+ScratchScope::ScratchScope()
+    : block_(scratch_arena.block), offset_(scratch_arena.offset) {
+  ++scratch_arena.depth;
+}
+
+ScratchScope::~ScratchScope() {
+  scratch_arena.block = block_;
+  scratch_arena.offset = offset_;
+  if (--scratch_arena.depth == 0) {
+    scratch_arena.Compact();
+  }
+}
+
+void* ScratchScope::Allocate(size_t bytes) {
+  return scratch_arena.Allocate(
+      bytes, &scratch_arena.block, &scratch_arena.offset);
+}
+
+}  // namespace custom_kernel
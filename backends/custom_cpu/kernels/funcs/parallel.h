@@ -0,0 +1,104 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <new>
+#include <type_traits>
+
+namespace custom_kernel {
+
+// Number of threads used by the intra-op parallel loops of the current
+// device, controlled by FLAGS_custom_cpu_num_threads (defaults to the number
+// of cores of the device).
+int GetNumThreads();
+
+// True when the calling thread is already executing a parallel task, nested
+// parallel loops run serially on the calling thread.
+bool InParallelRegion();
+
+// Calls fn(chunk_begin, chunk_end) over chunks of [begin, end) of at least
+// grain_size elements on up to num_threads threads of the plugin thread
+// pool, the calling thread included, and returns when all are done. Every
+// thread starts on its own slice of the range and, once done, steals the
+// back half of the largest slice left, so uneven chunks still balance.
+void ParallelRange(int64_t begin,
+                   int64_t end,
+                   int64_t grain_size,
+                   int num_threads,
+                   const std::function<void(int64_t, int64_t)>& fn);
+
+// Runs fn(task_id) for every task_id in [0, num_tasks) on the plugin thread
+// pool. The calling thread takes part in the work and the call returns after
+// all tasks are finished.
+void ParallelRun(int64_t num_tasks, const std::function<void(int64_t)>& fn);
+
+// Calls fn(chunk_begin, chunk_end) for chunks of [begin, end) of at least
+// grain_size elements, in parallel when the range spans several grains.
+// Chunks are not tied to threads and their number is not fixed.
+template <typename F>
+void ParallelFor(int64_t begin, int64_t end, int64_t grain_size, const F& fn) {
+  if (begin >= end) {
+    return;
+  }
+  grain_size = std::max<int64_t>(grain_size, 1);
+  auto range = end - begin;
+  auto num_threads =
+      std::min<int64_t>(GetNumThreads(), (range + grain_size - 1) / grain_size);
+  if (num_threads <= 1 || InParallelRegion()) {
+    fn(begin, end);
+    return;
+  }
+  ParallelRange(begin, end, grain_size, static_cast<int>(num_threads), fn);
+}
+
+// Scratch memory of the calling thread, shared by every kernel that runs on
+// it, so that temporary buffers are allocated once per thread instead of
+// once per call or chunk. Buffers returned by Get stay valid until the
+// scope that returned them ends. Scopes nest; when the outermost one ends,
+// the memory stays with the thread for the next kernel.
+class ScratchScope {
+ public:
+  ScratchScope();
+  ~ScratchScope();
+
+  ScratchScope(const ScratchScope&) = delete;
+  ScratchScope& operator=(const ScratchScope&) = delete;
+
+  // count default constructed elements, 64 byte aligned.
+  template <typename T>
+  T* Get(int64_t count) {
+    static_assert(std::is_trivially_destructible<T>::value,
+                  "scratch elements are never destroyed");
+    auto* data = static_cast<T*>(Allocate(count * sizeof(T)));
+    if (!std::is_trivially_default_constructible<T>::value) {
+      for (int64_t i = 0; i < count; ++i) {
+        new (data + i) T();
+      }
+    }
+    return data;
+  }
+
+ private:
+  void* Allocate(size_t bytes);
+
+  size_t block_;
+  size_t offset_;
+};
+
+}  // namespace custom_kernel
@@ -0,0 +1,406 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/strided_offset.h"
+
+namespace custom_kernel {
+
+// Sum of n contiguous values. Blocks of kBlock values are summed with eight
+// independent accumulators and blocks are combined pairwise, so the rounding
+// error grows with O(log n) instead of O(n).
+template <typename T>
+T PairwiseSum(const T* x, int64_t n) {
+  constexpr int64_t kBlock = 128;
+  if (n <= kBlock) {
+    T acc[8] = {0, 0, 0, 0, 0, 0, 0, 0};
+    int64_t i = 0;
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; ++k) {
+        acc[k] += x[i + k];
+      }
+    }
+    T sum = ((acc[0] + acc[1]) + (acc[2] + acc[3])) +
+            ((acc[4] + acc[5]) + (acc[6] + acc[7]));
+    for (; i < n; ++i) {
+      sum += x[i];
+    }
+    return sum;
+  }
+  auto half = (n / 2 + 7) / 8 * 8;
+  return PairwiseSum(x, half) + PairwiseSum(x + half, n - half);
+}
+
+// A reducer describes one reduction op:
+//   Identity()                 value of an empty reduction
+//   ReduceContiguous(x, n)     reduction of n contiguous values
+//   AccumulateRow(acc, c, x, n) acc[j] = op(acc[j], x[j]) for a row of
+//                              outputs, c is scratch for compensation terms
+//   Accumulator                folds partial results one by one
+//   Finalize(v, n)             turns the reduction of n values into the
+//                              output, mean divides by n
+template <typename T>
+struct SumReducer {
+  static T Identity() { return static_cast<T>(0); }
+
+  static T ReduceContiguous(const T* x, int64_t n) { return PairwiseSum(x, n); }
+
+  // Kahan summation per output column, rows of a strided reduction arrive
+  // one at a time so they cannot be summed pairwise.
+  static void AccumulateRow(T* acc, T* comp, const T* x, int64_t n) {
+    for (int64_t j = 0; j < n; ++j) {
+      T y = x[j] - comp[j];
+      T t = acc[j] + y;
+      comp[j] = (t - acc[j]) - y;
+      acc[j] = t;
+    }
+  }
+
+  struct Accumulator {
+    T sum = static_cast<T>(0);
+    T comp = static_cast<T>(0);
+    void Add(T v) {
+      T y = v - comp;
+      T t = sum + y;
+      comp = (t - sum) - y;
+      sum = t;
+    }
+    T Value() const { return sum; }
+  };
+
+  static T Finalize(T v, int64_t n) { return v; }
+};
+
+template <typename T>
+struct MeanReducer : public SumReducer<T> {
+  static T Finalize(T v, int64_t n) { return v / static_cast<T>(n); }
+};
+
+template <typename T>
+struct MinReducer {
+  static T Identity() { return std::numeric_limits<T>::max(); }
+
+  static T Combine(T a, T b) { return b < a ? b : a; }
+
+  static T ReduceContiguous(const T* x, int64_t n) {
+    T acc[8];
+    std::fill(acc, acc + 8, Identity());
+    int64_t i = 0;
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; ++k) {
+        acc[k] = Combine(acc[k], x[i + k]);
+      }
+    }
+    T value = Identity();
+    for (int k = 0; k < 8; ++k) {
+      value = Combine(value, acc[k]);
+    }
+    for (; i < n; ++i) {
+      value = Combine(value, x[i]);
+    }
+    return value;
+  }
+
+  static void AccumulateRow(T* acc, T* comp, const T* x, int64_t n) {
+    for (int64_t j = 0; j < n; ++j) {
+      acc[j] = Combine(acc[j], x[j]);
+    }
+  }
+
+  struct Accumulator {
+    T value = Identity();
+    void Add(T v) { value = Combine(value, v); }
+    T Value() const { return value; }
+  };
+
+  static T Finalize(T v, int64_t n) { return v; }
+};
+
+template <typename T>
+struct MaxReducer {
+  static T Identity() { return std::numeric_limits<T>::lowest(); }
+
+  static T Combine(T a, T b) { return a < b ? b : a; }
+
+  static T ReduceContiguous(const T* x, int64_t n) {
+    T acc[8];
+    std::fill(acc, acc + 8, Identity());
+    int64_t i = 0;
+    for (; i + 8 <= n; i += 8) {
+      for (int k = 0; k < 8; ++k) {
+        acc[k] = Combine(acc[k], x[i + k]);
+      }
+    }
+    T value = Identity();
+    for (int k = 0; k < 8; ++k) {
+      value = Combine(value, acc[k]);
+    }
+    for (; i < n; ++i) {
+      value = Combine(value, x[i]);
+    }
+    return value;
+  }
+
+  static void AccumulateRow(T* acc, T* comp, const T* x, int64_t n) {
+    for (int64_t j = 0; j < n; ++j) {
+      acc[j] = Combine(acc[j], x[j]);
+    }
+  }
+
+  struct Accumulator {
+    T value = Identity();
+    void Add(T v) { value = Combine(value, v); }
+    T Value() const { return value; }
+  };
+
+  static T Finalize(T v, int64_t n) { return v; }
+};
+
+// A reduction of a contiguous tensor, split into the kept dimensions (the
+// output, row-major) and the reduced dimensions. Size-1 dimensions are
+// dropped and adjacent dimensions that are both kept or both reduced are
+// merged, so e.g. reducing axes [2, 3] of a [N, C, H, W] tensor is a
+// [N * C] x [H * W] problem and reducing axis 0 of it is [C * H * W] x [N].
+struct ReducePlan {
+  std::vector<int64_t> out_dims, out_strides;
+  std::vector<int64_t> reduce_dims, reduce_strides;
+  int64_t out_numel = 1;
+  int64_t reduce_numel = 1;
+  // True if the innermost input dimension is reduced, every output then
+  // reduces contiguous runs. Otherwise neighbouring outputs read
+  // neighbouring inputs and whole rows of outputs are accumulated at once.
+  bool inner_reduce = true;
+};
+
+inline ReducePlan MakeReducePlan(const std::vector<int64_t>& x_dims,
+                                 const std::vector<bool>& reduced) {
+  std::vector<int64_t> dims, strides;
+  std::vector<bool> flags;
+  int64_t stride = 1;
+  for (auto i = static_cast<int64_t>(x_dims.size()) - 1; i >= 0; --i) {
+    auto dim = x_dims[i];
+    if (dim != 1) {
+      if (!flags.empty() && flags.back() == reduced[i]) {
+        dims.back() *= dim;
+      } else {
+        dims.push_back(dim);
+        strides.push_back(stride);
+        flags.push_back(reduced[i]);
+      }
+    }
+    stride *= dim;
+  }
+
+  ReducePlan plan;
+  plan.inner_reduce = flags.empty() || flags.front();
+  for (auto i = static_cast<int64_t>(dims.size()) - 1; i >= 0; --i) {
+    if (flags[i]) {
+      plan.reduce_dims.push_back(dims[i]);
+      plan.reduce_strides.push_back(strides[i]);
+      plan.reduce_numel *= dims[i];
+    } else {
+      plan.out_dims.push_back(dims[i]);
+      plan.out_strides.push_back(strides[i]);
+      plan.out_numel *= dims[i];
+    }
+  }
+  if (plan.out_dims.empty()) {
+    plan.out_dims.push_back(1);
+    plan.out_strides.push_back(0);
+  }
+  if (plan.reduce_dims.empty()) {
+    plan.reduce_dims.push_back(1);
+    plan.reduce_strides.push_back(1);
+  }
+  return plan;
+}
+
+// Outputs [out_begin, out_end) reduced over the reduce positions
+// [r_begin, r_end) when the innermost dimension is reduced: every output
+// reduces runs of reduce_dims.back() contiguous values.
+template <typename T, typename Reducer>
+void ReduceInnerRange(const ReducePlan& plan,
+                      const T* x,
+                      int64_t out_begin,
+                      int64_t out_end,
+                      int64_t r_begin,
+                      int64_t r_end,
+                      bool finalize,
+                      T* out) {
+  auto run = plan.reduce_dims.back();
+  std::vector<int64_t> row_dims(plan.reduce_dims.begin(),
+                                plan.reduce_dims.end() - 1);
+  std::vector<int64_t> row_strides(plan.reduce_strides.begin(),
+                                   plan.reduce_strides.end() - 1);
+  StridedOffset out_offset(plan.out_dims, plan.out_strides);
+  StridedOffset row_offset(row_dims, row_strides);
+  out_offset.Seek(out_begin);
+  for (auto o = out_begin; o < out_end; ++o, out_offset.Next()) {
+    typename Reducer::Accumulator acc;
+    auto pos = r_begin;
+    row_offset.Seek(pos / run);
+    auto col = pos % run;
+    while (pos < r_end) {
+      auto n = std::min(run - col, r_end - pos);
+      acc.Add(Reducer::ReduceContiguous(
+          x + out_offset.offset + row_offset.offset + col, n));
+      pos += n;
+      col = 0;
+      row_offset.Next();
+    }
+    out[o] = finalize ? Reducer::Finalize(acc.Value(), plan.reduce_numel)
+                      : acc.Value();
+  }
+}
+
+// Tasks [task_begin, task_end) reduced over the reduce positions
+// [r_begin, r_end) when the innermost dimension is kept. A task is a chunk of
+// at most kColumns outputs along the innermost dimension, and every reduce
+// position adds one strided row of inputs to it.
+template <typename T, typename Reducer>
+void ReduceOuterRange(const ReducePlan& plan,
+                      const T* x,
+                      int64_t columns,
+                      int64_t task_begin,
+                      int64_t task_end,
+                      int64_t r_begin,
+                      int64_t r_end,
+                      bool finalize,
+                      T* out) {
+  auto inner = plan.out_dims.back();
+  auto chunks = (inner + columns - 1) / columns;
+  std::vector<int64_t> block_dims(plan.out_dims.begin(),
+                                  plan.out_dims.end() - 1);
+  std::vector<int64_t> block_strides(plan.out_strides.begin(),
+                                     plan.out_strides.end() - 1);
+  StridedOffset block_offset(block_dims, block_strides);
+  StridedOffset row_offset(plan.reduce_dims, plan.reduce_strides);
+  std::vector<T> acc(columns), comp(columns);
+  for (auto task = task_begin; task < task_end; ++task) {
+    auto block = task / chunks;
+    auto col_begin = task % chunks * columns;
+    auto n = std::min(columns, inner - col_begin);
+    block_offset.Seek(block);
+    row_offset.Seek(r_begin);
+    std::fill(acc.begin(), acc.begin() + n, Reducer::Identity());
+    std::fill(comp.begin(), comp.begin() + n, static_cast<T>(0));
+    const T* base = x + block_offset.offset + col_begin;
+    for (auto r = r_begin; r < r_end; ++r, row_offset.Next()) {
+      Reducer::AccumulateRow(
+          acc.data(), comp.data(), base + row_offset.offset, n);
+    }
+    T* dst = out + block * inner + col_begin;
+    for (int64_t j = 0; j < n; ++j) {
+      dst[j] = finalize ? Reducer::Finalize(acc[j], plan.reduce_numel) : acc[j];
+    }
+  }
+}
+
+// Reduces the contiguous tensor x of shape x_dims over the dimensions marked
+// in reduced and writes the row-major result to out. Work is split across
+// outputs when there are enough of them; otherwise the reduction itself is
+// split into per-thread partial results that are combined at the end.
+template <typename T, typename Reducer>
+void Reduce(const std::vector<int64_t>& x_dims,
+            const std::vector<bool>& reduced,
+            const T* x,
+            T* out) {
+  auto plan = MakeReducePlan(x_dims, reduced);
+  if (plan.out_numel == 0) {
+    return;
+  }
+  if (plan.reduce_numel == 0) {
+    std::fill(
+        out, out + plan.out_numel, Reducer::Finalize(Reducer::Identity(), 0));
+    return;
+  }
+
+  constexpr int64_t kGrainSize = 32768;
+  constexpr int64_t kColumns = 1024;
+  auto columns = std::min(kColumns, plan.out_dims.back());
+  auto num_tasks = plan.inner_reduce
+                       ? plan.out_numel
+                       : plan.out_numel / plan.out_dims.back() *
+                             ((plan.out_dims.back() + columns - 1) / columns);
+  auto num_threads = InParallelRegion() ? 1 : GetNumThreads();
+  auto num_parts =
+      std::min<int64_t>(num_threads, plan.reduce_numel / kGrainSize);
+
+  auto reduce_range = [&](int64_t task_begin,
+                          int64_t task_end,
+                          int64_t r_begin,
+                          int64_t r_end,
+                          bool finalize,
+                          T* dst) {
+    if (plan.inner_reduce) {
+      ReduceInnerRange<T, Reducer>(
+          plan, x, task_begin, task_end, r_begin, r_end, finalize, dst);
+    } else {
+      ReduceOuterRange<T, Reducer>(plan,
+                                   x,
+                                   columns,
+                                   task_begin,
+                                   task_end,
+                                   r_begin,
+                                   r_end,
+                                   finalize,
+                                   dst);
+    }
+  };
+
+  if (num_tasks >= num_threads || num_parts <= 1) {
+    auto work_per_task = plan.reduce_numel * (plan.out_numel / num_tasks);
+    ParallelFor(0,
+                num_tasks,
+                std::max<int64_t>(1, kGrainSize / work_per_task),
+                [&](int64_t task_begin, int64_t task_end) {
+                  reduce_range(
+                      task_begin, task_end, 0, plan.reduce_numel, true, out);
+                });
+    return;
+  }
+
+  // Few long reductions: every part reduces a slice of the reduce positions
+  // for all outputs and the partial results are folded in a fixed order.
+  std::vector<T> partials(num_parts * plan.out_numel);
+  auto part_size = (plan.reduce_numel + num_parts - 1) / num_parts;
+  ParallelFor(0, num_parts, 1, [&](int64_t part_begin, int64_t part_end) {
+    for (auto part = part_begin; part < part_end; ++part) {
+      auto r_begin = part * part_size;
+      auto r_end = std::min(plan.reduce_numel, r_begin + part_size);
+      T* dst = partials.data() + part * plan.out_numel;
+      if (r_begin >= r_end) {
+        std::fill(dst, dst + plan.out_numel, Reducer::Identity());
+        continue;
+      }
+      reduce_range(0, num_tasks, r_begin, r_end, false, dst);
+    }
+  });
+  for (int64_t o = 0; o < plan.out_numel; ++o) {
+    typename Reducer::Accumulator acc;
+    for (int64_t part = 0; part < num_parts; ++part) {
+      acc.Add(partials[part * plan.out_numel + o]);
+    }
+    out[o] = Reducer::Finalize(acc.Value(), plan.reduce_numel);
+  }
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,94 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstdint>
+#include <cstring>
+
+namespace custom_kernel {
+
+#if defined(__AVX512F__)
+constexpr int64_t kVectorBytes = 64;
+#elif defined(__AVX__)
+constexpr int64_t kVectorBytes = 32;
+#else
+constexpr int64_t kVectorBytes = 16;
+#endif
+
+// SIMD vector of T built on the GCC/Clang vector extensions, so hot loops
+// are vectorized regardless of how aggressively the compiler auto-vectorizes.
+// Types without a vector form have kEnabled == false.
+template <typename T>
+struct Simd {
+  static constexpr bool kEnabled = false;
+  static constexpr int64_t kWidth = 1;
+};
+
+template <>
+struct Simd<float> {
+  typedef float Vec __attribute__((vector_size(kVectorBytes)));
+  typedef int32_t IntVec __attribute__((vector_size(kVectorBytes)));
+  static constexpr bool kEnabled = true;
+  static constexpr int64_t kWidth = kVectorBytes / sizeof(float);
+
+  static Vec Load(const float* p) {
+    Vec v;
+    std::memcpy(&v, p, sizeof(v));
+    return v;
+  }
+  static void Store(float* p, Vec v) { std::memcpy(p, &v, sizeof(v)); }
+};
+
+template <>
+struct Simd<double> {
+  typedef double Vec __attribute__((vector_size(kVectorBytes)));
+  static constexpr bool kEnabled = true;
+  static constexpr int64_t kWidth = kVectorBytes / sizeof(double);
+
+  static Vec Load(const double* p) {
+    Vec v;
+    std::memcpy(&v, p, sizeof(v));
+    return v;
+  }
+  static void Store(double* p, Vec v) { std::memcpy(p, &v, sizeof(v)); }
+};
+
+// exp(x) for every lane of a float vector with the Cephes expf polynomial,
+// the relative error is within 2 ulp of std::exp. Inputs are clamped to
+// [-87, 88], which keeps the result finite and normal.
+inline Simd<float>::Vec VecExp(Simd<float>::Vec x) {
+  using Vec = Simd<float>::Vec;
+  using IntVec = Simd<float>::IntVec;
+  x = x < -87.0f ? Vec() - 87.0f : x;
+  x = x > 88.0f ? Vec() + 88.0f : x;
+  // n = round(x / ln2), adding and subtracting 1.5 * 2^23 rounds to nearest.
+  Vec n = x * 1.44269504088896341f + 12582912.0f;
+  n -= 12582912.0f;
+  Vec r = x - n * 0.693359375f;
+  r = r + n * 2.12194440e-4f;
+  Vec p = Vec() + 1.9875691500e-4f;
+  p = p * r + 1.3981999507e-3f;
+  p = p * r + 8.3334519073e-3f;
+  p = p * r + 4.1665795894e-2f;
+  p = p * r + 1.6666665459e-1f;
+  p = p * r + 5.0000001201e-1f;
+  p = p * r * r + r + 1.0f;
+  IntVec bits = (__builtin_convertvector(n, IntVec) + 127) << 23;
+  Vec scale;
+  std::memcpy(&scale, &bits, sizeof(scale));
+  return p * scale;
+}
+
+}  // namespace custom_kernel
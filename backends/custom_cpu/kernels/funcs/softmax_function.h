@@ -0,0 +1,324 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <limits>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/simd.h"
+
+namespace custom_kernel {
+
+// exp(x - max) is clipped at exp(-64) like phi does, which keeps denormals
+// out of the sums.
+template <typename T>
+inline T SoftmaxExp(T x) {
+  const T kThreshold = static_cast<T>(-64.);
+  return std::exp(x < kThreshold ? kThreshold : x);
+}
+
+// Horizontal max and sum of a row, T is float or double.
+template <typename T>
+T RowMax(const T* x, int64_t n) {
+  using S = Simd<T>;
+  auto acc = typename S::Vec() - std::numeric_limits<T>::infinity();
+  int64_t i = 0;
+  for (; i + S::kWidth <= n; i += S::kWidth) {
+    auto v = S::Load(x + i);
+    acc = acc < v ? v : acc;
+  }
+  T lanes[S::kWidth];
+  S::Store(lanes, acc);
+  T max_val = lanes[0];
+  for (int64_t k = 1; k < S::kWidth; ++k) {
+    max_val = max_val < lanes[k] ? lanes[k] : max_val;
+  }
+  for (; i < n; ++i) {
+    max_val = max_val < x[i] ? x[i] : max_val;
+  }
+  return max_val;
+}
+
+template <typename T>
+T RowSum(const T* x, int64_t n) {
+  using S = Simd<T>;
+  typename S::Vec acc0 = {}, acc1 = {};
+  int64_t i = 0;
+  for (; i + 2 * S::kWidth <= n; i += 2 * S::kWidth) {
+    acc0 += S::Load(x + i);
+    acc1 += S::Load(x + i + S::kWidth);
+  }
+  T lanes[S::kWidth];
+  S::Store(lanes, acc0 + acc1);
+  T sum = 0;
+  for (int64_t k = 0; k < S::kWidth; ++k) {
+    sum += lanes[k];
+  }
+  for (; i < n; ++i) {
+    sum += x[i];
+  }
+  return sum;
+}
+
+// out[i] = exp(x[i] - max_val), returns the sum of out.
+template <typename T>
+T ExpSub(const T* x, T max_val, int64_t n, T* out) {
+  for (int64_t i = 0; i < n; ++i) {
+    out[i] = SoftmaxExp(x[i] - max_val);
+  }
+  return RowSum(out, n);
+}
+
+inline float ExpSub(const float* x, float max_val, int64_t n, float* out) {
+  using S = Simd<float>;
+  int64_t i = 0;
+  for (; i + S::kWidth <= n; i += S::kWidth) {
+    auto d = S::Load(x + i) - max_val;
+    d = d < -64.0f ? S::Vec() - 64.0f : d;
+    S::Store(out + i, VecExp(d));
+  }
+  for (; i < n; ++i) {
+    out[i] = SoftmaxExp(x[i] - max_val);
+  }
+  return RowSum(out, n);
+}
+
+// out[i] = exp(x[i] - max_val[i]) and sum[i] += out[i].
+template <typename T>
+void ExpSubAccumulate(const T* x, const T* max_val, int64_t n, T* out, T* sum) {
+  for (int64_t i = 0; i < n; ++i) {
+    out[i] = SoftmaxExp(x[i] - max_val[i]);
+    sum[i] += out[i];
+  }
+}
+
+inline void ExpSubAccumulate(
+    const float* x, const float* max_val, int64_t n, float* out, float* sum) {
+  using S = Simd<float>;
+  int64_t i = 0;
+  for (; i + S::kWidth <= n; i += S::kWidth) {
+    auto d = S::Load(x + i) - S::Load(max_val + i);
+    d = d < -64.0f ? S::Vec() - 64.0f : d;
+    auto e = VecExp(d);
+    S::Store(out + i, e);
+    S::Store(sum + i, S::Load(sum + i) + e);
+  }
+  for (; i < n; ++i) {
+    out[i] = SoftmaxExp(x[i] - max_val[i]);
+    sum[i] += out[i];
+  }
+}
+
+// Softmax of one contiguous row. The maximum and the sum are found in a
+// single online pass over blocks of the input: every block is exponentiated
+// against the running maximum, and when the maximum grows the sum is
+// rescaled. The exponentials are written straight to out, and a second pass
+// over out rescales every block by exp(block_max - max) / sum. Returns the
+// log-sum-exp of the row.
+template <typename T>
+T SoftmaxRow(const T* in, T* out, int64_t n) {
+  constexpr int64_t kBlock = 512;
+  auto num_blocks = (n + kBlock - 1) / kBlock;
+  ScratchScope scratch;
+  T* block_max = num_blocks > 1 ? scratch.Get<T>(num_blocks) : nullptr;
+  T max_val = -std::numeric_limits<T>::infinity();
+  T sum = 0;
+  for (int64_t b = 0; b < num_blocks; ++b) {
+    auto begin = b * kBlock;
+    auto len = std::min(kBlock, n - begin);
+    auto local_max = RowMax(in + begin, len);
+    if (max_val < local_max) {
+      sum *= std::exp(max_val - local_max);
+      max_val = local_max;
+    }
+    if (block_max) {
+      block_max[b] = max_val;
+    }
+    sum += ExpSub(in + begin, max_val, len, out + begin);
+  }
+  T inv_sum = static_cast<T>(1) / sum;
+  for (int64_t b = 0; b < num_blocks; ++b) {
+    auto begin = b * kBlock;
+    auto len = std::min(kBlock, n - begin);
+    T scale = block_max ? std::exp(block_max[b] - max_val) * inv_sum : inv_sum;
+    for (int64_t i = begin; i < begin + len; ++i) {
+      out[i] *= scale;
+    }
+  }
+  return max_val + std::log(sum);
+}
+
+// Softmax over the middle axis of a contiguous [outer, axis_dim, inner]
+// tensor. Rows along the axis are inner elements apart, so instead of
+// walking one column at a time a chunk of columns is processed together
+// and every access is a contiguous run of a row. The log-sum-exp of every
+// column is written to lse unless it is nullptr.
+template <typename T>
+void SoftmaxColumns(const T* in,
+                    T* out,
+                    int64_t axis_dim,
+                    int64_t inner,
+                    int64_t col_begin,
+                    int64_t cols,
+                    T* lse = nullptr) {
+  ScratchScope scratch;
+  T* max_val = scratch.Get<T>(2 * cols);
+  T* sum = max_val + cols;
+  std::fill(max_val, max_val + cols, -std::numeric_limits<T>::infinity());
+  std::fill(sum, sum + cols, static_cast<T>(0));
+  for (int64_t j = 0; j < axis_dim; ++j) {
+    const T* row = in + j * inner + col_begin;
+    for (int64_t c = 0; c < cols; ++c) {
+      max_val[c] = max_val[c] < row[c] ? row[c] : max_val[c];
+    }
+  }
+  for (int64_t j = 0; j < axis_dim; ++j) {
+    ExpSubAccumulate(in + j * inner + col_begin,
+                     max_val,
+                     cols,
+                     out + j * inner + col_begin,
+                     sum);
+  }
+  for (int64_t c = 0; c < cols; ++c) {
+    if (lse) {
+      lse[c] = max_val[c] + std::log(sum[c]);
+    }
+    sum[c] = static_cast<T>(1) / sum[c];
+  }
+  for (int64_t j = 0; j < axis_dim; ++j) {
+    T* row = out + j * inner + col_begin;
+    for (int64_t c = 0; c < cols; ++c) {
+      row[c] *= sum[c];
+    }
+  }
+}
+
+constexpr int64_t kSoftmaxGrainSize = 16384;
+constexpr int64_t kSoftmaxColumns = 256;
+
+// Softmax of a contiguous [outer, axis_dim, inner] tensor along axis_dim.
+template <typename T>
+void Softmax(
+    const T* in, T* out, int64_t outer, int64_t axis_dim, int64_t inner) {
+  if (outer * axis_dim * inner == 0) {
+    return;
+  }
+  if (inner == 1) {
+    ParallelFor(0,
+                outer,
+                std::max<int64_t>(1, kSoftmaxGrainSize / axis_dim),
+                [&](int64_t begin, int64_t end) {
+                  for (auto i = begin; i < end; ++i) {
+                    SoftmaxRow(in + i * axis_dim, out + i * axis_dim, axis_dim);
+                  }
+                });
+    return;
+  }
+  auto chunks = (inner + kSoftmaxColumns - 1) / kSoftmaxColumns;
+  auto work_per_task = axis_dim * std::min(inner, kSoftmaxColumns);
+  ParallelFor(0,
+              outer * chunks,
+              std::max<int64_t>(1, kSoftmaxGrainSize / work_per_task),
+              [&](int64_t begin, int64_t end) {
+                for (auto task = begin; task < end; ++task) {
+                  auto i = task / chunks;
+                  auto col_begin = task % chunks * kSoftmaxColumns;
+                  SoftmaxColumns(in + i * axis_dim * inner,
+                                 out + i * axis_dim * inner,
+                                 axis_dim,
+                                 inner,
+                                 col_begin,
+                                 std::min(kSoftmaxColumns, inner - col_begin));
+                }
+              });
+}
+
+// x_grad = (out_grad - sum(out_grad * out)) * out along axis_dim of a
+// contiguous [outer, axis_dim, inner] tensor.
+template <typename T>
+void SoftmaxGrad(const T* out,
+                 const T* out_grad,
+                 T* x_grad,
+                 int64_t outer,
+                 int64_t axis_dim,
+                 int64_t inner) {
+  if (outer * axis_dim * inner == 0) {
+    return;
+  }
+  if (inner == 1) {
+    ParallelFor(0,
+                outer,
+                std::max<int64_t>(1, kSoftmaxGrainSize / axis_dim),
+                [&](int64_t begin, int64_t end) {
+                  for (auto i = begin; i < end; ++i) {
+                    const T* y = out + i * axis_dim;
+                    const T* dy = out_grad + i * axis_dim;
+                    T* dx = x_grad + i * axis_dim;
+                    T acc[8] = {0, 0, 0, 0, 0, 0, 0, 0};
+                    int64_t j = 0;
+                    for (; j + 8 <= axis_dim; j += 8) {
+                      for (int k = 0; k < 8; ++k) {
+                        acc[k] += y[j + k] * dy[j + k];
+                      }
+                    }
+                    T dot = ((acc[0] + acc[1]) + (acc[2] + acc[3])) +
+                            ((acc[4] + acc[5]) + (acc[6] + acc[7]));
+                    for (; j < axis_dim; ++j) {
+                      dot += y[j] * dy[j];
+                    }
+                    for (j = 0; j < axis_dim; ++j) {
+                      dx[j] = (dy[j] - dot) * y[j];
+                    }
+                  }
+                });
+    return;
+  }
+  auto chunks = (inner + kSoftmaxColumns - 1) / kSoftmaxColumns;
+  auto work_per_task = axis_dim * std::min(inner, kSoftmaxColumns);
+  ParallelFor(0,
+              outer * chunks,
+              std::max<int64_t>(1, kSoftmaxGrainSize / work_per_task),
+              [&](int64_t begin, int64_t end) {
+                for (auto task = begin; task < end; ++task) {
+                  auto offset = task / chunks * axis_dim * inner +
+                                task % chunks * kSoftmaxColumns;
+                  auto cols = std::min(kSoftmaxColumns,
+                                       inner - task % chunks * kSoftmaxColumns);
+                  ScratchScope scratch;
+                  T* dot = scratch.Get<T>(cols);
+                  std::fill(dot, dot + cols, static_cast<T>(0));
+                  for (int64_t j = 0; j < axis_dim; ++j) {
+                    const T* y = out + offset + j * inner;
+                    const T* dy = out_grad + offset + j * inner;
+                    for (int64_t c = 0; c < cols; ++c) {
+                      dot[c] += y[c] * dy[c];
+                    }
+                  }
+                  for (int64_t j = 0; j < axis_dim; ++j) {
+                    const T* y = out + offset + j * inner;
+                    const T* dy = out_grad + offset + j * inner;
+                    T* dx = x_grad + offset + j * inner;
+                    for (int64_t c = 0; c < cols; ++c) {
+                      dx[c] = (dy[c] - dot[c]) * y[c];
+                    }
+                  }
+                }
+              });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,255 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <utility>
+
+#include "kernels/funcs/parallel.h"
+
+namespace custom_kernel {
+
+// Maps a value to an unsigned key whose natural order is the ascending order
+// of the values. Every NaN maps to the largest key, so NaNs end up last when
+// sorting ascending and first when sorting descending, without a separate
+// comparison.
+template <typename T>
+struct SortKey;
+
+template <>
+struct SortKey<float> {
+  using Type = uint32_t;
+  static Type Get(float v) {
+    if (std::isnan(v)) {
+      return ~Type(0);
+    }
+    Type bits;
+    std::memcpy(&bits, &v, sizeof(bits));
+    return bits & 0x80000000u ? ~bits : bits | 0x80000000u;
+  }
+};
+
+template <>
+struct SortKey<double> {
+  using Type = uint64_t;
+  static Type Get(double v) {
+    if (std::isnan(v)) {
+      return ~Type(0);
+    }
+    Type bits;
+    std::memcpy(&bits, &v, sizeof(bits));
+    return bits & 0x8000000000000000ull ? ~bits : bits | 0x8000000000000000ull;
+  }
+};
+
+template <>
+struct SortKey<int32_t> {
+  using Type = uint32_t;
+  static Type Get(int32_t v) { return static_cast<Type>(v) ^ 0x80000000u; }
+};
+
+template <>
+struct SortKey<int64_t> {
+  using Type = uint64_t;
+  static Type Get(int64_t v) {
+    return static_cast<Type>(v) ^ 0x8000000000000000ull;
+  }
+};
+
+// Rows up to this length are sorted by comparison, longer rows by radix.
+constexpr int64_t kRadixSortThreshold = 256;
+
+// Stable LSD radix sort of keys[0, n) with 8-bit digits, carrying index
+// along. Digits that are equal for all keys are skipped, which makes small
+// integers and values of one sign cheap. Returns the buffer that holds the
+// sorted index, either index or tmp_index.
+template <typename K>
+int64_t* RadixSort(
+    K* keys, int64_t* index, K* tmp_keys, int64_t* tmp_index, int64_t n) {
+  constexpr int kDigits = sizeof(K);
+  int64_t count[kDigits][256] = {};
+  for (int64_t j = 0; j < n; ++j) {
+    auto key = keys[j];
+    for (int d = 0; d < kDigits; ++d) {
+      ++count[d][(key >> (8 * d)) & 0xff];
+    }
+  }
+  for (int d = 0; d < kDigits; ++d) {
+    auto shift = 8 * d;
+    if (count[d][(keys[0] >> shift) & 0xff] == n) {
+      continue;
+    }
+    int64_t offset[256];
+    int64_t sum = 0;
+    for (int b = 0; b < 256; ++b) {
+      offset[b] = sum;
+      sum += count[d][b];
+    }
+    for (int64_t j = 0; j < n; ++j) {
+      auto pos = offset[(keys[j] >> shift) & 0xff]++;
+      tmp_keys[pos] = keys[j];
+      tmp_index[pos] = index[j];
+    }
+    std::swap(keys, tmp_keys);
+    std::swap(index, tmp_index);
+  }
+  return index;
+}
+
+// Sorts one row of n values. Equal values keep their original order.
+template <typename T>
+void SortRow(const T* x, int64_t n, bool descending, T* out, int64_t* indices) {
+  using K = typename SortKey<T>::Type;
+  const K flip = descending ? ~K(0) : K(0);
+  ScratchScope scratch;
+  if (n <= kRadixSortThreshold) {
+    auto* pairs = scratch.Get<std::pair<K, int64_t>>(n);
+    for (int64_t j = 0; j < n; ++j) {
+      pairs[j] = {SortKey<T>::Get(x[j]) ^ flip, j};
+    }
+    std::sort(pairs, pairs + n);
+    for (int64_t j = 0; j < n; ++j) {
+      indices[j] = pairs[j].second;
+      out[j] = x[pairs[j].second];
+    }
+    return;
+  }
+  K* keys = scratch.Get<K>(n);
+  K* tmp_keys = scratch.Get<K>(n);
+  int64_t* index = scratch.Get<int64_t>(n);
+  int64_t* tmp_index = scratch.Get<int64_t>(n);
+  for (int64_t j = 0; j < n; ++j) {
+    keys[j] = SortKey<T>::Get(x[j]) ^ flip;
+    index[j] = j;
+  }
+  const int64_t* sorted = RadixSort(keys, index, tmp_keys, tmp_index, n);
+  for (int64_t j = 0; j < n; ++j) {
+    indices[j] = sorted[j];
+    out[j] = x[sorted[j]];
+  }
+}
+
+// Sorts every row of a contiguous [rows, width] tensor, rows in parallel.
+template <typename T>
+void Argsort(const T* x,
+             int64_t rows,
+             int64_t width,
+             bool descending,
+             T* out,
+             int64_t* indices) {
+  constexpr int64_t kGrainSize = 16384;
+  ParallelFor(0,
+              rows,
+              std::max<int64_t>(1, kGrainSize / std::max<int64_t>(width, 1)),
+              [&](int64_t begin, int64_t end) {
+                for (auto i = begin; i < end; ++i) {
+                  SortRow(x + i * width,
+                          width,
+                          descending,
+                          out + i * width,
+                          indices + i * width);
+                }
+              });
+}
+
+// The k largest (or smallest) of n values, best first. Keys are flipped for
+// largest so that the best element always has the smallest (key, index)
+// pair; ties go to the lower index and NaN counts as the largest value.
+// Small k keeps a bounded heap of the best candidates and rejects most
+// elements with one comparison, larger k selects with nth_element.
+template <typename T>
+void TopKRow(const T* x,
+             int64_t n,
+             int64_t k,
+             bool largest,
+             bool sorted,
+             T* out,
+             int64_t* indices) {
+  using K = typename SortKey<T>::Type;
+  using Pair = std::pair<K, int64_t>;
+  constexpr int64_t kHeapRatio = 16;
+  if (k == 0) {
+    return;
+  }
+  const K flip = largest ? ~K(0) : K(0);
+  ScratchScope scratch;
+  Pair* pairs;
+  if (k * kHeapRatio <= n) {
+    pairs = scratch.Get<Pair>(k);
+    for (int64_t j = 0; j < k; ++j) {
+      pairs[j] = {SortKey<T>::Get(x[j]) ^ flip, j};
+    }
+    // Max-heap: the worst of the current candidates is on top.
+    std::make_heap(pairs, pairs + k);
+    for (int64_t j = k; j < n; ++j) {
+      auto key = SortKey<T>::Get(x[j]) ^ flip;
+      // Later elements lose ties, so only a strictly smaller key gets in.
+      if (key < pairs[0].first) {
+        std::pop_heap(pairs, pairs + k);
+        pairs[k - 1] = {key, j};
+        std::push_heap(pairs, pairs + k);
+      }
+    }
+    std::sort_heap(pairs, pairs + k);
+  } else {
+    pairs = scratch.Get<Pair>(n);
+    for (int64_t j = 0; j < n; ++j) {
+      pairs[j] = {SortKey<T>::Get(x[j]) ^ flip, j};
+    }
+    if (k < n) {
+      std::nth_element(pairs, pairs + k - 1, pairs + n);
+    }
+    if (sorted) {
+      std::sort(pairs, pairs + k);
+    }
+  }
+  for (int64_t j = 0; j < k; ++j) {
+    indices[j] = pairs[j].second;
+    out[j] = x[pairs[j].second];
+  }
+}
+
+// Top k of every row of a contiguous [rows, width] tensor into [rows, k]
+// outputs, rows in parallel.
+template <typename T>
+void TopK(const T* x,
+          int64_t rows,
+          int64_t width,
+          int64_t k,
+          bool largest,
+          bool sorted,
+          T* out,
+          int64_t* indices) {
+  constexpr int64_t kGrainSize = 16384;
+  ParallelFor(0,
+              rows,
+              std::max<int64_t>(1, kGrainSize / std::max<int64_t>(width, 1)),
+              [&](int64_t begin, int64_t end) {
+                for (auto i = begin; i < end; ++i) {
+                  TopKRow(x + i * width,
+                          width,
+                          k,
+                          largest,
+                          sorted,
+                          out + i * k,
+                          indices + i * k);
+                }
+              });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,137 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/strided_offset.h"
+
+namespace custom_kernel {
+
+// Drops size-1 axes and merges every axis into its outer neighbour when
+// both the source and the destination are contiguous across the pair, so
+// that a copy becomes as few and as long runs as possible. Strides are in
+// elements and may be negative.
+inline void CoalesceCopyDims(std::vector<int64_t>* dims,
+                             std::vector<int64_t>* src_strides,
+                             std::vector<int64_t>* dst_strides) {
+  std::vector<int64_t> new_dims, new_src, new_dst;
+  for (size_t i = 0; i < dims->size(); ++i) {
+    auto d = (*dims)[i];
+    if (d == 1) {
+      continue;
+    }
+    auto ss = (*src_strides)[i];
+    auto ds = (*dst_strides)[i];
+    if (!new_dims.empty() && new_src.back() == ss * d &&
+        new_dst.back() == ds * d) {
+      new_dims.back() *= d;
+      new_src.back() = ss;
+      new_dst.back() = ds;
+    } else {
+      new_dims.push_back(d);
+      new_src.push_back(ss);
+      new_dst.push_back(ds);
+    }
+  }
+  if (new_dims.empty()) {
+    new_dims = {1};
+    new_src = {1};
+    new_dst = {1};
+  }
+  *dims = new_dims;
+  *src_strides = new_src;
+  *dst_strides = new_dst;
+}
+
+// dst[sum i_k * dst_strides[k]] = src[sum i_k * src_strides[k]] for every
+// index i of dims. src and dst point at the first element. After
+// coalescing, an innermost axis that is contiguous on both sides is copied
+// with memcpy, any other innermost axis element by element. Long runs are
+// cut into chunks so that a few large copies still spread over the threads.
+template <typename T>
+void StridedCopy(std::vector<int64_t> dims,
+                 std::vector<int64_t> src_strides,
+                 std::vector<int64_t> dst_strides,
+                 const T* src,
+                 T* dst) {
+  for (auto d : dims) {
+    if (d == 0) {
+      return;
+    }
+  }
+  CoalesceCopyDims(&dims, &src_strides, &dst_strides);
+
+  auto inner = dims.back();
+  auto inner_src_stride = src_strides.back();
+  auto inner_dst_stride = dst_strides.back();
+  dims.pop_back();
+  src_strides.pop_back();
+  dst_strides.pop_back();
+  int64_t rows = 1;
+  for (auto d : dims) {
+    rows *= d;
+  }
+  const bool contiguous = inner_src_stride == 1 && inner_dst_stride == 1;
+
+  constexpr int64_t kChunkBytes = 1 << 18;
+  constexpr int64_t kGrainBytes = 1 << 16;
+  auto chunk = std::min(inner, std::max<int64_t>(1, kChunkBytes / sizeof(T)));
+  auto chunks_per_row = (inner + chunk - 1) / chunk;
+  auto grain = std::max<int64_t>(
+      1, kGrainBytes / static_cast<int64_t>(chunk * sizeof(T)));
+
+  ParallelFor(0, rows * chunks_per_row, grain, [&](int64_t begin, int64_t end) {
+    StridedOffset src_row(dims, src_strides);
+    StridedOffset dst_row(dims, dst_strides);
+    auto row = begin / chunks_per_row;
+    src_row.Seek(row);
+    dst_row.Seek(row);
+    for (auto task = begin; task < end; ++task) {
+      if (task / chunks_per_row != row) {
+        row = task / chunks_per_row;
+        src_row.Next();
+        dst_row.Next();
+      }
+      auto first = task % chunks_per_row * chunk;
+      auto len = std::min(chunk, inner - first);
+      const T* s = src + src_row.offset + first * inner_src_stride;
+      T* d = dst + dst_row.offset + first * inner_dst_stride;
+      if (contiguous) {
+        std::memcpy(d, s, len * sizeof(T));
+      } else {
+        for (int64_t j = 0; j < len; ++j) {
+          d[j * inner_dst_stride] = s[j * inner_src_stride];
+        }
+      }
+    }
+  });
+}
+
+// Row-major strides of a contiguous tensor of shape dims, in elements.
+inline std::vector<int64_t> ContiguousStrides(
+    const std::vector<int64_t>& dims) {
+  std::vector<int64_t> strides(dims.size(), 1);
+  for (auto i = static_cast<int64_t>(dims.size()) - 1; i > 0; --i) {
+    strides[i - 1] = strides[i] * dims[i];
+  }
+  return strides;
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,54 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstdint>
+#include <vector>
+
+namespace custom_kernel {
+
+// Walks the offsets of a strided index space in row-major order.
+struct StridedOffset {
+  std::vector<int64_t> dims;
+  std::vector<int64_t> strides;
+  std::vector<int64_t> index;
+  int64_t offset = 0;
+
+  StridedOffset(const std::vector<int64_t>& dims,
+                const std::vector<int64_t>& strides)
+      : dims(dims), strides(strides), index(dims.size(), 0) {}
+
+  void Seek(int64_t linear) {
+    offset = 0;
+    for (auto d = static_cast<int64_t>(dims.size()) - 1; d >= 0; --d) {
+      index[d] = linear % dims[d];
+      linear /= dims[d];
+      offset += index[d] * strides[d];
+    }
+  }
+
+  void Next() {
+    for (auto d = static_cast<int64_t>(dims.size()) - 1; d >= 0; --d) {
+      offset += strides[d];
+      if (++index[d] < dims[d]) {
+        return;
+      }
+      offset -= strides[d] * dims[d];
+      index[d] = 0;
+    }
+  }
+};
+
+}  // namespace custom_kernel
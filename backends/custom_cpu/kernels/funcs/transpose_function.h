@@ -0,0 +1,218 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "kernels/funcs/strided_offset.h"
+
+namespace custom_kernel {
+
+// Drops size-1 axes and folds input axes that stay next to each other in
+// the output, e.g. [B, S, H, D] with axis [0, 2, 3, 1] becomes [B, S, H * D]
+// with axis [0, 2, 1]. dims and axis are updated in place.
+inline void SimplifyPermutation(std::vector<int64_t>* dims,
+                                std::vector<int>* axis) {
+  auto rank = dims->size();
+  // Renumber the input axes that are left after removing size-1 axes.
+  std::vector<int> new_index(rank, -1);
+  std::vector<int64_t> kept_dims;
+  for (size_t i = 0; i < rank; ++i) {
+    if ((*dims)[i] != 1) {
+      new_index[i] = kept_dims.size();
+      kept_dims.push_back((*dims)[i]);
+    }
+  }
+  std::vector<int> kept_axis;
+  for (auto a : *axis) {
+    if (new_index[a] >= 0) {
+      kept_axis.push_back(new_index[a]);
+    }
+  }
+
+  // Output runs of consecutive input axes become a single axis.
+  std::vector<int> run_start;  // first input axis of every output run
+  std::vector<int64_t> run_size;
+  for (size_t j = 0; j < kept_axis.size(); ++j) {
+    if (j > 0 && kept_axis[j] == kept_axis[j - 1] + 1) {
+      run_size.back() *= kept_dims[kept_axis[j]];
+    } else {
+      run_start.push_back(kept_axis[j]);
+      run_size.push_back(kept_dims[kept_axis[j]]);
+    }
+  }
+  // Runs ordered by their position in the input give the new input axes.
+  std::vector<int> order(run_start.size());
+  for (size_t k = 0; k < order.size(); ++k) {
+    order[k] = k;
+  }
+  std::sort(order.begin(), order.end(), [&](int a, int b) {
+    return run_start[a] < run_start[b];
+  });
+  dims->assign(order.size(), 1);
+  axis->assign(order.size(), 0);
+  for (size_t k = 0; k < order.size(); ++k) {
+    (*dims)[k] = run_size[order[k]];
+    (*axis)[order[k]] = k;
+  }
+}
+
+// Copies every output row when the innermost axis is not moved, each row is
+// a contiguous run of the input.
+template <typename T>
+void TransposeRows(const std::vector<int64_t>& dims,
+                   const std::vector<int>& axis,
+                   const std::vector<int64_t>& x_strides,
+                   const T* x,
+                   T* out) {
+  auto rank = dims.size();
+  auto inner = dims.back();
+  std::vector<int64_t> row_dims, row_strides;
+  for (size_t j = 0; j + 1 < rank; ++j) {
+    row_dims.push_back(dims[axis[j]]);
+    row_strides.push_back(x_strides[axis[j]]);
+  }
+  int64_t rows = 1;
+  for (auto d : row_dims) {
+    rows *= d;
+  }
+  constexpr int64_t kGrainSize = 32768;
+  ParallelFor(0,
+              rows,
+              std::max<int64_t>(1, kGrainSize / inner),
+              [&](int64_t row_begin, int64_t row_end) {
+                StridedOffset src(row_dims, row_strides);
+                src.Seek(row_begin);
+                for (auto row = row_begin; row < row_end; ++row, src.Next()) {
+                  std::memcpy(
+                      out + row * inner, x + src.offset, inner * sizeof(T));
+                }
+              });
+}
+
+// General case: the innermost input axis moves to output axis q and the
+// innermost output axis reads input axis p. The (p, last) plane is walked in
+// square tiles so that both the reads and the writes of a tile stay in
+// cache, the remaining axes are batch axes. A plain 2-D or batched 2-D
+// transpose is the case without extra batch axes.
+template <typename T>
+void TransposeTiled(const std::vector<int64_t>& dims,
+                    const std::vector<int>& axis,
+                    const std::vector<int64_t>& x_strides,
+                    const T* x,
+                    T* out) {
+  constexpr int64_t kTile = sizeof(T) >= 8 ? 16 : 32;
+  auto rank = static_cast<int>(dims.size());
+  std::vector<int64_t> out_strides(rank, 1);
+  for (auto j = rank - 1; j > 0; --j) {
+    out_strides[j - 1] = out_strides[j] * dims[axis[j]];
+  }
+  auto p = axis[rank - 1];
+  int q = 0;
+  std::vector<int64_t> batch_dims, batch_x_strides, batch_out_strides;
+  for (int j = 0; j < rank; ++j) {
+    if (axis[j] == rank - 1) {
+      q = j;
+    } else if (axis[j] != p) {
+      batch_dims.push_back(dims[axis[j]]);
+      batch_x_strides.push_back(x_strides[axis[j]]);
+      batch_out_strides.push_back(out_strides[j]);
+    }
+  }
+  auto rows = dims[p];         // output-contiguous axis
+  auto cols = dims[rank - 1];  // input-contiguous axis
+  auto row_stride = x_strides[p];
+  auto col_stride = out_strides[q];
+  auto row_tiles = (rows + kTile - 1) / kTile;
+  auto col_tiles = (cols + kTile - 1) / kTile;
+  auto tiles_per_batch = row_tiles * col_tiles;
+  int64_t num_batches = 1;
+  for (auto d : batch_dims) {
+    num_batches *= d;
+  }
+
+  ParallelFor(0,
+              num_batches * tiles_per_batch,
+              std::max<int64_t>(1, 32768 / (kTile * kTile)),
+              [&](int64_t task_begin, int64_t task_end) {
+                StridedOffset src(batch_dims, batch_x_strides);
+                StridedOffset dst(batch_dims, batch_out_strides);
+                for (auto task = task_begin; task < task_end; ++task) {
+                  auto batch = task / tiles_per_batch;
+                  auto tile = task % tiles_per_batch;
+                  src.Seek(batch);
+                  dst.Seek(batch);
+                  auto r0 = tile / col_tiles * kTile;
+                  auto c0 = tile % col_tiles * kTile;
+                  auto r1 = std::min(rows, r0 + kTile);
+                  auto c1 = std::min(cols, c0 + kTile);
+                  const T* src_tile = x + src.offset;
+                  T* dst_tile = out + dst.offset;
+                  for (auto r = r0; r < r1; ++r) {
+                    const T* src_row = src_tile + r * row_stride;
+                    for (auto c = c0; c < c1; ++c) {
+                      dst_tile[c * col_stride + r] = src_row[c];
+                    }
+                  }
+                }
+              });
+}
+
+// out = transpose(x, axis) for a contiguous x of shape x_dims.
+template <typename T>
+void Transpose(const std::vector<int64_t>& x_dims,
+               const std::vector<int>& axis,
+               const T* x,
+               T* out) {
+  int64_t numel = 1;
+  for (auto d : x_dims) {
+    numel *= d;
+  }
+  if (numel == 0) {
+    return;
+  }
+  auto dims = x_dims;
+  auto perm = axis;
+  SimplifyPermutation(&dims, &perm);
+
+  auto rank = static_cast<int>(dims.size());
+  bool identity = true;
+  for (int j = 0; j < rank; ++j) {
+    identity = identity && perm[j] == j;
+  }
+  if (identity) {
+    constexpr int64_t kGrainSize = 1 << 18;
+    ParallelFor(0, numel, kGrainSize, [&](int64_t begin, int64_t end) {
+      std::memcpy(out + begin, x + begin, (end - begin) * sizeof(T));
+    });
+    return;
+  }
+
+  std::vector<int64_t> x_strides(rank, 1);
+  for (auto i = rank - 1; i > 0; --i) {
+    x_strides[i - 1] = x_strides[i] * dims[i];
+  }
+  if (perm[rank - 1] == rank - 1) {
+    TransposeRows(dims, perm, x_strides, x, out);
+  } else {
+    TransposeTiled(dims, perm, x_strides, x, out);
+  }
+}
+
+}  // namespace custom_kernel
@@ -12,85 +12,105 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/gemm.h"
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
 
 template <typename T>
-void GEMM(bool trans_x,
-          bool trans_y,
-          size_t M,
-          size_t K,
-          size_t N,
-          const T* x,
-          const T* y,
-          T* out,
-          bool trans_out = false) {
-  memset(out, 0, M * N * sizeof(T));
-  for (size_t m = 0; m < M; ++m) {
-    for (size_t n = 0; n < N; ++n) {
-      auto* out_data = trans_out ? &out[n * M + m] : &out[m * N + n];
-      for (size_t k = 0; k < K; ++k) {
-        auto x_dat = trans_x ? x[k * M + m] : x[m * K + k];
-        auto y_dat = trans_y ? y[n * K + k] : y[k * N + n];
-        *out_data += x_dat * y_dat;
-      }
-    }
+struct GemmAccType {
+  using type = T;
+};
+
+template <>
+struct GemmAccType<phi::dtype::float16> {
+  using type = float;
+};
+
+// Shape of a matmul operand seen as a batch of matrices. A 1-D x is a
+// [1, K] row vector and a 1-D y is a [K, 1] column vector.
+struct MatmulOperand {
+  std::vector<int64_t> batch_dims;
+  int64_t rows;
+  int64_t cols;
+};
+
+static inline MatmulOperand GetMatmulOperand(const std::vector<int64_t>& dims,
+                                             bool is_x) {
+  auto ndim = dims.size();
+  if (ndim == 1) {
+    return is_x ? MatmulOperand{{}, 1, dims[0]} : MatmulOperand{{}, dims[0], 1};
   }
+  return MatmulOperand{std::vector<int64_t>(dims.cbegin(), dims.cend() - 2),
+                       dims[ndim - 2],
+                       dims[ndim - 1]};
 }
 
-template <typename T>
-void BatchedGEMM(bool trans_x,
-                 bool trans_y,
-                 size_t M,
-                 size_t K,
-                 size_t N,
-                 const T* x,
-                 const T* y,
-                 T* out,
-                 size_t batch_size,
-                 bool x_is_larger,
-                 bool trans_out = false,
-                 bool bs_flag = false,
-                 bool reduce_bs = false,
-                 float alpha = 1.0) {
-  memset(out, 0, sizeof(T) * (reduce_bs ? M * N : batch_size * M * N));
-  if (x_is_larger) {
-    for (size_t bs = 0; bs < batch_size; ++bs) {
-      for (size_t m = 0; m < M; ++m) {
-        for (size_t n = 0; n < N; ++n) {
-          auto out_bs = reduce_bs ? 0 : bs * M * N;
-          auto* out_data =
-              trans_out ? &out[out_bs + n * M + m] : &out[out_bs + m * N + n];
-          for (size_t k = 0; k < K; ++k) {
-            auto x_dat =
-                trans_x ? x[bs * M * K + k * M + m] : x[bs * M * K + m * K + k];
-            auto y_bs = bs_flag ? bs * N * K : 0;
-            auto y_dat = trans_y ? y[y_bs + n * K + k] : y[y_bs + k * N + n];
-            *out_data += static_cast<T>(alpha) * (x_dat * y_dat);
-          }
-        }
-      }
+// Broadcasts the batch dimensions of x and y with NumPy rules.
+static inline std::vector<int64_t> BroadcastBatchDims(
+    const std::vector<int64_t>& x_batch, const std::vector<int64_t>& y_batch) {
+  auto ndim = std::max(x_batch.size(), y_batch.size());
+  std::vector<int64_t> out_batch(ndim, 1);
+  for (size_t i = 0; i < ndim; ++i) {
+    auto x_dim =
+        i < ndim - x_batch.size() ? 1 : x_batch[i - (ndim - x_batch.size())];
+    auto y_dim =
+        i < ndim - y_batch.size() ? 1 : y_batch[i - (ndim - y_batch.size())];
+    PD_CHECK(x_dim == y_dim || x_dim == 1 || y_dim == 1,
+             "The batch dimensions of Input(X) and Input(Y) can not be "
+             "broadcast, received X's batch dim %d and Y's batch dim %d.",
+             x_dim,
+             y_dim);
+    out_batch[i] = x_dim == 1 ? y_dim : x_dim;
+  }
+  return out_batch;
+}
+
+// Base offsets of x, y and out for every matrix of the broadcast batch. They
+// are computed once per matrix instead of once per multiply-add.
+static inline std::vector<gemm::BatchOffset> GetBatchOffsets(
+    const std::vector<int64_t>& x_batch,
+    const std::vector<int64_t>& y_batch,
+    const std::vector<int64_t>& out_batch,
+    int64_t x_size,
+    int64_t y_size,
+    int64_t out_size) {
+  auto ndim = out_batch.size();
+  std::vector<int64_t> x_strides(ndim, 0), y_strides(ndim, 0);
+  int64_t x_stride = x_size, y_stride = y_size;
+  for (size_t i = 0; i < ndim; ++i) {
+    auto dim = ndim - 1 - i;
+    if (i < x_batch.size()) {
+      auto x_dim = x_batch[x_batch.size() - 1 - i];
+      x_strides[dim] = x_dim == 1 ? 0 : x_stride;
+      x_stride *= x_dim;
     }
-  } else {
-    for (size_t bs = 0; bs < batch_size; ++bs) {
-      for (size_t m = 0; m < M; ++m) {
-        for (size_t n = 0; n < N; ++n) {
-          auto out_bs = reduce_bs ? 0 : bs * M * N;
-          auto* out_data =
-              trans_out ? &out[out_bs + n * M + m] : &out[out_bs + m * N + n];
-          for (size_t k = 0; k < K; ++k) {
-            auto y_dat =
-                trans_y ? y[bs * K * N + n * K + k] : y[bs * K * N + k * N + n];
-            auto x_bs = bs_flag ? bs * M * K : 0;
-            auto x_dat = trans_x ? x[x_bs + k * M + m] : x[x_bs + m * K + k];
-            *out_data += static_cast<T>(alpha) * (x_dat * y_dat);
-          }
-        }
+    if (i < y_batch.size()) {
+      auto y_dim = y_batch[y_batch.size() - 1 - i];
+      y_strides[dim] = y_dim == 1 ? 0 : y_stride;
+      y_stride *= y_dim;
+    }
+  }
+
+  auto batch_size = phi::product(out_batch);
+  std::vector<gemm::BatchOffset> offsets(batch_size);
+  std::vector<int64_t> index(ndim, 0);
+  int64_t x_offset = 0, y_offset = 0;
+  for (int64_t i = 0; i < batch_size; ++i) {
+    offsets[i] = gemm::BatchOffset{x_offset, y_offset, i * out_size};
+    for (auto dim = static_cast<int64_t>(ndim) - 1; dim >= 0; --dim) {
+      x_offset += x_strides[dim];
+      y_offset += y_strides[dim];
+      if (++index[dim] < out_batch[dim]) {
+        break;
       }
+      x_offset -= x_strides[dim] * out_batch[dim];
+      y_offset -= y_strides[dim] * out_batch[dim];
+      index[dim] = 0;
     }
   }
+  return offsets;
 }
 
 template <typename T>
@@ -100,198 +120,72 @@ void MatmulKernel(const phi::Context& dev_ctx,
                   bool transpose_x,
                   bool transpose_y,
                   phi::DenseTensor* out) {
+  using AccT = typename GemmAccType<T>::type;
   auto x_dims = x.dims();
   auto y_dims = y.dims();
-  auto x_data = x.data<T>();
-  auto y_data = y.data<T>();
   auto x_ndim = x_dims.size();
   auto y_ndim = y_dims.size();
+  PD_CHECK(x_ndim > 0 && y_ndim > 0,
+           "The Input(X) and Input(Y) of matmul must not be 0-D tensors.");
+  if (x_ndim == 1) {
+    transpose_x = false;
+  }
+  if (y_ndim == 1) {
+    transpose_y = false;
+  }
 
-  if (x_ndim == 1 && y_ndim == 1) {
-    auto M = x.numel();
-    auto N = y.numel();
-    PD_CHECK(M == N, "M must be equal to N.");
-    out->Resize({1});
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    GEMM(false, false, 1, M, 1, x.data<T>(), y.data<T>(), out_data);
-    return;
-  } else if (x_ndim == 1) {
-    auto M = 1;
-    auto K = x.numel();
-    auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-    if (transpose_y) {
-      PD_CHECK(K == y_dims[y_ndim - 1],
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               y_ndim - 1,
-               K,
-               y_ndim - 1,
-               y_dims[y_ndim - 1]);
-    } else {
-      PD_CHECK(K == y_dims[y_ndim - 2],
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               y_ndim - 2,
-               K,
-               y_ndim - 2,
-               y_dims[y_ndim - 2]);
-    }
-    std::vector<int64_t> out_dims(y_ndim - 1);
-    if (transpose_y) {
-      std::copy_n(y_dims.cbegin(), y_ndim - 1, out_dims.begin());
-    } else {
-      std::copy_n(y_dims.cbegin(), y_ndim - 2, out_dims.begin());
-      out_dims.back() = y_dims.back();
-    }
-    out->Resize(out_dims);
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    if (y_ndim == 2) {
-      GEMM(false, transpose_y, M, K, N, x_data, y_data, out_data);
-    } else {
-      BatchedGEMM(false,
-                  transpose_y,
-                  M,
-                  K,
-                  N,
-                  x_data,
-                  y_data,
-                  out_data,
-                  y_dims[0],
-                  false);
-    }
-    return;
-  } else if (y_ndim == 1) {
-    auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-    auto K = y.numel();
-    auto N = 1;
-    if (!transpose_x) {
-      PD_CHECK(K == x_dims[x_ndim - 1],
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               x_ndim - 1,
-               K,
-               x_ndim - 1,
-               x_dims[x_ndim - 1]);
-    } else {
-      PD_CHECK(K == x_dims[x_ndim - 2],
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               x_ndim - 2,
-               K,
-               x_ndim - 2,
-               x_dims[x_ndim - 2]);
-    }
-    std::vector<int64_t> out_dims(x_ndim - 1);
-    if (!transpose_x) {
-      std::copy_n(x_dims.cbegin(), x_ndim - 1, out_dims.begin());
-    } else {
-      std::copy_n(x_dims.cbegin(), x_ndim - 2, out_dims.begin());
-      out_dims.back() = x_dims.back();
-    }
-    out->Resize(out_dims);
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    if (x_ndim == 2) {
-      GEMM(transpose_x, false, M, K, N, x_data, y_data, out_data);
-    } else {
-      BatchedGEMM(transpose_x,
-                  false,
-                  M,
-                  K,
-                  N,
-                  x_data,
-                  y_data,
-                  out_data,
-                  x_dims[0],
-                  true);
-    }
+  auto x_op = GetMatmulOperand(x_dims, true);
+  auto y_op = GetMatmulOperand(y_dims, false);
+  auto M = transpose_x ? x_op.cols : x_op.rows;
+  auto K = transpose_x ? x_op.rows : x_op.cols;
+  auto N = transpose_y ? y_op.rows : y_op.cols;
+  auto y_K = transpose_y ? y_op.cols : y_op.rows;
+  PD_CHECK(K == y_K,
+           "Input(X) and Input(Y) has error dim."
+           "X's reduction dim must be equal to Y's reduction dim "
+           "But received %d and %d",
+           K,
+           y_K);
+
+  auto out_batch = BroadcastBatchDims(x_op.batch_dims, y_op.batch_dims);
+  std::vector<int64_t> out_dims = out_batch;
+  if (x_ndim > 1) {
+    out_dims.push_back(M);
+  }
+  if (y_ndim > 1) {
+    out_dims.push_back(N);
+  }
+  if (out_dims.empty()) {
+    out_dims.push_back(1);
+  }
+  out->Resize(out_dims);
+  auto out_data = dev_ctx.template Alloc<T>(out);
+  if (out->numel() == 0) {
     return;
   }
 
-  if (x_ndim == 2 && y_ndim == 2) {
-    auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-    auto K = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-    auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-    std::vector<int64_t> out_dims({M, N});
-    out->Resize(out_dims);
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    GEMM(transpose_x, transpose_y, M, K, N, x_data, y_data, out_data);
-  } else if (x_ndim == 3) {
-    auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-    auto K = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-    auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-    if (transpose_y) {
-      PD_CHECK(y_dims[y_ndim - 1] == K,
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               y_ndim - 1,
-               K,
-               y_ndim - 1,
-               y_dims[y_ndim - 1]);
-    } else {
-      PD_CHECK(y_dims[y_ndim - 2] == K,
-               "Input(Y) has error dim."
-               "Y'dims[%d] must be equal to %d"
-               "But received Y'dims[%d] is %d",
-               y_ndim - 2,
-               K,
-               y_ndim - 2,
-               y_dims[y_ndim - 2]);
-    }
-    std::vector<int64_t> out_dims({x_dims[0], M, N});
-    out->Resize(out_dims);
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    BatchedGEMM(transpose_x,
-                transpose_y,
-                M,
-                K,
-                N,
-                x_data,
-                y_data,
-                out_data,
-                x_dims[0],
-                true);
-  } else if (y_ndim == 3) {
-    auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-    auto K = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-    auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-    if (!transpose_x) {
-      PD_CHECK(x_dims[x_ndim - 1] == K,
-               "Input(X) has error dim."
-               "X'dims[%d] must be equal to %d"
-               "But received X'dims[%d] is %d",
-               x_ndim - 1,
-               K,
-               x_ndim - 1,
-               x_dims[x_ndim - 1]);
-    } else {
-      PD_CHECK(x_dims[x_ndim - 2] == K,
-               "Input(X) has error dim."
-               "X'dims[%d] must be equal to %d"
-               "But received X'dims[%d] is %d",
-               x_ndim - 2,
-               K,
-               x_ndim - 2,
-               x_dims[y_ndim - 2]);
-    }
-    std::vector<int64_t> out_dims({y_dims[0], M, N});
-    out->Resize(out_dims);
-    auto out_data = dev_ctx.template Alloc<T>(out);
-    BatchedGEMM(transpose_x,
-                transpose_y,
-                M,
-                K,
-                N,
-                x_data,
-                y_data,
-                out_data,
-                y_dims[0],
-                false);
+  auto x_data = x.data<T>();
+  auto y_data = y.data<T>();
+  auto x_mat = transpose_x ? gemm::MatrixRef<T>{x_data, 1, M}
+                           : gemm::MatrixRef<T>{x_data, K, 1};
+  auto y_mat = transpose_y ? gemm::MatrixRef<T>{y_data, 1, K}
+                           : gemm::MatrixRef<T>{y_data, N, 1};
+  auto alpha = static_cast<AccT>(1);
+
+  // A batch of x multiplied by a single y is one tall GEMM when the rows of
+  // all x matrices are contiguous.
+  auto y_batch_size = phi::product(y_op.batch_dims);
+  if (y_batch_size == 1 && !transpose_x) {
+    auto rows = phi::product(out_batch) * M;
+    gemm::Gemm<T, AccT>(
+        rows, N, K, alpha, x_mat, y_mat, static_cast<AccT>(0), out_data, N, 1);
+    return;
   }
+
+  auto offsets = GetBatchOffsets(
+      x_op.batch_dims, y_op.batch_dims, out_batch, M * K, K * N, M * N);
+  gemm::BatchedGemm<T, AccT>(
+      M, N, K, alpha, x_mat, y_mat, out_data, N, 1, std::move(offsets));
 }
 
 template <typename T>
@@ -303,237 +197,84 @@ void MatmulGradKernel(const phi::Context& dev_ctx,
                       bool transpose_y,
                       phi::DenseTensor* dx,
                       phi::DenseTensor* dy) {
+  using AccT = typename GemmAccType<T>::type;
   auto x_dims = x.dims();
   auto y_dims = y.dims();
-  auto dout_dims = out_grad.dims();
+  if (x_dims.size() == 1) {
+    transpose_x = false;
+  }
+  if (y_dims.size() == 1) {
+    transpose_y = false;
+  }
 
-  int x_ndim = x_dims.size();
-  int y_ndim = y_dims.size();
-  int ndim = dout_dims.size();
+  auto x_op = GetMatmulOperand(x_dims, true);
+  auto y_op = GetMatmulOperand(y_dims, false);
+  auto M = transpose_x ? x_op.cols : x_op.rows;
+  auto K = transpose_x ? x_op.rows : x_op.cols;
+  auto N = transpose_y ? y_op.rows : y_op.cols;
+  auto out_batch = BroadcastBatchDims(x_op.batch_dims, y_op.batch_dims);
+  auto offsets = GetBatchOffsets(
+      x_op.batch_dims, y_op.batch_dims, out_batch, M * K, K * N, M * N);
 
   auto x_data = x.data<T>();
   auto y_data = y.data<T>();
   auto out_grad_data = out_grad.data<T>();
-  auto dx_data = static_cast<T*>(nullptr);
-  auto dy_data = static_cast<T*>(nullptr);
-
-  if (dx) dx_data = dev_ctx.template Alloc<T>(dx);
-  if (dy) dy_data = dev_ctx.template Alloc<T>(dy);
+  auto alpha = static_cast<AccT>(1);
+  gemm::MatrixRef<T> dout_mat{out_grad_data, N, 1};
 
-  if (x_ndim == 1 && y_ndim == 1) {
-    if (out_grad.numel() == 1) {
-      auto M = 1;
-      auto K = 1;
-      auto N = x.numel();
-      if (dx) {
-        GEMM(false, false, M, K, N, out_grad_data, y_data, dx_data);
+  // Batch entries of x (or y) that were broadcast in forward write to the
+  // same gradient matrix and are summed up by BatchedGemm.
+  if (dx) {
+    auto dx_data = dev_ctx.template Alloc<T>(dx);
+    if (dx->numel() > 0) {
+      std::vector<gemm::BatchOffset> dx_offsets(offsets.size());
+      for (size_t i = 0; i < offsets.size(); ++i) {
+        dx_offsets[i] = {offsets[i].c, offsets[i].b, offsets[i].a};
       }
-      if (dy) {
-        GEMM(false, false, M, K, N, out_grad_data, x_data, dy_data);
-      }
-      return;
-    }
-  } else if (x_ndim == 1) {
-    // dx = dout' * y
-    // dy = x * dout'
-    if (dx) {
-      auto M = 1;
-      auto K = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      auto N = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-      if (y_ndim == 2) {
-        GEMM(false, !transpose_y, M, K, N, out_grad_data, y_data, dx_data);
-      } else {
-        BatchedGEMM(false,
-                    !transpose_y,
-                    M,
-                    K,
-                    N,
-                    out_grad_data,
-                    y_data,
-                    dx_data,
-                    y_dims[0],
-                    false,
-                    false,
-                    true,
-                    true);
-      }
-    }
-    if (dy) {
-      auto M = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-      auto K = 1;
-      auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      if (y_ndim == 2) {
-        GEMM(
-            false, false, M, K, N, x_data, out_grad_data, dy_data, transpose_y);
+      if (M * N == 0) {
+        memset(dx_data, 0, dx->numel() * sizeof(T));
       } else {
-        BatchedGEMM(false,
-                    false,
-                    M,
-                    K,
-                    N,
-                    x_data,
-                    out_grad_data,
-                    dy_data,
-                    y_dims[0],
-                    false,
-                    transpose_y);
+        // dx = dout * y'
+        auto y_t = transpose_y ? gemm::MatrixRef<T>{y_data, K, 1}
+                               : gemm::MatrixRef<T>{y_data, 1, N};
+        gemm::BatchedGemm<T, AccT>(M,
+                                   K,
+                                   N,
+                                   alpha,
+                                   dout_mat,
+                                   y_t,
+                                   dx_data,
+                                   transpose_x ? 1 : K,
+                                   transpose_x ? M : 1,
+                                   std::move(dx_offsets));
       }
     }
-    return;
-  } else if (y_ndim == 1) {
-    // dx = dout * y'
-    if (dx) {
-      auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto K = 1;
-      auto N = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-      if (x_ndim == 2) {
-        GEMM(
-            false, false, M, K, N, out_grad_data, y_data, dx_data, transpose_x);
-      } else {
-        BatchedGEMM(false,
-                    false,
-                    M,
-                    K,
-                    N,
-                    out_grad_data,
-                    y_data,
-                    dx_data,
-                    x_dims[0],
-                    true,
-                    transpose_x);
+  }
+  if (dy) {
+    auto dy_data = dev_ctx.template Alloc<T>(dy);
+    if (dy->numel() > 0) {
+      std::vector<gemm::BatchOffset> dy_offsets(offsets.size());
+      for (size_t i = 0; i < offsets.size(); ++i) {
+        dy_offsets[i] = {offsets[i].a, offsets[i].c, offsets[i].b};
       }
-    }
-    // dy = x' * dout
-    if (dy) {
-      auto M = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-      auto K = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto N = 1;
-      if (x_ndim == 2) {
-        GEMM(!transpose_x, false, M, K, N, x_data, out_grad_data, dy_data);
+      if (M * N == 0) {
+        memset(dy_data, 0, dy->numel() * sizeof(T));
       } else {
-        BatchedGEMM(!transpose_x,
-                    false,
-                    M,
-                    K,
-                    N,
-                    x_data,
-                    out_grad_data,
-                    dy_data,
-                    x_dims[0],
-                    true,
-                    false,
-                    true,
-                    true);
+        // dy = x' * dout
+        auto x_t = transpose_x ? gemm::MatrixRef<T>{x_data, M, 1}
+                               : gemm::MatrixRef<T>{x_data, 1, K};
+        gemm::BatchedGemm<T, AccT>(K,
+                                   N,
+                                   M,
+                                   alpha,
+                                   x_t,
+                                   dout_mat,
+                                   dy_data,
+                                   transpose_y ? 1 : N,
+                                   transpose_y ? K : 1,
+                                   std::move(dy_offsets));
       }
     }
-
-    return;
-  }
-
-  if (x_ndim == 2 && y_ndim == 2) {
-    // dx = dout * y'
-    if (dx) {
-      auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto K = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      auto N = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-      GEMM(false,
-           !transpose_y,
-           M,
-           K,
-           N,
-           out_grad_data,
-           y_data,
-           dx_data,
-           transpose_x);
-    }
-    // dy = x' * dout
-    if (dy) {
-      auto M = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-      auto K = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      GEMM(!transpose_x,
-           false,
-           M,
-           K,
-           N,
-           x_data,
-           out_grad_data,
-           dy_data,
-           transpose_y);
-    }
-    return;
-  } else if (x_ndim == 2) {
-    // dx = dout * y'
-    if (dx) {
-      auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto K = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      auto N = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-      BatchedGEMM(false,
-                  !transpose_y,
-                  M,
-                  K,
-                  N,
-                  out_grad_data,
-                  y_data,
-                  dx_data,
-                  y_dims[0],
-                  false,
-                  transpose_x,
-                  true,
-                  true);
-    }
-    // dy = x' * dout
-    if (dy) {
-      auto M = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-      auto K = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      BatchedGEMM(!transpose_x,
-                  false,
-                  M,
-                  K,
-                  N,
-                  x_data,
-                  out_grad_data,
-                  dy_data,
-                  y_dims[0],
-                  false,
-                  transpose_y);
-    }
-    return;
-  } else if (y_ndim == 2) {
-    // dx = dout * y'
-    if (dx) {
-      auto M = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto K = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      auto N = transpose_x ? x_dims[x_ndim - 2] : x_dims[x_ndim - 1];
-      BatchedGEMM(false,
-                  !transpose_y,
-                  M,
-                  K,
-                  N,
-                  out_grad_data,
-                  y_data,
-                  dx_data,
-                  x_dims[0],
-                  true,
-                  transpose_x);
-    }
-    // dy = x' * dout
-    if (dy) {
-      auto M = transpose_y ? y_dims[y_ndim - 1] : y_dims[y_ndim - 2];
-      auto K = transpose_x ? x_dims[x_ndim - 1] : x_dims[x_ndim - 2];
-      auto N = transpose_y ? y_dims[y_ndim - 2] : y_dims[y_ndim - 1];
-      GEMM(!transpose_x,
-           false,
-           M,
-           K * x_dims[0],
-           N,
-           x_data,
-           out_grad_data,
-           dy_data,
-           transpose_y);
-    }
-    return;
   }
 }
 
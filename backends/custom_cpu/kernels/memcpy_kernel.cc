@@ -14,6 +14,7 @@
 
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/zero_copy.h"
 
 namespace custom_kernel {
 
@@ -22,6 +23,11 @@ void MemcpyD2HKernel(const phi::Context& dev_ctx,
                      const phi::DenseTensor& x,
                      int dst_place_type,
                      phi::DenseTensor* out) {
+  if (custom_cpu::ZeroCopyEnabled()) {
+    out->ShareDataWith(x);
+    custom_cpu::SharedBuffers::Instance().Add(x.data<T>(), x.memory_size());
+    return;
+  }
   auto out_data = dev_ctx.HostAlloc<T>(out);
   auto x_data = x.data<T>();
   memcpy(out_data, x_data, x.memory_size());
@@ -32,6 +38,10 @@ void MemcpyH2DKernel(const phi::Context& dev_ctx,
                      const phi::DenseTensor& x,
                      int dst_place_type,
                      phi::DenseTensor* out) {
+  if (custom_cpu::ZeroCopyEnabled()) {
+    out->ShareDataWith(x);
+    return;
+  }
   auto out_data = dev_ctx.Alloc<T>(out);
   auto x_data = x.data<T>();
   memcpy(out_data, x_data, x.memory_size());
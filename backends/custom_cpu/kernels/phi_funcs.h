@@ -103,24 +103,24 @@ static inline int CanonicalAxis(const int axis, const int rank) {
   return axis;
 }
 
-static inline int SizeToAxis(const int axis, std::vector<int64_t> dims) {
-  int size = 1;
+static inline int64_t SizeToAxis(const int axis, std::vector<int64_t> dims) {
+  int64_t size = 1;
   for (int i = 0; i < axis; i++) {
     size *= dims[i];
   }
   return size;
 }
 
-static inline int SizeFromAxis(const int axis, std::vector<int64_t> dims) {
-  int size = 1;
+static inline int64_t SizeFromAxis(const int axis, std::vector<int64_t> dims) {
+  int64_t size = 1;
   for (int i = axis; i < dims.size(); i++) {
     size *= dims[i];
   }
   return size;
 }
 
-static inline int SizeOutAxis(const int axis, std::vector<int64_t> dims) {
-  int size = 1;
+static inline int64_t SizeOutAxis(const int axis, std::vector<int64_t> dims) {
+  int64_t size = 1;
   for (int i = axis + 1; i < dims.size(); i++) {
     size *= dims[i];
   }
@@ -258,80 +258,6 @@ inline std::vector<int64_t> GetDecreasedDims(
 
 }  // namespace funcs
 
-template <typename T>
-static inline void BroadcastTo(const phi::Context& dev_ctx,
-                               const phi::DenseTensor& in,
-                               std::vector<int64_t> out_dims,
-                               int axis,
-                               phi::DenseTensor* out) {
-  auto in_dims = in.dims();
-
-  if (in_dims.size() == out_dims.size()) {
-    bool broadcast = false;
-    for (auto i = 0; i < in_dims.size(); ++i) {
-      if (in_dims[i] != out_dims[i]) {
-        broadcast = true;
-        break;
-      }
-    }
-    if (!broadcast) {
-      out->ShareDataWith(in);
-      return;
-    }
-  }
-
-  out->Resize(out_dims);
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto in_data = in.data<T>();
-
-  axis = axis == -1 ? std::abs(static_cast<int>(in_dims.size()) -
-                               static_cast<int>(out_dims.size()))
-                    : axis;
-  auto retain = static_cast<int>(out_dims.size()) - axis -
-                static_cast<int>(in_dims.size());
-  std::vector<size_t> tmp_dims;
-  for (auto i = 0; i < axis; ++i) {
-    tmp_dims.push_back(1);
-  }
-  tmp_dims.insert(tmp_dims.end(), in_dims.cbegin(), in_dims.cend());
-  for (auto i = 0; i < retain; ++i) {
-    tmp_dims.push_back(1);
-  }
-
-  auto numel = out->numel();
-  std::vector<size_t> index(out_dims.size(), 0);
-  std::vector<size_t> in_step(tmp_dims.size(), 1);
-  std::vector<size_t> out_step(out_dims.size(), 1);
-  for (auto i = tmp_dims.size() - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * tmp_dims[i];
-  }
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    out_step[i - 1] = out_step[i] * out_dims[i];
-  }
-
-  for (auto i = 0; i < numel; ++i) {
-    auto src_index = index;
-    for (auto j = 0; j < tmp_dims.size(); ++j) {
-      if (tmp_dims[j] == 1) {
-        src_index[j] = 0;
-      }
-    }
-
-    out_data[phi::vec_product(index, out_step)] =
-        in_data[phi::vec_product(src_index, in_step)];
-
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= out_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
-}
-
 static inline std::vector<int64_t> BroadcastDims(
     int axis,
     const std::vector<int64_t>& x_dims,
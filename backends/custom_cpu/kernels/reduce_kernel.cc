@@ -13,69 +13,50 @@
 // limitations under the License.
 
 #include <cmath>
+#include <vector>
 
+#include "kernels/funcs/reduce_function.h"
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
 
-template <typename T>
-void MeanRawKernel(const phi::Context& dev_ctx,
-                   const phi::DenseTensor& x,
-                   const phi::IntArray& dims,
-                   bool keep_dim,
-                   bool reduce_all,
-                   phi::DenseTensor* out) {
+template <typename T, typename Reducer>
+void ReduceKernelImpl(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& x,
+                      const phi::IntArray& dims,
+                      bool reduce_all,
+                      phi::DenseTensor* out) {
   auto x_dims = x.dims();
   auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
+  if (reduce_dims.size() == 0) {
+    reduce_all = true;
   }
-  for (auto& d : reduce_dims) {
+  std::vector<bool> reduced(x_dims.size(), reduce_all);
+  for (auto d : reduce_dims) {
     // handle negative dims, f.e. "-1" means rightmost dimension
     if (d < 0) {
       d = d + x_dims.size();
     }
+    PD_CHECK(d >= 0 && d < static_cast<int64_t>(x_dims.size()),
+             "The reduce dim index %d is out of range of the input rank %d.",
+             d,
+             x_dims.size());
+    reduced[d] = true;
   }
   auto x_data = x.data<T>();
   auto out_data = dev_ctx.template Alloc<T>(out);
+  Reduce<T, Reducer>(x_dims, reduced, x_data, out_data);
+}
 
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  memset(out_data, 0, sizeof(T) * out->numel());
-  size_t reduce_numel = 1;
-  for (auto d : reduce_dims) {
-    reduce_numel *= x_dims[d];
-  }
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)] / reduce_numel;
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+template <typename T>
+void MeanRawKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   const phi::IntArray& dims,
+                   bool keep_dim,
+                   bool reduce_all,
+                   phi::DenseTensor* out) {
+  ReduceKernelImpl<T, MeanReducer<T>>(dev_ctx, x, dims, reduce_all, out);
 }
 
 template <typename T>
@@ -99,57 +80,7 @@ void SumRawKernel(const phi::Context& dev_ctx,
                   bool reduce_all,
                   phi::DataType out_dtype,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
-  }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-
-  memset(out_data, 0, sizeof(T) * out->numel());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)];
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  ReduceKernelImpl<T, SumReducer<T>>(dev_ctx, x, dims, reduce_all, out);
 }
 
 template <typename T>
@@ -173,57 +104,7 @@ void MinRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
-  }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(out_data, out_data + out->numel(), std::numeric_limits<T>::max());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::min(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  ReduceKernelImpl<T, MinReducer<T>>(dev_ctx, x, dims, reduce_all, out);
 }
 
 template <typename T>
@@ -246,54 +127,7 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(
-      out_data, out_data + out->numel(), std::numeric_limits<T>::lowest());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::max(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  ReduceKernelImpl<T, MaxReducer<T>>(dev_ctx, x, dims, reduce_all, out);
 }
 
 template <typename T>
@@ -12,6 +12,7 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -41,8 +42,9 @@ void SGDDenseKernel(const phi::Context& dev_ctx,
                     bool multi_precision,
                     phi::DenseTensor* param_out,
                     phi::DenseTensor* master_param_out) {
-  dev_ctx.template Alloc<T>(param_out);
-  sgd_dense_param_dense_grad_impl<T>(param, learning_rate, grad, param_out);
+  phi::DenseTensor param_src;
+  AllocInplace<T>(dev_ctx, param, param_out, &param_src);
+  sgd_dense_param_dense_grad_impl<T>(param_src, learning_rate, grad, param_out);
 }
 }  // namespace custom_kernel
 
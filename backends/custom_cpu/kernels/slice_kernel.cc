@@ -12,6 +12,10 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <algorithm>
+#include <vector>
+
+#include "kernels/funcs/strided_copy.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
 
@@ -37,7 +41,6 @@ void SliceRawKernel(const phi::Context& ctx,
   // Step 2: Compute output
   auto in = &input;
   auto in_data = input.data<T>();
-  int rank = input.dims().size();
 
   auto in_dims = in->dims();
   auto out_dims = out->dims();
@@ -60,41 +63,19 @@ void SliceRawKernel(const phi::Context& ctx,
   out_dims = phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axis);
 
   // 2.2 Get output
-  auto offsets = std::vector<size_t>(rank);
-  auto extents = std::vector<size_t>(rank);
-
-  for (size_t i = 0; i < rank; ++i) {
-    offsets[i] = 0;
-    extents[i] = slice_dims[i];
-  }
-  for (size_t i = 0; i < axes.size(); ++i) {
-    offsets[axes[i]] = starts[i];
-  }
-
   out->Resize(slice_dims);
   auto out_data = ctx.template Alloc<T>(out);
 
-  std::vector<size_t> in_step(rank, 1);
-  for (auto i = rank - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * in_dims[i];
-  }
-
-  auto numel = phi::product(slice_dims);
-  auto index = std::vector<size_t>(offsets.cbegin(), offsets.cend());
-  for (auto i = 0; i < numel; i += slice_dims.back()) {
-    memcpy(out_data + i,
-           in_data + phi::vec_product(index, in_step),
-           sizeof(T) * slice_dims.back());
-    index[index.size() - 2]++;
-    for (auto j = index.size() - 2; j > 0; --j) {
-      if (index[j] >= offsets[j] + extents[j]) {
-        index[j] = offsets[j];
-        index[j - 1] += 1;
-      } else {
-        break;
-      }
-    }
+  auto in_strides = ContiguousStrides(in_dims);
+  int64_t in_offset = 0;
+  for (size_t i = 0; i < axes.size(); ++i) {
+    in_offset += starts[i] * in_strides[axes[i]];
   }
+  StridedCopy(slice_dims,
+              in_strides,
+              ContiguousStrides(slice_dims),
+              in_data + in_offset,
+              out_data);
   out->Resize(out_dims);
 }
 
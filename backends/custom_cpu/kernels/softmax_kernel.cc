@@ -12,46 +12,13 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/inplace.h"
+#include "kernels/funcs/softmax_function.h"
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
 
-template <typename T>
-T ValueClip(const T& x) {
-  const T kThreshold = static_cast<T>(-64.);
-  return x < kThreshold ? kThreshold : x;
-}
-
-template <typename T>
-void Softmax(int axis_dim, const T* in, T* out, size_t M, size_t N) {
-  auto remain = N / axis_dim;
-
-  for (size_t i = 0; i < M; ++i) {
-    for (size_t k = 0; k < remain; ++k) {
-      T max_val = in[i * N + k];
-      for (size_t j = 0; j < axis_dim; ++j) {
-        max_val = std::max(max_val, in[i * N + j * remain + k]);
-      }
-
-      auto exps = new T[axis_dim];
-      for (size_t j = 0; j < axis_dim; ++j) {
-        exps[j] = std::exp(ValueClip(in[i * N + j * remain + k] - max_val));
-      }
-
-      T sum = 0;
-      for (size_t j = 0; j < axis_dim; ++j) {
-        sum += exps[j];
-      }
-
-      for (size_t j = 0; j < axis_dim; ++j) {
-        out[i * N + j * remain + k] = exps[j] / sum;
-      }
-      delete[] exps;
-    }
-  }
-}
-
 template <typename T>
 void SoftmaxKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
@@ -59,9 +26,10 @@ void SoftmaxKernel(const phi::Context& dev_ctx,
                    phi::DenseTensor* out) {
   const int rank = x.dims().size();
   const int calc_axis = phi::funcs::CanonicalAxis(axis, rank);
-  int axis_dim = x.dims()[calc_axis];
+  int64_t axis_dim = x.dims()[calc_axis];
   // allocate memory on device.
-  T* out_data = dev_ctx.template Alloc<T>(out);
+  phi::DenseTensor x_src;
+  T* out_data = AllocInplace<T>(dev_ctx, x, out, &x_src);
   if (out->numel() == 0) {
     return;
   }
@@ -71,35 +39,9 @@ void SoftmaxKernel(const phi::Context& dev_ctx,
     return;
   }
 
-  const int n = phi::funcs::SizeToAxis(calc_axis, x.dims());
-  const int d = phi::funcs::SizeFromAxis(calc_axis, x.dims());
-  Softmax(axis_dim, x.data<T>(), out->data<T>(), n, d);
-}
-
-template <typename T>
-void SoftmaxGrad(
-    const T* out, const T* out_grad, int axis_dim, int M, int N, T* x_grad) {
-  int num_remain = N / axis_dim;
-  T* dot = new T[M * num_remain];
-  for (auto i = 0; i < M; ++i) {
-    for (auto k = 0; k < num_remain; ++k) {
-      dot[i * num_remain + k] = 0;
-      for (auto j = 0; j < axis_dim; ++j) {
-        dot[i * num_remain + k] += out[i * N + j * num_remain + k] *
-                                   out_grad[i * N + j * num_remain + k];
-      }
-    }
-  }
-  for (auto i = 0; i < M; ++i) {
-    for (auto j = 0; j < axis_dim; ++j) {
-      for (auto k = 0; k < num_remain; ++k) {
-        x_grad[i * N + j * num_remain + k] =
-            (out_grad[i * N + j * num_remain + k] - dot[i * num_remain + k]) *
-            out[i * N + j * num_remain + k];
-      }
-    }
-  }
-  delete[] dot;
+  const int64_t n = phi::funcs::SizeToAxis(calc_axis, x.dims());
+  const int64_t d = phi::funcs::SizeFromAxis(calc_axis, x.dims());
+  Softmax(x_src.data<T>(), out_data, n, axis_dim, d / axis_dim);
 }
 
 template <typename T>
@@ -110,7 +52,7 @@ void SoftmaxGradKernel(const phi::Context& dev_ctx,
                        phi::DenseTensor* x_grad) {
   const int rank = x_grad->dims().size();
   const int calc_axis = phi::funcs::CanonicalAxis(axis, rank);
-  int axis_dim = x_grad->dims()[calc_axis];
+  int64_t axis_dim = x_grad->dims()[calc_axis];
 
   // allocate memory on device.
   T* x_grad_data = dev_ctx.template Alloc<T>(x_grad);
@@ -123,10 +65,14 @@ void SoftmaxGradKernel(const phi::Context& dev_ctx,
     return;
   }
 
-  const int n = phi::funcs::SizeToAxis(calc_axis, x_grad->dims());
-  const int d = phi::funcs::SizeFromAxis(calc_axis, x_grad->dims());
-  SoftmaxGrad(
-      out.data<T>(), out_grad.data<T>(), axis_dim, n, d, x_grad->data<T>());
+  const int64_t n = phi::funcs::SizeToAxis(calc_axis, x_grad->dims());
+  const int64_t d = phi::funcs::SizeFromAxis(calc_axis, x_grad->dims());
+  SoftmaxGrad(out.data<T>(),
+              out_grad.data<T>(),
+              x_grad_data,
+              n,
+              axis_dim,
+              d / axis_dim);
 }
 
 }  // namespace custom_kernel
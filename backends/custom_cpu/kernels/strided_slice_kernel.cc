@@ -0,0 +1,118 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <algorithm>
+#include <vector>
+
+#include "kernels/funcs/strided_copy.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+
+namespace custom_kernel {
+
+template <typename T>
+void StridedSliceRawKernel(const phi::Context& dev_ctx,
+                           const phi::DenseTensor& x,
+                           const std::vector<int>& axes,
+                           const phi::IntArray& starts_arr,
+                           const phi::IntArray& ends_arr,
+                           const phi::IntArray& strides_arr,
+                           const std::vector<int>& infer_flags,
+                           const std::vector<int>& decrease_axis,
+                           phi::DenseTensor* out) {
+  auto starts = starts_arr.GetData();
+  auto ends = ends_arr.GetData();
+  auto strides = strides_arr.GetData();
+  PD_CHECK(starts.size() == axes.size() && ends.size() == axes.size() &&
+               strides.size() == axes.size(),
+           "The size of starts, ends and strides must be equal to the size "
+           "of axes.");
+
+  auto in_dims = x.dims();
+  const int rank = in_dims.size();
+  auto in_strides = ContiguousStrides(in_dims);
+
+  // Every axis starts at 0 with step 1; the sliced axes get their first
+  // index, element count and signed step.
+  auto slice_dims = in_dims;
+  auto src_strides = in_strides;
+  int64_t in_offset = 0;
+  for (size_t i = 0; i < axes.size(); ++i) {
+    auto axis = axes[i] < 0 ? axes[i] + rank : axes[i];
+    PD_CHECK(axis >= 0 && axis < rank,
+             "The axis of strided_slice must be in range [-%d, %d), but "
+             "received %d.",
+             rank,
+             rank,
+             axes[i]);
+    auto stride = strides[i];
+    PD_CHECK(stride != 0, "The stride of strided_slice must not be 0.");
+    const int64_t dim = in_dims[axis];
+    int64_t start = starts[i];
+    int64_t end = ends[i];
+    bool decrease = false;
+    if (start == -1 && end == 0 && infer_flags[i] == -1) {
+      decrease =
+          std::find(decrease_axis.begin(), decrease_axis.end(), axes[i]) !=
+          decrease_axis.end();
+    }
+    if (start < 0) {
+      start = std::max<int64_t>(start + dim, 0);
+    }
+    // end == -1 with a negative stride means "up to and including 0", and
+    // an end before the first element stops a backward slice there too.
+    if (end < 0 && !(end == -1 && stride < 0)) {
+      end = std::max<int64_t>(end + dim, stride < 0 ? -1 : 0);
+    }
+    if (decrease) {
+      end = stride < 0 ? start - 1 : start + 1;
+    }
+    int64_t count;
+    if (stride > 0) {
+      start = std::min(start, dim);
+      end = std::min(end, dim);
+      count = end > start ? (end - start + stride - 1) / stride : 0;
+    } else {
+      start = std::min(start, dim - 1);
+      count = start > end ? (start - end - stride - 1) / -stride : 0;
+    }
+    slice_dims[axis] = count;
+    src_strides[axis] = in_strides[axis] * stride;
+    in_offset += start * in_strides[axis];
+  }
+
+  out->Resize(slice_dims);
+  auto out_data = dev_ctx.template Alloc<T>(out);
+  StridedCopy(slice_dims,
+              src_strides,
+              ContiguousStrides(slice_dims),
+              x.data<T>() + in_offset,
+              out_data);
+
+  std::vector<int64_t> decrease_axes(decrease_axis.begin(),
+                                     decrease_axis.end());
+  out->Resize(phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axes));
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(strided_slice_raw,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::StridedSliceRawKernel,
+                    bool,
+                    int,
+                    int64_t,
+                    float,
+                    double) {}
@@ -0,0 +1,132 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/sort_function.h"
+#include "kernels/kernels.h"
+#include "kernels/phi_funcs.h"
+#include "paddle/phi/capi/all.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void TopkKernel(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                const phi::Scalar& k_scalar,
+                int axis,
+                bool largest,
+                bool sorted,
+                phi::DenseTensor* out,
+                phi::DenseTensor* indices) {
+  auto in_dims = x.dims();
+  const int rank = in_dims.size();
+  const int64_t k = k_scalar.to<int64_t>();
+
+  // Support 0D
+  if (rank == 0) {
+    PD_CHECK(k == 1 || k == 0,
+             "The k of top_k must be 0 or 1 for a 0-D input, but received %ld.",
+             k);
+    out->Resize(in_dims);
+    indices->Resize(in_dims);
+    T* out_data = dev_ctx.template Alloc<T>(out);
+    int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+    out_data[0] = x.data<T>()[0];
+    ids_data[0] = 0;
+    return;
+  }
+
+  axis = axis < 0 ? axis + rank : axis;
+  PD_CHECK(axis >= 0 && axis < rank,
+           "The axis of top_k must be in range [-%d, %d), but received %d.",
+           rank,
+           rank,
+           axis);
+  PD_CHECK(k >= 0 && k <= in_dims[axis],
+           "The k of top_k must be in range [0, %ld], but received %ld.",
+           in_dims[axis],
+           k);
+
+  auto out_dims = in_dims;
+  out_dims[axis] = k;
+  out->Resize(out_dims);
+  indices->Resize(out_dims);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+  if (out->numel() == 0) {
+    return;
+  }
+
+  if (axis + 1 == rank) {
+    const int64_t width = in_dims[rank - 1];
+    TopK(x.data<T>(),
+         x.numel() / width,
+         width,
+         k,
+         largest,
+         sorted,
+         out_data,
+         ids_data);
+    return;
+  }
+
+  // Move axis to the end, select, and move it back: the permutation swaps
+  // axis and the last axis, so it is its own inverse.
+  std::vector<int> trans;
+  for (int i = 0; i < rank; i++) {
+    trans.push_back(i);
+  }
+  std::swap(trans[axis], trans[rank - 1]);
+  std::vector<int64_t> trans_dims(in_dims.cbegin(), in_dims.cend());
+  std::swap(trans_dims[axis], trans_dims[rank - 1]);
+
+  phi::DenseTensor trans_inp;
+  trans_inp.Resize(trans_dims);
+  dev_ctx.template Alloc<T>(&trans_inp);
+  TransposeKernel<T>(dev_ctx, x, trans, &trans_inp);
+
+  const int64_t width = trans_dims[rank - 1];
+  trans_dims[rank - 1] = k;
+  phi::DenseTensor tmp_out;
+  tmp_out.Resize(trans_dims);
+  T* t_out = dev_ctx.template Alloc<T>(&tmp_out);
+  phi::DenseTensor tmp_indices;
+  tmp_indices.Resize(trans_dims);
+  auto* t_ind = dev_ctx.template Alloc<int64_t>(&tmp_indices);
+
+  TopK(trans_inp.data<T>(),
+       trans_inp.numel() / width,
+       width,
+       k,
+       largest,
+       sorted,
+       t_out,
+       t_ind);
+
+  TransposeKernel<int64_t>(dev_ctx, tmp_indices, trans, indices);
+  TransposeKernel<T>(dev_ctx, tmp_out, trans, out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(topk,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::TopkKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t) {}
@@ -12,8 +12,10 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include <vector>
+
+#include "kernels/funcs/transpose_function.h"
 #include "paddle/phi/capi/all.h"
-#include "phi_funcs.h"  //NOLINT
 
 namespace custom_kernel {
 
@@ -23,45 +25,24 @@ void TransposeKernel(const phi::Context& ctx,
                      const std::vector<int>& axis,
                      phi::DenseTensor* out) {
   auto x_dims = x.dims();
-  auto out_dims = out->dims();
-
   auto x_data = x.data<T>();
   auto out_data = ctx.template Alloc<T>(out);
   if (out->numel() == 0) {
     return;
   }
   auto rank = x_dims.size();
-  if (rank == 1) {
-    memcpy(out_data, x_data, x.numel() * sizeof(T));
-  }
   PD_CHECK(axis.size() == rank,
            "axis.size (%d) must be equal the rank of input (%d).",
            axis.size(),
            rank);
-
-  std::vector<size_t> step(out_dims.size(), 1);
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * out_dims[i];
-  }
-
-  std::vector<size_t> index(rank, 0);
-  for (auto i = 0; i < x.numel(); ++i) {
-    std::vector<size_t> dst_index(rank, 0);
-    for (auto j = 0; j < rank; ++j) {
-      dst_index[j] = index[axis[j]];
-    }
-    out_data[phi::vec_product(dst_index, step)] = x_data[i];
-
-    index.back()++;
-    for (auto j = rank - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j - 1]++;
-        index[j] = 0;
-      } else {
-        break;
-      }
+  std::vector<int> perm(axis);
+  for (auto& a : perm) {
+    // handle negative axis, f.e. "-1" means rightmost dimension
+    if (a < 0) {
+      a += rank;
     }
   }
+  Transpose(x_dims, perm, x_data, out_data);
 }
 
 }  // namespace custom_kernel
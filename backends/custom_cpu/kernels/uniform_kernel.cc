@@ -14,6 +14,7 @@
 
 #include <random>
 
+#include "kernels/funcs/inplace.h"
 #include "paddle/phi/capi/all.h"
 
 namespace custom_kernel {
@@ -45,7 +46,7 @@ void UniformRawKernel(const phi::Context &dev_ctx,
   auto shape_data = shape.GetData();
 
   out->Resize(std::vector<int64_t>(shape_data.begin(), shape_data.end()));
-  T *data = dev_ctx.template Alloc<T>(out);
+  T *data = AllocOverwrite<T>(dev_ctx, out);
   auto size = out->numel();
   std::shared_ptr<std::mt19937_64> engine;
 
@@ -0,0 +1,514 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/allocator.h"
+
+#include <sys/mman.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdlib>
+#include <vector>
+
+#include "kernels/funcs/parallel.h"
+#include "runtime/flags.h"
+#include "runtime/topology.h"
+
+namespace custom_cpu {
+
+constexpr size_t CachingAllocator::kMinBlockSize;
+
+namespace {
+
+constexpr size_t kPageSize = 4096;
+constexpr size_t kHugePageSize = 2 << 20;
+constexpr size_t kSmallSize = 1 << 20;
+constexpr size_t kSmallSegmentSize = 2 << 20;
+constexpr size_t kLargeSegmentRound = 2 << 20;
+constexpr size_t kThreadCacheMaxSize = 256 << 10;
+constexpr size_t kThreadCacheCapacity = 4 << 20;
+constexpr int kNumSizeClasses = 32;
+constexpr size_t kMaxDevices = 128;
+
+size_t RoundUp(size_t x, size_t m) { return (x + m - 1) / m * m; }
+
+// Segments of at least FLAGS_custom_cpu_hugepage_threshold_mb are mapped
+// with transparent huge pages, 0 turns the mode off.
+size_t HugePageThreshold() {
+  static const size_t threshold =
+      EnvToUInt("FLAGS_custom_cpu_hugepage_threshold_mb", 0) << 20;
+  return threshold;
+}
+
+// Explicit huge pages (vm.nr_hugepages) reserved up front for every device,
+// 0 for none.
+size_t HugePageArenaSize() {
+  static const size_t size = RoundUp(
+      EnvToUInt("FLAGS_custom_cpu_hugepage_arena_mb", 0) << 20, kHugePageSize);
+  return size;
+}
+
+bool PrefaultEnabled() {
+  static const bool prefault =
+      EnvToBool("FLAGS_custom_cpu_hugepage_prefault", true);
+  return prefault;
+}
+
+// mmap with the start aligned to alignment, a power of two.
+void* MapAligned(size_t size, size_t alignment) {
+  auto ptr = mmap(nullptr,
+                  size + alignment,
+                  PROT_READ | PROT_WRITE,
+                  MAP_PRIVATE | MAP_ANONYMOUS,
+                  -1,
+                  0);
+  if (ptr == MAP_FAILED) {
+    return nullptr;
+  }
+  auto begin = reinterpret_cast<uintptr_t>(ptr);
+  auto aligned = (begin + alignment - 1) & ~(alignment - 1);
+  if (aligned > begin) {
+    munmap(ptr, aligned - begin);
+  }
+  munmap(reinterpret_cast<void*>(aligned + size), begin + alignment - aligned);
+  return reinterpret_cast<void*>(aligned);
+}
+
+// Touches every page of a fresh mapping from the threads of the current
+// device, so that the page faults, and the zeroing of the pages, are taken
+// in parallel up front instead of one by one by the first kernel writing
+// the memory.
+void Prefault(void* ptr, size_t size) {
+  auto* pages = static_cast<volatile char*>(ptr);
+  auto num_pages = static_cast<int64_t>(size / kPageSize);
+  custom_kernel::ParallelFor(
+      0, num_pages, kHugePageSize / kPageSize, [&](int64_t begin, int64_t end) {
+        for (auto i = begin; i < end; ++i) {
+          pages[i * kPageSize] = 0;
+        }
+      });
+}
+
+size_t RoundSize(size_t size) {
+  constexpr size_t kMinBlockSize = CachingAllocator::kMinBlockSize;
+  if (size <= 4096) {
+    return std::max(kMinBlockSize, RoundUp(size, kMinBlockSize));
+  }
+  if (size > kSmallSize) {
+    return RoundUp(size, kMinBlockSize);
+  }
+  size_t pow = 4096;
+  while (pow * 2 < size) {
+    pow *= 2;
+  }
+  return RoundUp(size, pow / 4);
+}
+
+// Index of a rounded size up to kThreadCacheMaxSize: 0..7 for the 512 byte
+// steps up to 4 KiB, then four classes per power of two.
+int SizeClass(size_t rounded) {
+  if (rounded <= 4096) {
+    return static_cast<int>(rounded / CachingAllocator::kMinBlockSize) - 1;
+  }
+  size_t pow = 4096;
+  int k = 0;
+  while (pow * 2 < rounded) {
+    pow *= 2;
+    ++k;
+  }
+  return 8 + k * 4 + static_cast<int>((rounded - pow) / (pow / 4)) - 1;
+}
+
+}  // namespace
+
+// Blocks freed by one thread for one allocator, grouped by size class. The
+// blocks stay allocated as far as the allocator is concerned.
+class ThreadCache {
+ public:
+  explicit ThreadCache(CachingAllocator* allocator) : allocator_(allocator) {}
+
+  // Hands the cached blocks back to the allocator and deletes the cache.
+  void Release() { allocator_->UnregisterCache(this); }
+
+  void* Pop(int size_class, size_t size) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto& bin = bins_[size_class];
+    if (bin.empty()) {
+      return nullptr;
+    }
+    auto ptr = bin.back();
+    bin.pop_back();
+    bytes_ -= size;
+    return ptr;
+  }
+
+  bool Push(int size_class, void* ptr, size_t size) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (bytes_ + size > kThreadCacheCapacity) {
+      return false;
+    }
+    bins_[size_class].push_back(ptr);
+    bytes_ += size;
+    return true;
+  }
+
+  void TakeAll(std::vector<void*>* blocks) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    for (auto& bin : bins_) {
+      blocks->insert(blocks->end(), bin.begin(), bin.end());
+      bin.clear();
+    }
+    bytes_ = 0;
+  }
+
+ private:
+  CachingAllocator* const allocator_;
+  // Only contended while another thread flushes the cache.
+  std::mutex mutex_;
+  std::vector<void*> bins_[kNumSizeClasses];
+  size_t bytes_ = 0;
+};
+
+namespace {
+
+// The caches of the calling thread, indexed by allocator id. They are
+// handed back to their allocators when the thread exits.
+class ThreadCaches {
+ public:
+  ~ThreadCaches() {
+    for (auto* cache : caches_) {
+      if (cache) {
+        cache->Release();
+      }
+    }
+  }
+
+  ThreadCache*& At(size_t id) {
+    if (id >= caches_.size()) {
+      caches_.resize(id + 1, nullptr);
+    }
+    return caches_[id];
+  }
+
+ private:
+  std::vector<ThreadCache*> caches_;
+};
+
+thread_local ThreadCaches thread_caches;
+
+std::atomic<size_t> next_allocator_id{0};
+
+}  // namespace
+
+CachingAllocator::CachingAllocator(MemoryBudget* budget, int device_id)
+    : id_(next_allocator_id++),
+      budget_(budget),
+      device_id_(device_id),
+      numa_bound_(device_id >= 0 &&
+                  GetLogicalDevice(device_id).numa_node >= 0) {
+  if (device_id >= 0 && HugePageArenaSize() > 0) {
+    ReserveArena(HugePageArenaSize());
+  }
+}
+
+// Allocators are never destroyed: blocks may still be freed, and thread
+// caches handed back, during static destruction.
+CachingAllocator& CachingAllocator::Device(size_t device_id) {
+  static std::atomic<CachingAllocator*> allocators[kMaxDevices];
+  static std::mutex mutex;
+  auto& slot = allocators[device_id % kMaxDevices];
+  auto* allocator = slot.load(std::memory_order_acquire);
+  if (!allocator) {
+    std::lock_guard<std::mutex> lock(mutex);
+    allocator = slot.load(std::memory_order_relaxed);
+    if (!allocator) {
+      allocator = new CachingAllocator(&MemoryBudget::Device(device_id),
+                                       static_cast<int>(device_id));
+      slot.store(allocator, std::memory_order_release);
+    }
+  }
+  return *allocator;
+}
+
+CachingAllocator& CachingAllocator::Host() {
+  static auto* allocator = new CachingAllocator(&MemoryBudget::Host(), -1);
+  return *allocator;
+}
+
+ThreadCache* CachingAllocator::LocalCache() {
+  auto& cache = thread_caches.At(id_);
+  if (!cache) {
+    cache = new ThreadCache(this);
+    std::lock_guard<std::mutex> lock(caches_mutex_);
+    caches_.push_back(cache);
+  }
+  return cache;
+}
+
+void CachingAllocator::UnregisterCache(ThreadCache* cache) {
+  {
+    std::lock_guard<std::mutex> lock(caches_mutex_);
+    caches_.erase(std::remove(caches_.begin(), caches_.end(), cache),
+                  caches_.end());
+  }
+  std::vector<void*> blocks;
+  cache->TakeAll(&blocks);
+  delete cache;
+  std::lock_guard<std::mutex> lock(mutex_);
+  for (auto ptr : blocks) {
+    FreeBlock(ptr);
+  }
+}
+
+void* CachingAllocator::Allocate(size_t size) {
+  auto rounded = RoundSize(size);
+  void* ptr = nullptr;
+  if (rounded <= kThreadCacheMaxSize) {
+    ptr = LocalCache()->Pop(SizeClass(rounded), rounded);
+  }
+  if (!ptr) {
+    ptr = AllocateBlock(rounded);
+  }
+  if (ptr) {
+    AddInUse(rounded);
+  }
+  return ptr;
+}
+
+void CachingAllocator::Free(void* ptr, size_t size) {
+  if (!ptr) {
+    return;
+  }
+  auto rounded = RoundSize(size);
+  in_use_ -= rounded;
+  if (rounded <= kThreadCacheMaxSize &&
+      LocalCache()->Push(SizeClass(rounded), ptr, rounded)) {
+    return;
+  }
+  std::lock_guard<std::mutex> lock(mutex_);
+  FreeBlock(ptr);
+}
+
+void CachingAllocator::EmptyCache() {
+  FlushThreadCaches();
+  std::lock_guard<std::mutex> lock(mutex_);
+  ReleaseSegments();
+}
+
+MemoryStats CachingAllocator::Stats() const {
+  MemoryStats stats;
+  stats.reserved = reserved_.load();
+  stats.in_use = in_use_.load();
+  stats.peak_in_use = peak_in_use_.load();
+  return stats;
+}
+
+void* CachingAllocator::AllocateBlock(size_t size) {
+  const bool small = size <= kSmallSize;
+  auto& pool = small ? small_blocks_ : large_blocks_;
+  // On failure the cached memory is released and the allocation retried
+  // once.
+  for (int attempt = 0; attempt < 2; ++attempt) {
+    if (attempt > 0) {
+      EmptyCache();
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    Block key{nullptr, size, small};
+    Block* block = nullptr;
+    auto it = pool.lower_bound(&key);
+    if (it != pool.end()) {
+      block = *it;
+      pool.erase(it);
+    } else {
+      block = NewSegment(size, small);
+    }
+    if (!block) {
+      continue;
+    }
+    auto remaining = block->size - size;
+    if (remaining >= (small ? kMinBlockSize : kSmallSize)) {
+      auto* rest = new Block{block->ptr + size, remaining, small};
+      rest->prev = block;
+      rest->next = block->next;
+      if (block->next) {
+        block->next->prev = rest;
+      }
+      block->next = rest;
+      block->size = size;
+      pool.insert(rest);
+    }
+    block->allocated = true;
+    allocated_blocks_[block->ptr] = block;
+    return block->ptr;
+  }
+  return nullptr;
+}
+
+CachingAllocator::Block* CachingAllocator::NewSegment(size_t size, bool small) {
+  auto segment_size =
+      small ? kSmallSegmentSize : RoundUp(size, kLargeSegmentRound);
+  if (!budget_->TryReserve(segment_size)) {
+    return nullptr;
+  }
+  auto ptr = SystemAllocate(segment_size);
+  if (!ptr) {
+    budget_->Release(segment_size);
+    return nullptr;
+  }
+  reserved_ += segment_size;
+  return new Block{static_cast<char*>(ptr), segment_size, small};
+}
+
+bool CachingAllocator::UseHugePages(size_t size) const {
+  return HugePageThreshold() > 0 && size >= HugePageThreshold();
+}
+
+// Segments of a device with a NUMA node are mapped directly, so that their
+// pages are still untouched when they get bound to the node. Huge page
+// segments are mapped 2 MiB aligned, which transparent huge pages need.
+void* CachingAllocator::SystemAllocate(size_t size) {
+  const bool huge = UseHugePages(size);
+  if (numa_bound_ || huge) {
+    auto ptr = MapAligned(size, huge ? kHugePageSize : kPageSize);
+    if (!ptr) {
+      return nullptr;
+    }
+#ifdef MADV_HUGEPAGE
+    if (huge) {
+      madvise(ptr, size, MADV_HUGEPAGE);
+    }
+#endif
+    if (numa_bound_) {
+      BindMemoryToDevice(ptr, size, device_id_);
+    }
+    if (huge && PrefaultEnabled()) {
+      Prefault(ptr, size);
+    }
+    return ptr;
+  }
+  void* ptr = nullptr;
+  if (posix_memalign(&ptr, kPageSize, size) != 0) {
+    return nullptr;
+  }
+  return ptr;
+}
+
+void CachingAllocator::SystemFree(void* ptr, size_t size) {
+  if (numa_bound_ || UseHugePages(size)) {
+    munmap(ptr, size);
+  } else {
+    free(ptr);
+  }
+}
+
+// The arena is a large segment that is never released. Without enough
+// huge pages in vm.nr_hugepages the device simply goes without it.
+void CachingAllocator::ReserveArena(size_t size) {
+#ifdef MAP_HUGETLB
+  if (!budget_->TryReserve(size)) {
+    return;
+  }
+  auto ptr = mmap(nullptr,
+                  size,
+                  PROT_READ | PROT_WRITE,
+                  MAP_PRIVATE | MAP_ANONYMOUS | MAP_HUGETLB,
+                  -1,
+                  0);
+  if (ptr == MAP_FAILED) {
+    budget_->Release(size);
+    return;
+  }
+  if (numa_bound_) {
+    BindMemoryToDevice(ptr, size, device_id_);
+  }
+  Prefault(ptr, size);
+  reserved_ += size;
+  arena_ = static_cast<char*>(ptr);
+  large_blocks_.insert(new Block{arena_, size, false});
+#endif
+}
+
+void CachingAllocator::FreeBlock(void* ptr) {
+  auto it = allocated_blocks_.find(ptr);
+  if (it == allocated_blocks_.end()) {
+    return;
+  }
+  auto* block = it->second;
+  allocated_blocks_.erase(it);
+  block->allocated = false;
+  auto& pool = block->small ? small_blocks_ : large_blocks_;
+  auto* prev = block->prev;
+  if (prev && !prev->allocated) {
+    pool.erase(prev);
+    prev->size += block->size;
+    prev->next = block->next;
+    if (block->next) {
+      block->next->prev = prev;
+    }
+    delete block;
+    block = prev;
+  }
+  auto* next = block->next;
+  if (next && !next->allocated) {
+    pool.erase(next);
+    block->size += next->size;
+    block->next = next->next;
+    if (next->next) {
+      next->next->prev = block;
+    }
+    delete next;
+  }
+  pool.insert(block);
+}
+
+void CachingAllocator::ReleaseSegments() {
+  for (auto* pool : {&small_blocks_, &large_blocks_}) {
+    for (auto it = pool->begin(); it != pool->end();) {
+      auto* block = *it;
+      // A free block without neighbours spans its whole segment.
+      if (!block->prev && !block->next && block->ptr != arena_) {
+        SystemFree(block->ptr, block->size);
+        reserved_ -= block->size;
+        budget_->Release(block->size);
+        delete block;
+        it = pool->erase(it);
+      } else {
+        ++it;
+      }
+    }
+  }
+}
+
+void CachingAllocator::FlushThreadCaches() {
+  std::vector<void*> blocks;
+  {
+    std::lock_guard<std::mutex> lock(caches_mutex_);
+    for (auto* cache : caches_) {
+      cache->TakeAll(&blocks);
+    }
+  }
+  std::lock_guard<std::mutex> lock(mutex_);
+  for (auto ptr : blocks) {
+    FreeBlock(ptr);
+  }
+}
+
+void CachingAllocator::AddInUse(size_t size) {
+  auto in_use = in_use_ += size;
+  auto peak = peak_in_use_.load(std::memory_order_relaxed);
+  while (in_use > peak && !peak_in_use_.compare_exchange_weak(peak, in_use)) {
+  }
+}
+
+}  // namespace custom_cpu
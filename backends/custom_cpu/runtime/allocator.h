@@ -0,0 +1,140 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+#include <mutex>
+#include <set>
+#include <unordered_map>
+#include <vector>
+
+#include "runtime/memory_budget.h"
+
+namespace custom_cpu {
+
+struct MemoryStats {
+  size_t reserved = 0;     // bytes held from the system
+  size_t in_use = 0;       // bytes handed out and not freed yet
+  size_t peak_in_use = 0;  // high-water mark of in_use
+};
+
+class ThreadCache;
+
+// Caching allocator behind the device, host and unified memory of the
+// plugin.
+//
+// Requests are rounded to size classes: multiples of kMinBlockSize up to
+// 4 KiB, then four classes per power of two up to 1 MiB, then multiples of
+// kMinBlockSize. Small requests (up to 1 MiB) are carved from shared 2 MiB
+// segments, larger ones get their own segments rounded to 2 MiB. Free
+// blocks are kept in a best-fit set per pool, split on allocation and
+// coalesced with their free neighbours in the same segment on release.
+// Segments are page aligned, so every block is kMinBlockSize aligned.
+//
+// Freed blocks up to 256 KiB first go to a cache of the freeing thread and
+// are handed out again by the same thread without taking the allocator
+// lock.
+//
+// Segments of a device with a NUMA node prefer the memory of that node.
+//
+// Segments of at least FLAGS_custom_cpu_hugepage_threshold_mb are mapped
+// with transparent huge pages and, unless FLAGS_custom_cpu_hugepage_prefault
+// is off, faulted in by the thread pool right away. A device can also keep
+// an arena of FLAGS_custom_cpu_hugepage_arena_mb explicit huge pages, which
+// serves large blocks and is never returned to the system.
+//
+// Segments are reserved from the MemoryBudget of the device and only
+// returned by EmptyCache(), which also runs before an allocation would
+// exceed the budget.
+class CachingAllocator {
+ public:
+  static constexpr size_t kMinBlockSize = 512;
+
+  static CachingAllocator& Device(size_t device_id);
+  static CachingAllocator& Host();
+
+  CachingAllocator(const CachingAllocator&) = delete;
+  CachingAllocator& operator=(const CachingAllocator&) = delete;
+
+  // Returns nullptr when the memory limit is reached or the system is out
+  // of memory.
+  void* Allocate(size_t size);
+
+  // size must be the size passed to Allocate.
+  void Free(void* ptr, size_t size);
+
+  // Returns the cached blocks of every thread and all unused segments to
+  // the system.
+  void EmptyCache();
+
+  MemoryStats Stats() const;
+
+ private:
+  friend class ThreadCache;
+
+  struct Block {
+    char* ptr;
+    size_t size;
+    bool small;
+    bool allocated = false;
+    Block* prev = nullptr;
+    Block* next = nullptr;
+  };
+
+  struct BlockLess {
+    bool operator()(const Block* a, const Block* b) const {
+      return a->size != b->size ? a->size < b->size : a->ptr < b->ptr;
+    }
+  };
+  using FreeBlocks = std::set<Block*, BlockLess>;
+
+  // device_id is -1 for host memory.
+  CachingAllocator(MemoryBudget* budget, int device_id);
+
+  ThreadCache* LocalCache();
+  void UnregisterCache(ThreadCache* cache);
+
+  void* AllocateBlock(size_t size);
+  Block* NewSegment(size_t size, bool small);
+  void ReserveArena(size_t size);
+  bool UseHugePages(size_t size) const;
+  void* SystemAllocate(size_t size);
+  void SystemFree(void* ptr, size_t size);
+  void FreeBlock(void* ptr);
+  void ReleaseSegments();
+  void FlushThreadCaches();
+  void AddInUse(size_t size);
+
+  const size_t id_;
+  MemoryBudget* const budget_;
+  const int device_id_;
+  const bool numa_bound_;
+  char* arena_ = nullptr;
+
+  std::mutex mutex_;
+  FreeBlocks small_blocks_;
+  FreeBlocks large_blocks_;
+  std::unordered_map<void*, Block*> allocated_blocks_;
+
+  std::mutex caches_mutex_;
+  std::vector<ThreadCache*> caches_;
+
+  std::atomic<size_t> reserved_{0};
+  std::atomic<size_t> in_use_{0};
+  std::atomic<size_t> peak_in_use_{0};
+};
+
+}  // namespace custom_cpu
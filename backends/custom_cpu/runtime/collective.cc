@@ -0,0 +1,482 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/collective.h"
+
+#include <unistd.h>
+
+#include <algorithm>
+#include <cmath>
+#include <complex>
+#include <cstring>
+#include <random>
+#include <string>
+#include <thread>
+#include <utility>
+#include <vector>
+
+#include "runtime/flags.h"
+#include "runtime/shm_communicator.h"
+#include "runtime/tcp_communicator.h"
+
+namespace custom_cpu {
+
+namespace {
+
+struct Float16 {
+  uint16_t bits;
+};
+
+struct BFloat16 {
+  uint16_t bits;
+};
+
+float BitsToFloat(uint32_t bits) {
+  float f;
+  std::memcpy(&f, &bits, sizeof(f));
+  return f;
+}
+
+uint32_t FloatToBits(float f) {
+  uint32_t bits;
+  std::memcpy(&bits, &f, sizeof(bits));
+  return bits;
+}
+
+float HalfToFloat(uint16_t h) {
+  uint32_t sign = static_cast<uint32_t>(h & 0x8000) << 16;
+  uint32_t exponent = (h >> 10) & 0x1f;
+  uint32_t mantissa = h & 0x3ff;
+  if (exponent == 0x1f) {
+    return BitsToFloat(sign | 0x7f800000 | (mantissa << 13));
+  }
+  if (exponent == 0) {
+    // Zero or subnormal, exact in float.
+    float value = std::ldexp(static_cast<float>(mantissa), -24);
+    return sign ? -value : value;
+  }
+  return BitsToFloat(sign | ((exponent + 112) << 23) | (mantissa << 13));
+}
+
+// Rounds to nearest even.
+uint16_t FloatToHalf(float f) {
+  uint32_t bits = FloatToBits(f);
+  uint16_t sign = (bits >> 16) & 0x8000;
+  uint32_t abs = bits & 0x7fffffff;
+  if (abs >= 0x7f800000) {
+    return sign | 0x7c00 | (abs > 0x7f800000 ? 0x200 : 0);
+  }
+  if (abs >= 0x477ff000) {
+    return sign | 0x7c00;
+  }
+  if (abs < 0x38800000) {
+    auto shift = 126 - static_cast<int>(abs >> 23);
+    if (shift > 24) {
+      return sign;
+    }
+    uint32_t mantissa = (abs & 0x7fffff) | 0x800000;
+    uint32_t value = mantissa >> shift;
+    uint32_t rest = mantissa & ((1u << shift) - 1);
+    uint32_t half = 1u << (shift - 1);
+    if (rest > half || (rest == half && (value & 1))) {
+      ++value;
+    }
+    return sign | value;
+  }
+  uint32_t value = (abs >> 13) - (112 << 10);
+  uint32_t rest = abs & 0x1fff;
+  if (rest > 0x1000 || (rest == 0x1000 && (value & 1))) {
+    ++value;
+  }
+  return sign | value;
+}
+
+float BFloat16ToFloat(uint16_t b) {
+  return BitsToFloat(static_cast<uint32_t>(b) << 16);
+}
+
+uint16_t FloatToBFloat16(float f) {
+  uint32_t bits = FloatToBits(f);
+  if ((bits & 0x7fffffff) > 0x7f800000) {
+    return ((bits >> 16) & 0x8000) | 0x7fc0;
+  }
+  return (bits + 0x7fff + ((bits >> 16) & 1)) >> 16;
+}
+
+// The type a reduction of T runs in.
+template <typename T>
+struct Accum {
+  using Type = T;
+  static Type Load(T v) { return v; }
+  static T Store(Type v) { return v; }
+};
+
+template <>
+struct Accum<bool> {
+  using Type = int;
+  static Type Load(bool v) { return v; }
+  static bool Store(Type v) { return v != 0; }
+};
+
+template <>
+struct Accum<Float16> {
+  using Type = float;
+  static Type Load(Float16 v) { return HalfToFloat(v.bits); }
+  static Float16 Store(Type v) { return {FloatToHalf(v)}; }
+};
+
+template <>
+struct Accum<BFloat16> {
+  using Type = float;
+  static Type Load(BFloat16 v) { return BFloat16ToFloat(v.bits); }
+  static BFloat16 Store(Type v) { return {FloatToBFloat16(v)}; }
+};
+
+struct SumOp {
+  template <typename A>
+  static A Apply(A a, A b) {
+    return a + b;
+  }
+};
+
+struct ProdOp {
+  template <typename A>
+  static A Apply(A a, A b) {
+    return a * b;
+  }
+};
+
+struct MaxOp {
+  template <typename A>
+  static A Apply(A a, A b) {
+    return a < b ? b : a;
+  }
+};
+
+struct MinOp {
+  template <typename A>
+  static A Apply(A a, A b) {
+    return b < a ? b : a;
+  }
+};
+
+// dst[i] = op(srcs[0][i], ..., srcs[n - 1][i]) / divisor for i < count. dst
+// may be one of the sources.
+using ReduceFn = void (*)(
+    const char* const* srcs, size_t n, size_t count, size_t divisor, char* dst);
+
+template <typename T, typename Op>
+void Reduce(const char* const* srcs,
+            size_t n,
+            size_t count,
+            size_t divisor,
+            char* dst) {
+  using A = Accum<T>;
+  constexpr size_t kBlock = 256;
+  typename A::Type acc[kBlock];
+  for (size_t begin = 0; begin < count; begin += kBlock) {
+    auto len = std::min(kBlock, count - begin);
+    auto* first = reinterpret_cast<const T*>(srcs[0]) + begin;
+    for (size_t i = 0; i < len; ++i) {
+      acc[i] = A::Load(first[i]);
+    }
+    for (size_t j = 1; j < n; ++j) {
+      auto* src = reinterpret_cast<const T*>(srcs[j]) + begin;
+      for (size_t i = 0; i < len; ++i) {
+        acc[i] = Op::Apply(acc[i], A::Load(src[i]));
+      }
+    }
+    auto* out = reinterpret_cast<T*>(dst) + begin;
+    if (divisor > 1) {
+      auto d = static_cast<typename A::Type>(divisor);
+      for (size_t i = 0; i < len; ++i) {
+        out[i] = A::Store(acc[i] / d);
+      }
+    } else {
+      for (size_t i = 0; i < len; ++i) {
+        out[i] = A::Store(acc[i]);
+      }
+    }
+  }
+}
+
+template <typename T>
+ReduceFn SelectReduce(C_CCLReduceOp op) {
+  switch (op) {
+    case C_CCLReduceOp::SUM:
+    case C_CCLReduceOp::AVG:
+      return Reduce<T, SumOp>;
+    case C_CCLReduceOp::PRODUCT:
+      return Reduce<T, ProdOp>;
+    case C_CCLReduceOp::MAX:
+      return Reduce<T, MaxOp>;
+    case C_CCLReduceOp::MIN:
+      return Reduce<T, MinOp>;
+    default:
+      return nullptr;
+  }
+}
+
+// Complex numbers have no order.
+template <typename T>
+ReduceFn SelectComplexReduce(C_CCLReduceOp op) {
+  switch (op) {
+    case C_CCLReduceOp::SUM:
+    case C_CCLReduceOp::AVG:
+      return Reduce<T, SumOp>;
+    case C_CCLReduceOp::PRODUCT:
+      return Reduce<T, ProdOp>;
+    default:
+      return nullptr;
+  }
+}
+
+ReduceFn GetReduceFn(C_DataType data_type, C_CCLReduceOp op) {
+  switch (data_type) {
+    case C_DataType::BOOL:
+      return SelectReduce<bool>(op);
+    case C_DataType::UINT8:
+      return SelectReduce<uint8_t>(op);
+    case C_DataType::UINT16:
+      return SelectReduce<uint16_t>(op);
+    case C_DataType::UINT32:
+      return SelectReduce<uint32_t>(op);
+    case C_DataType::UINT64:
+      return SelectReduce<uint64_t>(op);
+    case C_DataType::INT8:
+      return SelectReduce<int8_t>(op);
+    case C_DataType::INT16:
+      return SelectReduce<int16_t>(op);
+    case C_DataType::INT32:
+      return SelectReduce<int32_t>(op);
+    case C_DataType::INT64:
+      return SelectReduce<int64_t>(op);
+    case C_DataType::FLOAT16:
+      return SelectReduce<Float16>(op);
+    case C_DataType::BFLOAT16:
+      return SelectReduce<BFloat16>(op);
+    case C_DataType::FLOAT32:
+      return SelectReduce<float>(op);
+    case C_DataType::FLOAT64:
+      return SelectReduce<double>(op);
+    case C_DataType::COMPLEX64:
+      return SelectComplexReduce<std::complex<float>>(op);
+    case C_DataType::COMPLEX128:
+      return SelectComplexReduce<std::complex<double>>(op);
+    default:
+      return nullptr;
+  }
+}
+
+std::string Transport() {
+  static const std::string transport =
+      EnvToString("FLAGS_custom_cpu_ccl_transport", "auto");
+  return transport;
+}
+
+}  // namespace
+
+size_t DataTypeSize(C_DataType data_type) {
+  switch (data_type) {
+    case C_DataType::BOOL:
+    case C_DataType::UINT8:
+    case C_DataType::INT8:
+      return 1;
+    case C_DataType::UINT16:
+    case C_DataType::INT16:
+    case C_DataType::FLOAT16:
+    case C_DataType::BFLOAT16:
+      return 2;
+    case C_DataType::UINT32:
+    case C_DataType::INT32:
+    case C_DataType::FLOAT32:
+      return 4;
+    case C_DataType::UINT64:
+    case C_DataType::INT64:
+    case C_DataType::FLOAT64:
+    case C_DataType::COMPLEX64:
+      return 8;
+    case C_DataType::COMPLEX128:
+      return 16;
+    default:
+      return 0;
+  }
+}
+
+bool ReduceOpSupported(C_DataType data_type, C_CCLReduceOp op) {
+  return GetReduceFn(data_type, op) != nullptr;
+}
+
+void ReduceBuffers(const char* const* srcs,
+                   size_t n,
+                   size_t count,
+                   C_DataType data_type,
+                   C_CCLReduceOp op,
+                   size_t divisor,
+                   char* dst) {
+  GetReduceFn(data_type, op)(srcs, n, count, divisor, dst);
+}
+
+// A unique id is a random name, for the shared memory, followed by
+// "@ip:port" of the bootstrap unless the transport is "shm".
+bool NewUniqueId(char* id, size_t size) {
+  static const char kLetters[] = "abcdefghijklmnopqrstuvwxyz";
+  std::random_device rd;
+  std::uniform_int_distribution<int> letter(0, sizeof(kLetters) - 2);
+  std::string unique_id(16, 'a');
+  for (auto& c : unique_id) {
+    c = kLetters[letter(rd)];
+  }
+  if (Transport() != "shm") {
+    std::string address;
+    if (!StartBootstrap(&address)) {
+      return false;
+    }
+    unique_id += "@" + address;
+  }
+  if (unique_id.size() >= size) {
+    return false;
+  }
+  std::memcpy(id, unique_id.c_str(), unique_id.size() + 1);
+  return true;
+}
+
+Communicator* Communicator::Create(const std::string& unique_id,
+                                   size_t nranks,
+                                   size_t rank) {
+  if (nranks == 0 || rank >= nranks) {
+    return nullptr;
+  }
+  auto at = unique_id.find('@');
+  auto name = unique_id.substr(0, at);
+  if (at == std::string::npos) {
+    return ShmCommunicator::Create(name, nranks, rank);
+  }
+  int listen_fd;
+  std::vector<RankAddress> ranks;
+  if (!Bootstrap(unique_id.substr(at + 1), nranks, rank, &listen_fd, &ranks)) {
+    return nullptr;
+  }
+  bool one_host =
+      std::all_of(ranks.begin(), ranks.end(), [&](const RankAddress& address) {
+        return std::strncmp(
+                   address.host, ranks[0].host, sizeof(address.host)) == 0;
+      });
+  if (one_host && Transport() != "tcp") {
+    close(listen_fd);
+    return ShmCommunicator::Create(name, nranks, rank);
+  }
+  return TcpCommunicator::Create(listen_fd, ranks, rank);
+}
+
+Group& Group::Current() {
+  static thread_local Group group;
+  return group;
+}
+
+void Group::AddAllReduce(Communicator* comm,
+                         const void* send,
+                         void* recv,
+                         size_t count,
+                         C_DataType data_type,
+                         C_CCLReduceOp op) {
+  for (auto& bucket : buckets_) {
+    if (bucket.comm == comm && bucket.data_type == data_type &&
+        bucket.op == op) {
+      bucket.members.push_back({send, recv, count});
+      bucket.count += count;
+      return;
+    }
+  }
+  steps_.push_back(static_cast<int>(buckets_.size()));
+  buckets_.push_back({comm, data_type, op, count, {{send, recv, count}}});
+}
+
+void Group::AddSend(std::function<bool()> send) {
+  sends_.push_back(std::move(send));
+}
+
+void Group::Add(std::function<bool()> op) {
+  steps_.push_back(-1);
+  ops_.push_back(std::move(op));
+}
+
+bool Group::End() {
+  if (depth_ == 0) {
+    return false;
+  }
+  if (--depth_ == 0) {
+    return Run();
+  }
+  return true;
+}
+
+bool Group::Run() {
+  std::thread sender;
+  bool sent = true;
+  if (!sends_.empty()) {
+    sender = std::thread([this, &sent] {
+      for (auto& send : sends_) {
+        sent = sent && send();
+      }
+    });
+  }
+  bool ok = true;
+  size_t next_op = 0;
+  for (auto step : steps_) {
+    if (step < 0) {
+      ok = ops_[next_op++]() && ok;
+    } else {
+      ok = RunBucket(buckets_[step]) && ok;
+    }
+  }
+  if (sender.joinable()) {
+    sender.join();
+  }
+  buckets_.clear();
+  steps_.clear();
+  ops_.clear();
+  sends_.clear();
+  return ok && sent;
+}
+
+bool Group::RunBucket(const Bucket& bucket) {
+  auto elem = DataTypeSize(bucket.data_type);
+  if (bucket.members.size() == 1) {
+    auto& args = bucket.members[0];
+    return bucket.comm->AllReduce(
+        args.send, args.recv, args.count, bucket.data_type, bucket.op);
+  }
+  std::vector<char> fused(bucket.count * elem);
+  auto* ptr = fused.data();
+  for (auto& args : bucket.members) {
+    std::memcpy(ptr, args.send, args.count * elem);
+    ptr += args.count * elem;
+  }
+  if (!bucket.comm->AllReduce(fused.data(),
+                              fused.data(),
+                              bucket.count,
+                              bucket.data_type,
+                              bucket.op)) {
+    return false;
+  }
+  ptr = fused.data();
+  for (auto& args : bucket.members) {
+    std::memcpy(args.recv, ptr, args.count * elem);
+    ptr += args.count * elem;
+  }
+  return true;
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,179 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <string>
+#include <vector>
+
+#include "paddle/phi/backends/device_ext.h"
+
+namespace custom_cpu {
+
+// Bytes of one element, 0 for types the collectives do not support.
+size_t DataTypeSize(C_DataType data_type);
+
+// Whether op is defined for data_type, MAX and MIN are not for complex.
+bool ReduceOpSupported(C_DataType data_type, C_CCLReduceOp op);
+
+// dst[i] = op(srcs[0][i], ..., srcs[n - 1][i]) / divisor for i < count,
+// reduced in the order of srcs. AVG sums, leaving the division to the
+// caller. dst may be one of srcs.
+void ReduceBuffers(const char* const* srcs,
+                   size_t n,
+                   size_t count,
+                   C_DataType data_type,
+                   C_CCLReduceOp op,
+                   size_t divisor,
+                   char* dst);
+
+// Fills id, of size bytes, with a new NUL terminated unique id. Ranks on
+// other hosts reach this process through the id to set up a communicator,
+// so it must be called by the process of rank 0. false on failure.
+bool NewUniqueId(char* id, size_t size);
+
+// The ranks of a communicator and the transport they talk through.
+// ShmCommunicator serves ranks on one host, TcpCommunicator ranks on any
+// number of hosts; FLAGS_custom_cpu_ccl_transport ("auto", "shm" or "tcp")
+// picks one, "auto" the shared memory when all ranks are on one host.
+//
+// All calls but Send and Recv are collective: every rank has to make the
+// same calls in the same order. Buffers follow the NCCL conventions, also
+// for working in place. Results are bitwise equal on all ranks. Calls
+// return false once the transport failed, e.g. when a peer is gone; the
+// communicator is of no further use then.
+class Communicator {
+ public:
+  // Blocks until all nranks ranks have joined; nullptr on failure.
+  static Communicator* Create(const std::string& unique_id,
+                              size_t nranks,
+                              size_t rank);
+  virtual ~Communicator() = default;
+
+  Communicator(const Communicator&) = delete;
+  Communicator& operator=(const Communicator&) = delete;
+
+  size_t rank() const { return rank_; }
+  size_t nranks() const { return nranks_; }
+
+  // recv = op(send of every rank), element-wise.
+  virtual bool AllReduce(const void* send,
+                         void* recv,
+                         size_t count,
+                         C_DataType data_type,
+                         C_CCLReduceOp op) = 0;
+
+  // recv on root = op(send of every rank). recv is unused elsewhere.
+  virtual bool Reduce(const void* send,
+                      void* recv,
+                      size_t count,
+                      C_DataType data_type,
+                      C_CCLReduceOp op,
+                      size_t root) = 0;
+
+  // buf = buf of root.
+  virtual bool Broadcast(void* buf,
+                         size_t count,
+                         C_DataType data_type,
+                         size_t root) = 0;
+
+  // recv[r * count, (r + 1) * count) = send of rank r.
+  virtual bool AllGather(const void* send,
+                         void* recv,
+                         size_t count,
+                         C_DataType data_type) = 0;
+
+  // recv = op(send[rank * count, (rank + 1) * count) of every rank).
+  virtual bool ReduceScatter(const void* send,
+                             void* recv,
+                             size_t count,
+                             C_DataType data_type,
+                             C_CCLReduceOp op) = 0;
+
+  // May return before peer receives, but a large message waits for it.
+  virtual bool Send(const void* buf,
+                    size_t count,
+                    C_DataType data_type,
+                    size_t peer) = 0;
+  virtual bool Recv(void* buf,
+                    size_t count,
+                    C_DataType data_type,
+                    size_t peer) = 0;
+
+  virtual bool Barrier() = 0;
+
+ protected:
+  Communicator(size_t nranks, size_t rank) : nranks_(nranks), rank_(rank) {}
+
+  const size_t nranks_;
+  const size_t rank_;
+};
+
+// The collectives a thread issues between GroupStart and the matching
+// GroupEnd, which may nest. Nothing runs before the outermost GroupEnd.
+// Then the allreduces are fused: those on the same communicator with the
+// same data type and op are packed into one buffer and reduced by a single
+// AllReduce, at the place of the first of them. The other operations run
+// in issue order, except for sends, which run on a helper thread
+// concurrently with the rest, so that ranks sending to each other do not
+// wait on each other's receives.
+class Group {
+ public:
+  static Group& Current();
+
+  void Start() { ++depth_; }
+  bool active() const { return depth_ > 0; }
+
+  void AddAllReduce(Communicator* comm,
+                    const void* send,
+                    void* recv,
+                    size_t count,
+                    C_DataType data_type,
+                    C_CCLReduceOp op);
+  void AddSend(std::function<bool()> send);
+  void Add(std::function<bool()> op);
+
+  // false without a group to end or when an operation of it failed.
+  bool End();
+
+ private:
+  struct AllReduceArgs {
+    const void* send;
+    void* recv;
+    size_t count;
+  };
+
+  struct Bucket {
+    Communicator* comm;
+    C_DataType data_type;
+    C_CCLReduceOp op;
+    size_t count;
+    std::vector<AllReduceArgs> members;
+  };
+
+  bool Run();
+  static bool RunBucket(const Bucket& bucket);
+
+  int depth_ = 0;
+  std::vector<Bucket> buckets_;
+  // Buckets appear as their index, others as -1 with the next of ops_.
+  std::vector<int> steps_;
+  std::vector<std::function<bool()>> ops_;
+  std::vector<std::function<bool()>> sends_;
+};
+
+}  // namespace custom_cpu
@@ -0,0 +1,160 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/memory_budget.h"
+
+#include <unistd.h>
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <mutex>
+#include <vector>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+namespace {
+
+constexpr size_t kMaxDevices = 128;
+
+int64_t NowMs() {
+  return std::chrono::duration_cast<std::chrono::milliseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+// Returns 0 when /proc/meminfo can not be read.
+size_t ReadMemAvailable() {
+  FILE* fp = fopen("/proc/meminfo", "r");
+  if (!fp) {
+    return 0;
+  }
+  char line[256];
+  size_t available = 0;
+  size_t free = 0;
+  while (fgets(line, sizeof(line), fp)) {
+    if (sscanf(line, "MemAvailable: %zu kB", &available) == 1) {
+      break;
+    }
+    // Kernels before 3.14 have no MemAvailable.
+    sscanf(line, "MemFree: %zu kB", &free);
+  }
+  fclose(fp);
+  return (available ? available : free) * 1024;
+}
+
+size_t DeviceLimit(size_t device_id) {
+  std::vector<size_t> limits_mb;
+  const char* list = EnvToString("FLAGS_custom_cpu_device_memory_limit_mb", "");
+  while (*list) {
+    char* end;
+    limits_mb.push_back(strtoul(list, &end, 10));
+    list = *end == ',' ? end + 1 : end + strlen(end);
+  }
+  size_t limit_mb = 0;
+  if (limits_mb.size() == 1) {
+    limit_mb = limits_mb[0];
+  } else if (device_id < limits_mb.size()) {
+    limit_mb = limits_mb[device_id];
+  }
+  if (limit_mb > 0) {
+    return limit_mb << 20;
+  }
+  auto fraction =
+      strtod(EnvToString("FLAGS_custom_cpu_memory_fraction", "0"), nullptr);
+  if (fraction <= 0 || fraction > 1) {
+    return 0;
+  }
+  return static_cast<size_t>(static_cast<double>(SystemMemory::Total()) *
+                             fraction);
+}
+
+}  // namespace
+
+size_t SystemMemory::Total() {
+  static const size_t total = static_cast<size_t>(sysconf(_SC_PHYS_PAGES)) *
+                              static_cast<size_t>(sysconf(_SC_PAGE_SIZE));
+  return total;
+}
+
+size_t SystemMemory::Available() {
+  static const int64_t interval_ms =
+      EnvToInt("FLAGS_custom_cpu_meminfo_interval_ms", 1000);
+  static std::atomic<size_t> available{0};
+  static std::atomic<int64_t> sampled_ms{-1};
+  static std::mutex mutex;
+
+  auto now = NowMs();
+  auto last = sampled_ms.load(std::memory_order_acquire);
+  // Only one caller refreshes the sample, the others keep the old one.
+  if ((last < 0 || now - last >= interval_ms) && mutex.try_lock()) {
+    auto value = ReadMemAvailable();
+    available.store(value ? value : Total(), std::memory_order_relaxed);
+    sampled_ms.store(now, std::memory_order_release);
+    mutex.unlock();
+  } else if (last < 0) {
+    // The first sample is still being taken by another thread.
+    return Total();
+  }
+  return available.load(std::memory_order_relaxed);
+}
+
+MemoryBudget& MemoryBudget::Device(size_t device_id) {
+  static auto* budgets = [] {
+    auto* budgets = new std::vector<MemoryBudget*>();
+    for (size_t i = 0; i < kMaxDevices; ++i) {
+      budgets->push_back(new MemoryBudget(DeviceLimit(i)));
+    }
+    return budgets;
+  }();
+  return *(*budgets)[device_id % kMaxDevices];
+}
+
+MemoryBudget& MemoryBudget::Host() {
+  static auto* budget = new MemoryBudget(SystemMemory::Total());
+  return *budget;
+}
+
+bool MemoryBudget::TryReserve(size_t bytes) {
+  if (limit_ == 0) {
+    reserved_ += bytes;
+    return true;
+  }
+  auto reserved = reserved_.load(std::memory_order_relaxed);
+  do {
+    if (reserved + bytes > limit_) {
+      return false;
+    }
+  } while (!reserved_.compare_exchange_weak(reserved, reserved + bytes));
+  return true;
+}
+
+void MemoryBudget::Release(size_t bytes) { reserved_ -= bytes; }
+
+void MemoryBudget::Stats(size_t* total, size_t* free) const {
+  if (limit_ == 0) {
+    *total = SystemMemory::Total();
+    *free = SystemMemory::Available() / 2;
+    return;
+  }
+  auto reserved = std::min(reserved_.load(), limit_);
+  *total = limit_;
+  *free = std::min(limit_ - reserved, SystemMemory::Available());
+}
+
+}  // namespace custom_cpu
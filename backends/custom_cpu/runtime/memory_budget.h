@@ -0,0 +1,68 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+
+namespace custom_cpu {
+
+// Memory of the host, MemTotal is read once and MemAvailable is re-read
+// from /proc/meminfo at most every FLAGS_custom_cpu_meminfo_interval_ms
+// (default 1000) milliseconds. Callers in between get the last sample.
+class SystemMemory {
+ public:
+  static size_t Total();
+  static size_t Available();
+};
+
+// The bytes a logical device may hold from the system. The limit of device
+// i comes from FLAGS_custom_cpu_device_memory_limit_mb: a single value
+// applies to every device, a comma separated list gives one value per
+// device id, and missing or zero entries fall back to
+// FLAGS_custom_cpu_memory_fraction of MemTotal. Without either flag a
+// device is only bounded by the host, as any host allocation is.
+// Reservations are atomic counters, so neither reserving nor querying takes
+// a lock or touches the file system.
+class MemoryBudget {
+ public:
+  static MemoryBudget& Device(size_t device_id);
+  // Host memory is only bounded by the host.
+  static MemoryBudget& Host();
+
+  MemoryBudget(const MemoryBudget&) = delete;
+  MemoryBudget& operator=(const MemoryBudget&) = delete;
+
+  // Accounts for bytes if they fit in the limit.
+  bool TryReserve(size_t bytes);
+  void Release(size_t bytes);
+
+  // 0 when there is no limit.
+  size_t limit() const { return limit_; }
+  size_t reserved() const { return reserved_.load(); }
+
+  // total is the limit; free is what is left of it, bounded by the memory
+  // the host still has available. Without a limit total is MemTotal and
+  // free half of MemAvailable, the share the plugin has always reported.
+  void Stats(size_t* total, size_t* free) const;
+
+ private:
+  explicit MemoryBudget(size_t limit) : limit_(limit) {}
+
+  const size_t limit_;
+  std::atomic<size_t> reserved_{0};
+};
+
+}  // namespace custom_cpu
@@ -14,7 +14,6 @@
 
 #include <errno.h>
 #include <fcntl.h>
-#include <semaphore.h>
 #include <sys/types.h>
 #include <sys/wait.h>
 #include <unistd.h>
@@ -22,13 +21,17 @@
 #include <cstdint>
 #include <cstdio>
 #include <cstring>
+#include <functional>
 #include <iostream>
+#include <string>
+#include <utility>
 
 #include "paddle/phi/backends/device_ext.h"
-
-#define MEMORY_FRACTION 0.5f
-
-static int global_current_device = 0;
+#include "runtime/allocator.h"
+#include "runtime/collective.h"
+#include "runtime/memory_budget.h"
+#include "runtime/topology.h"
+#include "runtime/zero_copy.h"
 
 C_Status Init() {
   std::cout << "custom_cpu plugin compiled with ";
@@ -40,33 +43,41 @@ C_Status Init() {
   return C_SUCCESS;
 }
 
-C_Status InitDevice(const C_Device device) {
-  global_current_device = device->id;
-  return C_SUCCESS;
-}
-
+// The calling thread is moved to the cores of the device it selects, the
+// first time it selects it.
 C_Status SetDevice(const C_Device device) {
-  global_current_device = device->id;
+  static thread_local int bound_device = -1;
+  custom_cpu::SetCurrentDevice(device->id);
+  if (bound_device != device->id) {
+    custom_cpu::BindThreadToDevice(pthread_self(), device->id);
+    bound_device = device->id;
+  }
   return C_SUCCESS;
 }
 
+C_Status InitDevice(const C_Device device) { return SetDevice(device); }
+
 C_Status GetDevice(const C_Device device) {
-  device->id = global_current_device;
+  device->id = static_cast<int>(custom_cpu::GetCurrentDevice());
   return C_SUCCESS;
 }
 
-C_Status DestroyDevice(const C_Device device) { return C_SUCCESS; }
+C_Status DestroyDevice(const C_Device device) {
+  custom_cpu::CachingAllocator::Device(device->id).EmptyCache();
+  return C_SUCCESS;
+}
 
 C_Status Finalize() { return C_SUCCESS; }
 
 C_Status GetDevicesCount(size_t *count) {
-  *count = 2;
+  *count = custom_cpu::GetLogicalDevices().size();
   return C_SUCCESS;
 }
 
 C_Status GetDevicesList(size_t *devices) {
-  devices[0] = 0;
-  devices[1] = 1;
+  for (size_t i = 0; i < custom_cpu::GetLogicalDevices().size(); ++i) {
+    devices[i] = i;
+  }
   return C_SUCCESS;
 }
 
@@ -107,7 +118,7 @@ C_Status AsyncMemCpyP2P(const C_Device dst_device,
 }
 
 C_Status Allocate(const C_Device device, void **ptr, size_t size) {
-  auto data = malloc(size);
+  auto data = custom_cpu::CachingAllocator::Device(device->id).Allocate(size);
   if (data) {
     *ptr = data;
     return C_SUCCESS;
@@ -118,12 +129,27 @@ C_Status Allocate(const C_Device device, void **ptr, size_t size) {
 }
 
 C_Status Deallocate(const C_Device device, void *ptr, size_t size) {
-  free(ptr);
+  custom_cpu::SharedBuffers::Instance().Remove(ptr, size);
+  custom_cpu::CachingAllocator::Device(device->id).Free(ptr, size);
   return C_SUCCESS;
 }
 
+C_Status HostAllocate(const C_Device device, void **ptr, size_t size) {
+  *ptr = custom_cpu::CachingAllocator::Host().Allocate(size);
+  return *ptr ? C_SUCCESS : C_FAILED;
+}
+
+C_Status HostDeallocate(const C_Device device, void *ptr, size_t size) {
+  custom_cpu::CachingAllocator::Host().Free(ptr, size);
+  return C_SUCCESS;
+}
+
+// Kernels run on the calling thread as soon as they are launched, and so do
+// copies, callbacks and collectives. Everything issued on a stream has
+// finished when its call returns, so streams and events carry no state and
+// there is never anything to wait for.
 C_Status CreateStream(const C_Device device, C_Stream *stream) {
-  stream = nullptr;
+  *stream = nullptr;
   return C_SUCCESS;
 }
 
@@ -132,6 +158,7 @@ C_Status DestroyStream(const C_Device device, C_Stream stream) {
 }
 
 C_Status CreateEvent(const C_Device device, C_Event *event) {
+  *event = nullptr;
   return C_SUCCESS;
 }
 
@@ -139,6 +166,8 @@ C_Status RecordEvent(const C_Device device, C_Stream stream, C_Event event) {
   return C_SUCCESS;
 }
 
+C_Status QueryEvent(const C_Device device, C_Event event) { return C_SUCCESS; }
+
 C_Status DestroyEvent(const C_Device device, C_Event event) {
   return C_SUCCESS;
 }
@@ -149,6 +178,17 @@ C_Status SyncStream(const C_Device device, C_Stream stream) {
   return C_SUCCESS;
 }
 
+// The work issued before the callback is done, so it runs right away. There
+// is no one left to report its status to.
+C_Status AddCallback(const C_Device device,
+                     C_Stream stream,
+                     C_Callback callback,
+                     void *user_data) {
+  C_Status status = C_SUCCESS;
+  callback(device, stream, user_data, &status);
+  return C_SUCCESS;
+}
+
 C_Status SyncEvent(const C_Device device, C_Event event) { return C_SUCCESS; }
 
 C_Status StreamWaitEvent(const C_Device device,
@@ -162,79 +202,100 @@ C_Status VisibleDevices(size_t *devices) { return C_SUCCESS; }
 C_Status DeviceMemStats(const C_Device device,
                         size_t *total_memory,
                         size_t *free_memory) {
-  float memusage;
-  FILE *fp;
-  char buffer[1024];
-  size_t byte_read;
-  char *pos;
+  custom_cpu::MemoryBudget::Device(device->id).Stats(total_memory, free_memory);
+  return C_SUCCESS;
+}
 
-  fp = fopen("/proc/meminfo", "r");
-  byte_read = fread(buffer, 1, sizeof(buffer), fp);
-  fclose(fp);
-  buffer[byte_read] = '\0';
-  pos = strstr(buffer, "MemTotal:");
-  sscanf(pos, "MemTotal: %lu kB", total_memory);
-  pos = strstr(pos, "MemFree:");
-  sscanf(pos, "MemFree: %lu kB", free_memory);
-  *total_memory = *total_memory * 1024;
-  *free_memory = *free_memory * 1024;
-  *free_memory = *free_memory * MEMORY_FRACTION;
+C_Status DeviceMinChunkSize(const C_Device device, size_t *size) {
+  *size = custom_cpu::CachingAllocator::kMinBlockSize;
+  return C_SUCCESS;
+}
 
+// Allocator counters, cache trimming and collective groups, exported for
+// tools and tests (e.g. through ctypes). The device interface has no entry
+// for the first two, and Paddle only opens groups around its own calls.
+extern "C" {
+
+C_Status CustomCPUMemoryStats(size_t device_id,
+                              size_t *reserved,
+                              size_t *in_use,
+                              size_t *peak_in_use) {
+  auto stats = custom_cpu::CachingAllocator::Device(device_id).Stats();
+  *reserved = stats.reserved;
+  *in_use = stats.in_use;
+  *peak_in_use = stats.peak_in_use;
   return C_SUCCESS;
 }
 
-C_Status DeviceMinChunkSize(const C_Device device, size_t *size) {
-  *size = 512;
+C_Status CustomCPUEmptyCache(size_t device_id) {
+  custom_cpu::CachingAllocator::Device(device_id).EmptyCache();
+  custom_cpu::CachingAllocator::Host().EmptyCache();
+  return C_SUCCESS;
+}
+
+// Same as xccl_group_start and xccl_group_end, for the calling thread.
+C_Status CustomCPUGroupStart() {
+  custom_cpu::Group::Current().Start();
   return C_SUCCESS;
 }
 
-struct C_CCLComm_st {
-  size_t rank;
-  size_t nranks;
-  sem_t *sig;
-  sem_t *sig_2;
-  std::string sig_name;
-  std::string sig_2_name;
-};
+C_Status CustomCPUGroupEnd() {
+  return custom_cpu::Group::Current().End() ? C_SUCCESS : C_FAILED;
+}
+
+}  // extern "C"
+
+// Collectives run on the calling thread and have finished when they return,
+// the stream they are issued on is ignored. They can not overlap compute,
+// which runs on the calling thread too and leaves no queue to order them
+// on.
+static custom_cpu::Communicator *ToComm(C_CCLComm comm) {
+  return reinterpret_cast<custom_cpu::Communicator *>(comm);
+}
+
+// Runs op now, or at the end of the group the calling thread has open,
+// which reports its failure.
+static C_Status RunOrQueue(std::function<bool()> op) {
+  auto &group = custom_cpu::Group::Current();
+  if (group.active()) {
+    group.Add(std::move(op));
+    return C_SUCCESS;
+  }
+  return op() ? C_SUCCESS : C_FAILED;
+}
+
+// Room for the shared memory name and the bootstrap address.
+constexpr size_t kUniqueIdSize = 64;
 
-// for unittest
 C_Status XcclGetUniqueIdSize(size_t *sz) {
-  *sz = sizeof(size_t);
+  *sz = kUniqueIdSize;
   return C_SUCCESS;
 }
 
+// Called by rank 0 only, whose process then waits for the others.
 C_Status XcclGetUniqueId(C_CCLRootId *unique_id) {
-  auto ptr = reinterpret_cast<int8_t *>(unique_id->data);
-  for (auto i = 0; i < unique_id->sz - 1; ++i) {
-    ptr[i] = static_cast<int8_t>(std::rand() % ('z' - 'a') + 'a');
-  }
-  ptr[unique_id->sz - 1] = '\0';
-  return C_SUCCESS;
+  return custom_cpu::NewUniqueId(reinterpret_cast<char *>(unique_id->data),
+                                 unique_id->sz)
+             ? C_SUCCESS
+             : C_FAILED;
 }
 
 C_Status XcclCommInitRank(size_t ranks,
                           C_CCLRootId *unique_id,
                           size_t rank,
                           C_CCLComm *comm) {
-  auto sig = sem_open(static_cast<char *>(unique_id->data), O_CREAT, 0644, 0);
-  auto sig_2 =
-      sem_open(static_cast<char *>(unique_id->data) + 1, O_CREAT, 0644, 0);
-  *comm =
-      new C_CCLComm_st({rank,
-                        ranks,
-                        sig,
-                        sig_2,
-                        std::string(static_cast<char *>(unique_id->data)),
-                        std::string(static_cast<char *>(unique_id->data) + 1)});
+  std::string id(static_cast<char *>(unique_id->data),
+                 strnlen(static_cast<char *>(unique_id->data), unique_id->sz));
+  auto communicator = custom_cpu::Communicator::Create(id, ranks, rank);
+  if (!communicator) {
+    return C_FAILED;
+  }
+  *comm = reinterpret_cast<C_CCLComm>(communicator);
   return C_SUCCESS;
 }
 
 C_Status XcclDestroyComm(C_CCLComm comm) {
-  if (comm) {
-    sem_unlink(comm->sig_name.c_str());
-    sem_unlink(comm->sig_2_name.c_str());
-    delete comm;
-  }
+  delete ToComm(comm);
   return C_SUCCESS;
 }
 
@@ -245,20 +306,17 @@ C_Status XcclAllReduce(void *send_buf,
                        C_CCLReduceOp op,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
-
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
-
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+  if (!custom_cpu::ReduceOpSupported(data_type, op)) {
+    return C_FAILED;
   }
-
-  sem_wait(comm->sig_2);
-  return C_SUCCESS;
+  auto &group = custom_cpu::Group::Current();
+  if (group.active()) {
+    group.AddAllReduce(ToComm(comm), send_buf, recv_buf, count, data_type, op);
+    return C_SUCCESS;
+  }
+  return ToComm(comm)->AllReduce(send_buf, recv_buf, count, data_type, op)
+             ? C_SUCCESS
+             : C_FAILED;
 }
 
 C_Status XcclBroadcast(void *buf,
@@ -267,22 +325,101 @@ C_Status XcclBroadcast(void *buf,
                        size_t root,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
+  if (!custom_cpu::DataTypeSize(data_type)) {
+    return C_FAILED;
+  }
+  return RunOrQueue(
+      [=] { return ToComm(comm)->Broadcast(buf, count, data_type, root); });
+}
 
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
+C_Status XcclReduce(void *send_buf,
+                    void *recv_buf,
+                    size_t count,
+                    C_DataType data_type,
+                    C_CCLReduceOp op,
+                    size_t root,
+                    C_CCLComm comm,
+                    C_Stream stream) {
+  if (!custom_cpu::ReduceOpSupported(data_type, op)) {
+    return C_FAILED;
+  }
+  return RunOrQueue([=] {
+    return ToComm(comm)->Reduce(send_buf, recv_buf, count, data_type, op, root);
+  });
+}
 
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+C_Status XcclAllGather(void *send_buf,
+                       void *recv_buf,
+                       size_t count,
+                       C_DataType data_type,
+                       C_CCLComm comm,
+                       C_Stream stream) {
+  if (!custom_cpu::DataTypeSize(data_type)) {
+    return C_FAILED;
   }
+  return RunOrQueue([=] {
+    return ToComm(comm)->AllGather(send_buf, recv_buf, count, data_type);
+  });
+}
 
-  sem_wait(comm->sig_2);
+C_Status XcclReduceScatter(void *send_buf,
+                           void *recv_buf,
+                           size_t count,
+                           C_DataType data_type,
+                           C_CCLReduceOp op,
+                           C_CCLComm comm,
+                           C_Stream stream) {
+  if (!custom_cpu::ReduceOpSupported(data_type, op)) {
+    return C_FAILED;
+  }
+  return RunOrQueue([=] {
+    return ToComm(comm)->ReduceScatter(
+        send_buf, recv_buf, count, data_type, op);
+  });
+}
+
+C_Status XcclGroupStart() {
+  custom_cpu::Group::Current().Start();
   return C_SUCCESS;
 }
 
+C_Status XcclGroupEnd() {
+  return custom_cpu::Group::Current().End() ? C_SUCCESS : C_FAILED;
+}
+
+C_Status XcclSend(void *send_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t dest_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  if (!custom_cpu::DataTypeSize(data_type)) {
+    return C_FAILED;
+  }
+  auto send = [=] {
+    return ToComm(comm)->Send(send_buf, count, data_type, dest_rank);
+  };
+  auto &group = custom_cpu::Group::Current();
+  if (group.active()) {
+    group.AddSend(send);
+    return C_SUCCESS;
+  }
+  return send() ? C_SUCCESS : C_FAILED;
+}
+
+C_Status XcclRecv(void *recv_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t src_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  if (!custom_cpu::DataTypeSize(data_type)) {
+    return C_FAILED;
+  }
+  return RunOrQueue(
+      [=] { return ToComm(comm)->Recv(recv_buf, count, data_type, src_rank); });
+}
+
 C_Status ProfilerInitialize(C_Profiler prof, void **user_data) {
   return C_SUCCESS;
 }
@@ -326,11 +463,13 @@ void InitPlugin(CustomRuntimeParams *params) {
   params->interface->create_event = CreateEvent;
   params->interface->destroy_event = DestroyEvent;
   params->interface->record_event = RecordEvent;
+  params->interface->query_event = QueryEvent;
 
   params->interface->synchronize_device = SyncDevice;
   params->interface->synchronize_stream = SyncStream;
   params->interface->synchronize_event = SyncEvent;
   params->interface->stream_wait_event = StreamWaitEvent;
+  params->interface->stream_add_callback = AddCallback;
 
   params->interface->memory_copy_h2d = MemCpy;
   params->interface->memory_copy_d2d = MemCpy;
@@ -341,10 +480,10 @@ void InitPlugin(CustomRuntimeParams *params) {
   params->interface->async_memory_copy_d2h = AsyncMemCpy;
   params->interface->async_memory_copy_p2p = AsyncMemCpyP2P;
   params->interface->device_memory_allocate = Allocate;
-  params->interface->host_memory_allocate = Allocate;
+  params->interface->host_memory_allocate = HostAllocate;
   params->interface->unified_memory_allocate = Allocate;
   params->interface->device_memory_deallocate = Deallocate;
-  params->interface->host_memory_deallocate = Deallocate;
+  params->interface->host_memory_deallocate = HostDeallocate;
   params->interface->unified_memory_deallocate = Deallocate;
 
   params->interface->get_device_count = GetDevicesCount;
@@ -358,6 +497,13 @@ void InitPlugin(CustomRuntimeParams *params) {
   params->interface->xccl_destroy_comm = XcclDestroyComm;
   params->interface->xccl_all_reduce = XcclAllReduce;
   params->interface->xccl_broadcast = XcclBroadcast;
+  params->interface->xccl_reduce = XcclReduce;
+  params->interface->xccl_all_gather = XcclAllGather;
+  params->interface->xccl_reduce_scatter = XcclReduceScatter;
+  params->interface->xccl_group_start = XcclGroupStart;
+  params->interface->xccl_group_end = XcclGroupEnd;
+  params->interface->xccl_send = XcclSend;
+  params->interface->xccl_recv = XcclRecv;
 
   params->interface->profiler_collect_trace_data = ProfilerCollectData;
   params->interface->profiler_initialize = ProfilerInitialize;
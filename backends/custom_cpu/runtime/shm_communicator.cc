@@ -0,0 +1,425 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/shm_communicator.h"
+
+#include <fcntl.h>
+#include <linux/futex.h>
+#include <sys/mman.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+namespace {
+
+constexpr size_t kHeaderBytes = 4096;
+constexpr size_t kMaxElementBytes = 16;
+
+size_t SlotBytes() {
+  static const size_t bytes = std::max<size_t>(
+      EnvToUInt("FLAGS_custom_cpu_ccl_buffer_mb", 4) << 20, kHeaderBytes);
+  return bytes;
+}
+
+long Futex(std::atomic<uint32_t>* word, int op, uint32_t value) {  // NOLINT
+  return syscall(SYS_futex, word, op, value, nullptr, nullptr, 0);
+}
+
+// Returns the value of word once it differs from value. Spins for a short
+// while, since ranks usually arrive close together, then sleeps.
+uint32_t WaitWhile(std::atomic<uint32_t>* word, uint32_t value) {
+  for (int i = 0; i < 4096; ++i) {
+    auto current = word->load(std::memory_order_acquire);
+    if (current != value) {
+      return current;
+    }
+  }
+  for (;;) {
+    auto current = word->load(std::memory_order_acquire);
+    if (current != value) {
+      return current;
+    }
+    Futex(word, FUTEX_WAIT, value);
+  }
+}
+
+void Wake(std::atomic<uint32_t>* word) { Futex(word, FUTEX_WAKE, INT32_MAX); }
+
+// [begin, end) of the j-th of nranks near equal shares of n elements.
+void Share(size_t n, size_t nranks, size_t j, size_t* begin, size_t* end) {
+  auto share = (n + nranks - 1) / nranks;
+  *begin = std::min(n, j * share);
+  *end = std::min(n, *begin + share);
+}
+
+}  // namespace
+
+// Lives at the start of the segment, zero filled by ftruncate.
+struct ShmCommunicator::Header {
+  // Centralized barrier: the last rank to arrive resets the count and
+  // bumps the generation the others wait on.
+  std::atomic<uint32_t> arrived;
+  std::atomic<uint32_t> generation;
+  std::atomic<uint64_t> slot_bytes;
+};
+
+// Single producer, single consumer ring from one rank to another. The
+// positions count bytes modulo 2^32 and each sits on its own cache line.
+struct ShmCommunicator::Channel {
+  alignas(64) std::atomic<uint32_t> head;  // written by the sender
+  alignas(64) std::atomic<uint32_t> tail;  // written by the receiver
+};
+
+ShmCommunicator* ShmCommunicator::Create(const std::string& unique_id,
+                                         size_t nranks,
+                                         size_t rank) {
+  auto* comm = new ShmCommunicator(nranks, rank);
+  if (!comm->Attach("/custom_cpu_ccl_" + unique_id)) {
+    delete comm;
+    return nullptr;
+  }
+  return comm;
+}
+
+bool ShmCommunicator::Attach(const std::string& name) {
+  static_assert(sizeof(Header) <= kHeaderBytes, "");
+  auto slot_bytes = SlotBytes();
+  // ReduceScatter stages a piece of every rank's share in a slot.
+  if (slot_bytes < nranks_ * kMaxElementBytes) {
+    return false;
+  }
+  // A power of two, so that the ring positions may wrap.
+  size_t ring_bytes = kHeaderBytes;
+  while (ring_bytes * 2 <= slot_bytes / nranks_) {
+    ring_bytes *= 2;
+  }
+  auto data_bytes = 2 * nranks_ * slot_bytes;
+  auto channel_bytes = nranks_ * nranks_ * sizeof(Channel);
+  channel_bytes =
+      (channel_bytes + kHeaderBytes - 1) / kHeaderBytes * kHeaderBytes;
+  auto size = kHeaderBytes + data_bytes + channel_bytes +
+              nranks_ * nranks_ * ring_bytes;
+  int fd = shm_open(name.c_str(), O_CREAT | O_RDWR, 0600);
+  if (fd < 0) {
+    return false;
+  }
+  // Every rank sizes the segment alike, so the order does not matter.
+  if (ftruncate(fd, size) != 0) {
+    close(fd);
+    return false;
+  }
+  auto* ptr = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  close(fd);
+  if (ptr == MAP_FAILED) {
+    return false;
+  }
+  header_ = static_cast<Header*>(ptr);
+  data_ = static_cast<char*>(ptr) + kHeaderBytes;
+  channels_ = reinterpret_cast<Channel*>(data_ + data_bytes);
+  rings_ = data_ + data_bytes + channel_bytes;
+  mapped_bytes_ = size;
+  slot_bytes_ = slot_bytes;
+  ring_bytes_ = ring_bytes;
+
+  uint64_t expected = 0;
+  if (!header_->slot_bytes.compare_exchange_strong(expected, slot_bytes) &&
+      expected != slot_bytes) {
+    // FLAGS_custom_cpu_ccl_buffer_mb differs between the ranks.
+    return false;
+  }
+  Barrier();
+  // Everyone has the segment mapped, the name is no longer needed.
+  if (rank_ == 0) {
+    shm_unlink(name.c_str());
+  }
+  return true;
+}
+
+ShmCommunicator::~ShmCommunicator() {
+  if (header_) {
+    munmap(header_, mapped_bytes_);
+  }
+}
+
+bool ShmCommunicator::Barrier() {
+  auto generation = header_->generation.load(std::memory_order_acquire);
+  if (header_->arrived.fetch_add(1, std::memory_order_acq_rel) + 1 == nranks_) {
+    header_->arrived.store(0, std::memory_order_relaxed);
+    header_->generation.fetch_add(1, std::memory_order_release);
+    Wake(&header_->generation);
+    return true;
+  }
+  WaitWhile(&header_->generation, generation);
+  return true;
+}
+
+char* ShmCommunicator::Slot(size_t rank) const {
+  return data_ + ((round_ % 2) * nranks_ + rank) * slot_bytes_;
+}
+
+// Rank r reduces the r-th share of the n elements staged in the slots of
+// the round across all ranks, in rank order, into its own slot. Waits for
+// the slots to be filled first and for every share to be done after.
+void ShmCommunicator::ReduceRound(size_t n,
+                                  C_DataType data_type,
+                                  C_CCLReduceOp op) {
+  auto elem = DataTypeSize(data_type);
+  auto divisor = op == C_CCLReduceOp::AVG ? nranks_ : 1;
+  size_t begin, end;
+  Share(n, nranks_, rank_, &begin, &end);
+  std::vector<const char*> srcs(nranks_);
+  for (size_t j = 0; j < nranks_; ++j) {
+    srcs[j] = Slot(j) + begin * elem;
+  }
+  Barrier();
+  ReduceBuffers(srcs.data(),
+                nranks_,
+                end - begin,
+                data_type,
+                op,
+                divisor,
+                Slot(rank_) + begin * elem);
+  Barrier();
+}
+
+// Every round: each rank copies its part of the message into its slot,
+// the shares are reduced (reduce-scatter), and every rank copies the
+// reduced shares of all ranks out (all-gather). Alternating the set of
+// slots between rounds saves the barrier that would keep the next round
+// from overwriting slots others are still copying out of, and lets the
+// copy-in of a round overlap with the slower ranks' copy-out of the last.
+bool ShmCommunicator::AllReduce(const void* send,
+                                void* recv,
+                                size_t count,
+                                C_DataType data_type,
+                                C_CCLReduceOp op) {
+  auto elem = DataTypeSize(data_type);
+  auto* src = static_cast<const char*>(send);
+  auto* dst = static_cast<char*>(recv);
+  if (nranks_ == 1) {
+    const char* srcs[] = {src};
+    ReduceBuffers(srcs, 1, count, data_type, op, 1, dst);
+    return true;
+  }
+  auto per_round = slot_bytes_ / elem;
+  for (size_t done = 0; done < count; done += per_round, ++round_) {
+    auto n = std::min(per_round, count - done);
+    std::memcpy(Slot(rank_), src + done * elem, n * elem);
+    ReduceRound(n, data_type, op);
+    for (size_t j = 0; j < nranks_; ++j) {
+      size_t begin, end;
+      Share(n, nranks_, j, &begin, &end);
+      std::memcpy(dst + (done + begin) * elem,
+                  Slot(j) + begin * elem,
+                  (end - begin) * elem);
+    }
+  }
+  return true;
+}
+
+// Like AllReduce, with only root copying the shares out.
+bool ShmCommunicator::Reduce(const void* send,
+                             void* recv,
+                             size_t count,
+                             C_DataType data_type,
+                             C_CCLReduceOp op,
+                             size_t root) {
+  if (nranks_ == 1) {
+    AllReduce(send, recv, count, data_type, op);
+    return true;
+  }
+  auto elem = DataTypeSize(data_type);
+  auto* src = static_cast<const char*>(send);
+  auto* dst = static_cast<char*>(recv);
+  auto per_round = slot_bytes_ / elem;
+  for (size_t done = 0; done < count; done += per_round, ++round_) {
+    auto n = std::min(per_round, count - done);
+    std::memcpy(Slot(rank_), src + done * elem, n * elem);
+    ReduceRound(n, data_type, op);
+    if (rank_ == root) {
+      for (size_t j = 0; j < nranks_; ++j) {
+        size_t begin, end;
+        Share(n, nranks_, j, &begin, &end);
+        std::memcpy(dst + (done + begin) * elem,
+                    Slot(j) + begin * elem,
+                    (end - begin) * elem);
+      }
+    }
+  }
+  return true;
+}
+
+// Every round root stages a piece in its slot and the other ranks copy it
+// out concurrently.
+bool ShmCommunicator::Broadcast(void* buf,
+                                size_t count,
+                                C_DataType data_type,
+                                size_t root) {
+  if (nranks_ == 1) {
+    return true;
+  }
+  auto elem = DataTypeSize(data_type);
+  auto* data = static_cast<char*>(buf);
+  auto per_round = slot_bytes_ / elem;
+  for (size_t done = 0; done < count; done += per_round, ++round_) {
+    auto n = std::min(per_round, count - done);
+    if (rank_ == root) {
+      std::memcpy(Slot(root), data + done * elem, n * elem);
+    }
+    Barrier();
+    if (rank_ != root) {
+      std::memcpy(data + done * elem, Slot(root), n * elem);
+    }
+  }
+  return true;
+}
+
+// Every round each rank stages the next piece of its input in its slot and
+// copies the pieces of all ranks out.
+bool ShmCommunicator::AllGather(const void* send,
+                                void* recv,
+                                size_t count,
+                                C_DataType data_type) {
+  auto elem = DataTypeSize(data_type);
+  auto* src = static_cast<const char*>(send);
+  auto* dst = static_cast<char*>(recv);
+  if (nranks_ == 1) {
+    if (src != dst) {
+      std::memcpy(dst, src, count * elem);
+    }
+    return true;
+  }
+  auto per_round = slot_bytes_ / elem;
+  for (size_t done = 0; done < count; done += per_round, ++round_) {
+    auto n = std::min(per_round, count - done);
+    std::memcpy(Slot(rank_), src + done * elem, n * elem);
+    Barrier();
+    for (size_t j = 0; j < nranks_; ++j) {
+      std::memcpy(dst + (j * count + done) * elem, Slot(j), n * elem);
+    }
+  }
+  return true;
+}
+
+// Every round each rank stages the next piece of every rank's share of its
+// input, one after the other, in its slot; then rank r reduces the r-th
+// piece across all slots straight into recv.
+bool ShmCommunicator::ReduceScatter(const void* send,
+                                    void* recv,
+                                    size_t count,
+                                    C_DataType data_type,
+                                    C_CCLReduceOp op) {
+  auto elem = DataTypeSize(data_type);
+  auto divisor = op == C_CCLReduceOp::AVG ? nranks_ : 1;
+  auto* src = static_cast<const char*>(send);
+  auto* dst = static_cast<char*>(recv);
+  if (nranks_ == 1) {
+    const char* srcs[] = {src};
+    ReduceBuffers(srcs, 1, count, data_type, op, divisor, dst);
+    return true;
+  }
+  std::vector<const char*> srcs(nranks_);
+  auto per_round = slot_bytes_ / elem / nranks_;
+  for (size_t done = 0; done < count; done += per_round, ++round_) {
+    auto n = std::min(per_round, count - done);
+    for (size_t j = 0; j < nranks_; ++j) {
+      std::memcpy(Slot(rank_) + j * n * elem,
+                  src + (j * count + done) * elem,
+                  n * elem);
+    }
+    Barrier();
+    for (size_t j = 0; j < nranks_; ++j) {
+      srcs[j] = Slot(j) + rank_ * n * elem;
+    }
+    ReduceBuffers(
+        srcs.data(), nranks_, n, data_type, op, divisor, dst + done * elem);
+  }
+  return true;
+}
+
+ShmCommunicator::Channel* ShmCommunicator::GetChannel(size_t from,
+                                                      size_t to) const {
+  return channels_ + from * nranks_ + to;
+}
+
+char* ShmCommunicator::Ring(size_t from, size_t to) const {
+  return rings_ + (from * nranks_ + to) * ring_bytes_;
+}
+
+// Streams the bytes through the ring to peer, waiting for room as the
+// receiver drains it.
+bool ShmCommunicator::Send(const void* buf,
+                           size_t count,
+                           C_DataType data_type,
+                           size_t peer) {
+  auto* channel = GetChannel(rank_, peer);
+  auto* ring = Ring(rank_, peer);
+  auto* src = static_cast<const char*>(buf);
+  auto bytes = count * DataTypeSize(data_type);
+  auto head = channel->head.load(std::memory_order_relaxed);
+  auto tail = channel->tail.load(std::memory_order_acquire);
+  while (bytes > 0) {
+    while (head - tail == ring_bytes_) {
+      tail = WaitWhile(&channel->tail, tail);
+    }
+    auto offset = head % ring_bytes_;
+    auto n = std::min({bytes,
+                       static_cast<size_t>(ring_bytes_ - (head - tail)),
+                       ring_bytes_ - offset});
+    std::memcpy(ring + offset, src, n);
+    src += n;
+    bytes -= n;
+    head += n;
+    channel->head.store(head, std::memory_order_release);
+    Wake(&channel->head);
+  }
+  return true;
+}
+
+bool ShmCommunicator::Recv(void* buf,
+                           size_t count,
+                           C_DataType data_type,
+                           size_t peer) {
+  auto* channel = GetChannel(peer, rank_);
+  auto* ring = Ring(peer, rank_);
+  auto* dst = static_cast<char*>(buf);
+  auto bytes = count * DataTypeSize(data_type);
+  auto tail = channel->tail.load(std::memory_order_relaxed);
+  auto head = channel->head.load(std::memory_order_acquire);
+  while (bytes > 0) {
+    while (head == tail) {
+      head = WaitWhile(&channel->head, head);
+    }
+    auto offset = tail % ring_bytes_;
+    auto n = std::min(
+        {bytes, static_cast<size_t>(head - tail), ring_bytes_ - offset});
+    std::memcpy(dst, ring + offset, n);
+    dst += n;
+    bytes -= n;
+    tail += n;
+    channel->tail.store(tail, std::memory_order_release);
+    Wake(&channel->tail);
+  }
+  return true;
+}
+
+}  // namespace custom_cpu
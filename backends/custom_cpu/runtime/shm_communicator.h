@@ -0,0 +1,113 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <string>
+
+#include "runtime/collective.h"
+
+namespace custom_cpu {
+
+// Ranks on one host, sharing a POSIX shared memory segment named after
+// the unique id. Besides a barrier the segment holds two sets of one
+// staging slot per rank, used by alternate rounds: a message is moved in
+// rounds of at most a slot per rank, and within a round every rank only
+// works on its own share of the data, so the bandwidth grows with the
+// number of ranks. The slot size comes from FLAGS_custom_cpu_ccl_buffer_mb
+// (default 4), which all ranks must agree on. For Send and Recv every
+// ordered pair of ranks has a ring of the slot size divided by nranks,
+// rounded down to a power of two.
+class ShmCommunicator : public Communicator {
+ public:
+  // Blocks until all nranks ranks have attached; nullptr on failure.
+  static ShmCommunicator* Create(const std::string& unique_id,
+                                 size_t nranks,
+                                 size_t rank);
+  ~ShmCommunicator() override;
+
+  // Every element is reduced by one rank in rank order.
+  bool AllReduce(const void* send,
+                 void* recv,
+                 size_t count,
+                 C_DataType data_type,
+                 C_CCLReduceOp op) override;
+
+  bool Reduce(const void* send,
+              void* recv,
+              size_t count,
+              C_DataType data_type,
+              C_CCLReduceOp op,
+              size_t root) override;
+
+  bool Broadcast(void* buf,
+                 size_t count,
+                 C_DataType data_type,
+                 size_t root) override;
+
+  bool AllGather(const void* send,
+                 void* recv,
+                 size_t count,
+                 C_DataType data_type) override;
+
+  bool ReduceScatter(const void* send,
+                     void* recv,
+                     size_t count,
+                     C_DataType data_type,
+                     C_CCLReduceOp op) override;
+
+  // Returns once the data is in the ring to peer, which holds at most
+  // ring_bytes_: a larger message waits for peer to Recv it.
+  bool Send(const void* buf,
+            size_t count,
+            C_DataType data_type,
+            size_t peer) override;
+  bool Recv(void* buf,
+            size_t count,
+            C_DataType data_type,
+            size_t peer) override;
+
+  bool Barrier() override;
+
+ private:
+  struct Header;
+  struct Channel;
+
+  ShmCommunicator(size_t nranks, size_t rank) : Communicator(nranks, rank) {}
+
+  bool Attach(const std::string& name);
+
+  // Slot of rank in the set of the current round.
+  char* Slot(size_t rank) const;
+
+  void ReduceRound(size_t n, C_DataType data_type, C_CCLReduceOp op);
+
+  Channel* GetChannel(size_t from, size_t to) const;
+  char* Ring(size_t from, size_t to) const;
+
+  Header* header_ = nullptr;
+  char* data_ = nullptr;
+  Channel* channels_ = nullptr;
+  char* rings_ = nullptr;
+  size_t slot_bytes_ = 0;
+  size_t ring_bytes_ = 0;
+  size_t mapped_bytes_ = 0;
+  // Rounds done so far, picks the set of slots.
+  uint64_t round_ = 0;
+};
+
+}  // namespace custom_cpu
@@ -0,0 +1,737 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/tcp_communicator.h"
+
+#include <arpa/inet.h>
+#include <fcntl.h>
+#include <netdb.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <poll.h>
+#include <sys/socket.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cerrno>
+#include <cstring>
+#include <map>
+#include <mutex>
+#include <string>
+#include <utility>
+#include <vector>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+namespace {
+
+// About a minute for the other ranks to come up.
+constexpr int kConnectAttempts = 600;
+constexpr useconds_t kConnectRetryUs = 100 * 1000;
+
+size_t ChunkBytes() {
+  static const size_t bytes = std::max<size_t>(
+      EnvToUInt("FLAGS_custom_cpu_ccl_chunk_kb", 128) << 10, 1);
+  return bytes;
+}
+
+size_t TreeThresholdBytes() {
+  static const size_t bytes =
+      EnvToUInt("FLAGS_custom_cpu_ccl_tree_threshold_kb", 64) << 10;
+  return bytes;
+}
+
+// Bootstrap sockets made by StartBootstrap, by address, until rank 0 of
+// the communicator picks its one up.
+struct Listeners {
+  std::mutex mutex;
+  std::map<std::string, int> fds;
+
+  static Listeners& Instance() {
+    static Listeners listeners;
+    return listeners;
+  }
+};
+
+// Listens on a port picked by the system, returned in network byte order.
+int Listen(uint16_t* port) {
+  int fd = socket(AF_INET, SOCK_STREAM | SOCK_CLOEXEC, 0);
+  if (fd < 0) {
+    return -1;
+  }
+  sockaddr_in addr = {};
+  addr.sin_family = AF_INET;
+  addr.sin_addr.s_addr = htonl(INADDR_ANY);
+  socklen_t len = sizeof(addr);
+  if (bind(fd, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) != 0 ||
+      listen(fd, SOMAXCONN) != 0 ||
+      getsockname(fd, reinterpret_cast<sockaddr*>(&addr), &len) != 0) {
+    close(fd);
+    return -1;
+  }
+  *port = addr.sin_port;
+  return fd;
+}
+
+// Retries while the listener is not up yet.
+int ConnectTo(uint32_t ip, uint16_t port) {
+  sockaddr_in addr = {};
+  addr.sin_family = AF_INET;
+  addr.sin_addr.s_addr = ip;
+  addr.sin_port = port;
+  for (int attempt = 0; attempt < kConnectAttempts; ++attempt) {
+    int fd = socket(AF_INET, SOCK_STREAM | SOCK_CLOEXEC, 0);
+    if (fd < 0) {
+      return -1;
+    }
+    if (connect(fd, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) == 0) {
+      return fd;
+    }
+    close(fd);
+    usleep(kConnectRetryUs);
+  }
+  return -1;
+}
+
+// For the blocking sockets of the bootstrap.
+bool WriteAll(int fd, const void* buf, size_t bytes) {
+  auto* ptr = static_cast<const char*>(buf);
+  while (bytes > 0) {
+    auto n = send(fd, ptr, bytes, MSG_NOSIGNAL);
+    if (n < 0 && errno == EINTR) {
+      continue;
+    }
+    if (n <= 0) {
+      return false;
+    }
+    ptr += n;
+    bytes -= n;
+  }
+  return true;
+}
+
+bool ReadAll(int fd, void* buf, size_t bytes) {
+  auto* ptr = static_cast<char*>(buf);
+  while (bytes > 0) {
+    auto n = recv(fd, ptr, bytes, 0);
+    if (n < 0 && errno == EINTR) {
+      continue;
+    }
+    if (n <= 0) {
+      return false;
+    }
+    ptr += n;
+    bytes -= n;
+  }
+  return true;
+}
+
+std::string HostIp() {
+  std::string host = EnvToString("FLAGS_custom_cpu_ccl_host", "");
+  if (host.empty()) {
+    std::string endpoint = EnvToString("PADDLE_CURRENT_ENDPOINT", "");
+    host = endpoint.substr(0, endpoint.find(':'));
+  }
+  char name[256] = {};
+  if (host.empty() && gethostname(name, sizeof(name) - 1) == 0) {
+    host = name;
+  }
+  addrinfo hints = {};
+  hints.ai_family = AF_INET;
+  addrinfo* result = nullptr;
+  if (host.empty() ||
+      getaddrinfo(host.c_str(), nullptr, &hints, &result) != 0) {
+    return "127.0.0.1";
+  }
+  auto* addr = reinterpret_cast<sockaddr_in*>(result->ai_addr);
+  char ip[INET_ADDRSTRLEN] = {};
+  inet_ntop(AF_INET, &addr->sin_addr, ip, sizeof(ip));
+  freeaddrinfo(result);
+  return ip;
+}
+
+bool ParseAddress(const std::string& address, uint32_t* ip, uint16_t* port) {
+  auto colon = address.rfind(':');
+  if (colon == std::string::npos) {
+    return false;
+  }
+  in_addr addr;
+  if (inet_pton(AF_INET, address.substr(0, colon).c_str(), &addr) != 1) {
+    return false;
+  }
+  *ip = addr.s_addr;
+  *port = htons(static_cast<uint16_t>(std::stoi(address.substr(colon + 1))));
+  return true;
+}
+
+// Element offsets of nranks near equal segments of count elements.
+std::vector<size_t> Segments(size_t count, size_t nranks) {
+  auto share = (count + nranks - 1) / nranks;
+  std::vector<size_t> offsets(nranks + 1);
+  for (size_t j = 0; j <= nranks; ++j) {
+    offsets[j] = std::min(count, j * share);
+  }
+  return offsets;
+}
+
+std::vector<size_t> EqualSegments(size_t count, size_t nranks) {
+  std::vector<size_t> offsets(nranks + 1);
+  for (size_t j = 0; j <= nranks; ++j) {
+    offsets[j] = j * count;
+  }
+  return offsets;
+}
+
+}  // namespace
+
+bool StartBootstrap(std::string* address) {
+  uint16_t port;
+  int fd = Listen(&port);
+  if (fd < 0) {
+    return false;
+  }
+  *address = HostIp() + ":" + std::to_string(ntohs(port));
+  auto& listeners = Listeners::Instance();
+  std::lock_guard<std::mutex> lock(listeners.mutex);
+  listeners.fds[*address] = fd;
+  return true;
+}
+
+// Every rank sends its rank and address to rank 0, which answers with the
+// addresses of all. Rank 0 fills in the ip the others reached it from.
+bool Bootstrap(const std::string& address,
+               size_t nranks,
+               size_t rank,
+               int* listen_fd,
+               std::vector<RankAddress>* ranks) {
+  uint32_t root_ip;
+  uint16_t root_port;
+  if (!ParseAddress(address, &root_ip, &root_port)) {
+    return false;
+  }
+  RankAddress self = {};
+  int fd = Listen(&self.port);
+  if (fd < 0) {
+    return false;
+  }
+  gethostname(self.host, sizeof(self.host) - 1);
+  ranks->assign(nranks, RankAddress());
+  auto table_bytes = nranks * sizeof(RankAddress);
+
+  bool ok = true;
+  if (rank == 0) {
+    int root_fd = -1;
+    {
+      auto& listeners = Listeners::Instance();
+      std::lock_guard<std::mutex> lock(listeners.mutex);
+      auto it = listeners.fds.find(address);
+      if (it != listeners.fds.end()) {
+        root_fd = it->second;
+        listeners.fds.erase(it);
+      }
+    }
+    // The unique id was made by another process.
+    if (root_fd < 0) {
+      close(fd);
+      return false;
+    }
+    self.ip = root_ip;
+    (*ranks)[0] = self;
+    std::vector<int> peers;
+    for (size_t i = 1; ok && i < nranks; ++i) {
+      sockaddr_in addr;
+      socklen_t len = sizeof(addr);
+      int peer = accept(root_fd, reinterpret_cast<sockaddr*>(&addr), &len);
+      if (peer < 0) {
+        ok = false;
+        break;
+      }
+      peers.push_back(peer);
+      uint64_t peer_rank;
+      RankAddress peer_address;
+      ok = ReadAll(peer, &peer_rank, sizeof(peer_rank)) &&
+           ReadAll(peer, &peer_address, sizeof(peer_address)) &&
+           peer_rank > 0 && peer_rank < nranks;
+      if (ok) {
+        peer_address.ip = addr.sin_addr.s_addr;
+        (*ranks)[peer_rank] = peer_address;
+      }
+    }
+    for (auto peer : peers) {
+      ok = ok && WriteAll(peer, ranks->data(), table_bytes);
+      close(peer);
+    }
+    close(root_fd);
+  } else {
+    int root = ConnectTo(root_ip, root_port);
+    uint64_t self_rank = rank;
+    ok = root >= 0 && WriteAll(root, &self_rank, sizeof(self_rank)) &&
+         WriteAll(root, &self, sizeof(self)) &&
+         ReadAll(root, ranks->data(), table_bytes);
+    if (root >= 0) {
+      close(root);
+    }
+  }
+  if (!ok) {
+    close(fd);
+    return false;
+  }
+  *listen_fd = fd;
+  return true;
+}
+
+TcpCommunicator::TcpCommunicator(size_t nranks, size_t rank)
+    : Communicator(nranks, rank), coll_fds_(nranks, -1), p2p_fds_(nranks, -1) {}
+
+TcpCommunicator* TcpCommunicator::Create(int listen_fd,
+                                         const std::vector<RankAddress>& ranks,
+                                         size_t rank) {
+  auto* comm = new TcpCommunicator(ranks.size(), rank);
+  if (!comm->Connect(listen_fd, ranks)) {
+    delete comm;
+    return nullptr;
+  }
+  return comm;
+}
+
+TcpCommunicator::~TcpCommunicator() {
+  for (auto fds : {&coll_fds_, &p2p_fds_}) {
+    for (auto fd : *fds) {
+      if (fd >= 0) {
+        close(fd);
+      }
+    }
+  }
+}
+
+// Every rank connects to the lower ranks and accepts the higher ones. A
+// connection to a rank that is still connecting to others waits in its
+// backlog, so this cannot deadlock.
+bool TcpCommunicator::Connect(int listen_fd,
+                              const std::vector<RankAddress>& ranks) {
+  bool ok = true;
+  for (size_t j = 0; ok && j < rank_; ++j) {
+    for (uint64_t p2p = 0; ok && p2p < 2; ++p2p) {
+      int fd = ConnectTo(ranks[j].ip, ranks[j].port);
+      uint64_t hello[] = {rank_, p2p};
+      ok = fd >= 0 && WriteAll(fd, hello, sizeof(hello));
+      (p2p ? p2p_fds_ : coll_fds_)[j] = fd;
+    }
+  }
+  for (size_t i = rank_ + 1; ok && i < nranks_; ++i) {
+    for (int k = 0; ok && k < 2; ++k) {
+      int fd = accept(listen_fd, nullptr, nullptr);
+      uint64_t hello[2];
+      ok = fd >= 0 && ReadAll(fd, hello, sizeof(hello)) && hello[0] > rank_ &&
+           hello[0] < nranks_;
+      auto& fds = ok && hello[1] ? p2p_fds_ : coll_fds_;
+      if (ok && fds[hello[0]] < 0) {
+        fds[hello[0]] = fd;
+      } else {
+        ok = false;
+        if (fd >= 0) {
+          close(fd);
+        }
+      }
+    }
+  }
+  close(listen_fd);
+  if (!ok) {
+    return false;
+  }
+  for (auto fds : {&coll_fds_, &p2p_fds_}) {
+    for (auto fd : *fds) {
+      if (fd >= 0) {
+        int one = 1;
+        setsockopt(fd, IPPROTO_TCP, TCP_NODELAY, &one, sizeof(one));
+        fcntl(fd, F_SETFL, fcntl(fd, F_GETFL) | O_NONBLOCK);
+      }
+    }
+  }
+  return true;
+}
+
+bool TcpCommunicator::Exchange(
+    int to,
+    const char* send_buf,
+    size_t send_bytes,
+    int from,
+    char* recv_buf,
+    size_t recv_bytes,
+    size_t elem,
+    const std::function<void(size_t, size_t)>& on_chunk,
+    bool forward) {
+  auto chunk = std::max(ChunkBytes() / elem, size_t(1)) * elem;
+  size_t sent = 0, got = 0, seen = 0;
+  while (sent < send_bytes || got < recv_bytes) {
+    auto limit = forward ? got : send_bytes;
+    bool sending = sent < limit;
+    bool receiving = got < recv_bytes;
+    pollfd fds[2];
+    nfds_t nfds = 0;
+    if (sending) {
+      fds[nfds++] = {to, POLLOUT, 0};
+    }
+    if (receiving && sending && from == to) {
+      fds[0].events |= POLLIN;
+    } else if (receiving) {
+      fds[nfds++] = {from, POLLIN, 0};
+    }
+    if (poll(fds, nfds, -1) < 0 && errno != EINTR) {
+      return false;
+    }
+    // Both sockets are non-blocking, trying the one that is not ready is
+    // cheaper than finding out which.
+    if (sending) {
+      auto n = send(
+          to, send_buf + sent, std::min(limit - sent, chunk), MSG_NOSIGNAL);
+      if (n > 0) {
+        sent += n;
+      } else if (errno != EAGAIN && errno != EWOULDBLOCK && errno != EINTR) {
+        return false;
+      }
+    }
+    if (receiving) {
+      auto n = recv(from, recv_buf + got, recv_bytes - got, 0);
+      if (n > 0) {
+        got += n;
+      } else if (n == 0 ||
+                 (errno != EAGAIN && errno != EWOULDBLOCK && errno != EINTR)) {
+        return false;
+      }
+    }
+    while (on_chunk && seen < got &&
+           (got - seen >= chunk || got == recv_bytes)) {
+      auto bytes = std::min(chunk, got - seen);
+      on_chunk(seen, bytes);
+      seen += bytes;
+    }
+  }
+  return true;
+}
+
+bool TcpCommunicator::SendTo(int fd, const void* buf, size_t bytes) {
+  return Exchange(
+      fd, static_cast<const char*>(buf), bytes, fd, nullptr, 0, 1, nullptr);
+}
+
+bool TcpCommunicator::RecvFrom(int fd, void* buf, size_t bytes) {
+  return Exchange(
+      fd, nullptr, 0, fd, static_cast<char*>(buf), bytes, 1, nullptr);
+}
+
+// In step s rank r passes its partial result of segment r - s - 1 on to
+// rank r + 1 and adds its data to the partial result of segment r - s - 2
+// from rank r - 1. After nranks - 1 steps segment r has gone around the
+// whole ring.
+bool TcpCommunicator::RingReduceScatter(char* data,
+                                        const std::vector<size_t>& offsets,
+                                        C_DataType data_type,
+                                        C_CCLReduceOp op,
+                                        size_t divisor) {
+  auto elem = DataTypeSize(data_type);
+  auto next = coll_fds_[(rank_ + 1) % nranks_];
+  auto prev = coll_fds_[(rank_ + nranks_ - 1) % nranks_];
+  size_t max_segment = 0;
+  for (size_t j = 0; j < nranks_; ++j) {
+    max_segment = std::max(max_segment, offsets[j + 1] - offsets[j]);
+  }
+  std::vector<char> partial(max_segment * elem);
+  for (size_t s = 0; s + 1 < nranks_; ++s) {
+    auto send_segment = (rank_ + 2 * nranks_ - s - 1) % nranks_;
+    auto recv_segment = (rank_ + 2 * nranks_ - s - 2) % nranks_;
+    auto step_divisor = s + 2 == nranks_ ? divisor : 1;
+    auto* local = data + offsets[recv_segment] * elem;
+    auto reduce = [&](size_t offset, size_t bytes) {
+      const char* srcs[] = {partial.data() + offset, local + offset};
+      ReduceBuffers(
+          srcs, 2, bytes / elem, data_type, op, step_divisor, local + offset);
+    };
+    if (!Exchange(next,
+                  data + offsets[send_segment] * elem,
+                  (offsets[send_segment + 1] - offsets[send_segment]) * elem,
+                  prev,
+                  partial.data(),
+                  (offsets[recv_segment + 1] - offsets[recv_segment]) * elem,
+                  elem,
+                  reduce)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+bool TcpCommunicator::RingAllGather(char* data,
+                                    const std::vector<size_t>& offsets,
+                                    size_t elem) {
+  auto next = coll_fds_[(rank_ + 1) % nranks_];
+  auto prev = coll_fds_[(rank_ + nranks_ - 1) % nranks_];
+  for (size_t s = 0; s + 1 < nranks_; ++s) {
+    auto send_segment = (rank_ + nranks_ - s) % nranks_;
+    auto recv_segment = (rank_ + nranks_ - s - 1) % nranks_;
+    if (!Exchange(next,
+                  data + offsets[send_segment] * elem,
+                  (offsets[send_segment + 1] - offsets[send_segment]) * elem,
+                  prev,
+                  data + offsets[recv_segment] * elem,
+                  (offsets[recv_segment + 1] - offsets[recv_segment]) * elem,
+                  elem,
+                  nullptr)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// The ranks beyond the largest power of two p first hand their data to
+// rank - p. The first p ranks then swap results with the rank whose
+// number differs in one bit, one bit after the other, and hand the result
+// back. Pairs combine the lower rank's data first, so they agree bitwise.
+bool TcpCommunicator::RecursiveDoubling(char* data,
+                                        size_t count,
+                                        C_DataType data_type,
+                                        C_CCLReduceOp op,
+                                        size_t divisor) {
+  auto bytes = count * DataTypeSize(data_type);
+  size_t p = 1;
+  while (p * 2 <= nranks_) {
+    p *= 2;
+  }
+  if (rank_ >= p) {
+    auto fd = coll_fds_[rank_ - p];
+    return SendTo(fd, data, bytes) && RecvFrom(fd, data, bytes);
+  }
+  std::vector<char> other(bytes);
+  if (rank_ + p < nranks_) {
+    if (!RecvFrom(coll_fds_[rank_ + p], other.data(), bytes)) {
+      return false;
+    }
+    const char* srcs[] = {data, other.data()};
+    ReduceBuffers(srcs, 2, count, data_type, op, 1, data);
+  }
+  for (size_t mask = 1; mask < p; mask <<= 1) {
+    auto peer = rank_ ^ mask;
+    auto fd = coll_fds_[peer];
+    if (!Exchange(fd, data, bytes, fd, other.data(), bytes, 1, nullptr)) {
+      return false;
+    }
+    const char* srcs[] = {data, other.data()};
+    if (peer < rank_) {
+      std::swap(srcs[0], srcs[1]);
+    }
+    ReduceBuffers(srcs, 2, count, data_type, op, 1, data);
+  }
+  if (divisor > 1) {
+    const char* srcs[] = {data};
+    ReduceBuffers(srcs, 1, count, data_type, op, divisor, data);
+  }
+  if (rank_ + p < nranks_) {
+    return SendTo(coll_fds_[rank_ + p], data, bytes);
+  }
+  return true;
+}
+
+bool TcpCommunicator::AllReduce(const void* send,
+                                void* recv,
+                                size_t count,
+                                C_DataType data_type,
+                                C_CCLReduceOp op) {
+  auto elem = DataTypeSize(data_type);
+  auto* data = static_cast<char*>(recv);
+  if (send != recv) {
+    std::memcpy(data, send, count * elem);
+  }
+  if (nranks_ == 1 || count == 0) {
+    return true;
+  }
+  auto divisor = op == C_CCLReduceOp::AVG ? nranks_ : 1;
+  if (count * elem <= TreeThresholdBytes() || count < nranks_) {
+    return RecursiveDoubling(data, count, data_type, op, divisor);
+  }
+  auto offsets = Segments(count, nranks_);
+  return RingReduceScatter(data, offsets, data_type, op, divisor) &&
+         RingAllGather(data, offsets, elem);
+}
+
+bool TcpCommunicator::Reduce(const void* send,
+                             void* recv,
+                             size_t count,
+                             C_DataType data_type,
+                             C_CCLReduceOp op,
+                             size_t root) {
+  auto elem = DataTypeSize(data_type);
+  auto* src = static_cast<const char*>(send);
+  auto* dst = static_cast<char*>(recv);
+  if (nranks_ == 1 || count == 0) {
+    if (src != dst) {
+      std::memcpy(dst, src, count * elem);
+    }
+    return true;
+  }
+  auto divisor = op == C_CCLReduceOp::AVG ? nranks_ : 1;
+  std::vector<char> work(src, src + count * elem);
+  if (count * elem <= TreeThresholdBytes() || count < nranks_) {
+    if (!RecursiveDoubling(work.data(), count, data_type, op, divisor)) {
+      return false;
+    }
+    if (rank_ == root) {
+      std::memcpy(dst, work.data(), work.size());
+    }
+    return true;
+  }
+  // Reduce-scatter around the ring, then every rank sends its segment to
+  // root.
+  auto offsets = Segments(count, nranks_);
+  if (!RingReduceScatter(work.data(), offsets, data_type, op, divisor)) {
+    return false;
+  }
+  if (rank_ != root) {
+    return SendTo(coll_fds_[root],
+                  work.data() + offsets[rank_] * elem,
+                  (offsets[rank_ + 1] - offsets[rank_]) * elem);
+  }
+  for (size_t j = 0; j < nranks_; ++j) {
+    auto* segment = dst + offsets[j] * elem;
+    auto bytes = (offsets[j + 1] - offsets[j]) * elem;
+    if (j == rank_) {
+      std::memcpy(segment, work.data() + offsets[j] * elem, bytes);
+    } else if (!RecvFrom(coll_fds_[j], segment, bytes)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// Small messages go down a binomial tree rooted at root, large ones along
+// the chain root, root + 1, ..., each rank passing chunks on while it
+// still receives the later ones.
+bool TcpCommunicator::Broadcast(void* buf,
+                                size_t count,
+                                C_DataType data_type,
+                                size_t root) {
+  auto bytes = count * DataTypeSize(data_type);
+  auto* data = static_cast<char*>(buf);
+  if (nranks_ == 1 || bytes == 0) {
+    return true;
+  }
+  // Ranks relative to root.
+  auto relative = (rank_ + nranks_ - root) % nranks_;
+  auto fd_of = [&](size_t r) { return coll_fds_[(r + root) % nranks_]; };
+  if (bytes <= TreeThresholdBytes()) {
+    size_t mask = 1;
+    for (; mask < nranks_; mask <<= 1) {
+      if (relative & mask) {
+        if (!RecvFrom(fd_of(relative - mask), data, bytes)) {
+          return false;
+        }
+        break;
+      }
+    }
+    for (mask >>= 1; mask > 0; mask >>= 1) {
+      if (relative + mask < nranks_ &&
+          !SendTo(fd_of(relative + mask), data, bytes)) {
+        return false;
+      }
+    }
+    return true;
+  }
+  if (relative == 0) {
+    return SendTo(fd_of(1), data, bytes);
+  }
+  if (relative + 1 == nranks_) {
+    return RecvFrom(fd_of(relative - 1), data, bytes);
+  }
+  return Exchange(fd_of(relative + 1),
+                  data,
+                  bytes,
+                  fd_of(relative - 1),
+                  data,
+                  bytes,
+                  1,
+                  nullptr,
+                  true);
+}
+
+bool TcpCommunicator::AllGather(const void* send,
+                                void* recv,
+                                size_t count,
+                                C_DataType data_type) {
+  auto elem = DataTypeSize(data_type);
+  auto* data = static_cast<char*>(recv);
+  auto* own = data + rank_ * count * elem;
+  if (own != send) {
+    std::memcpy(own, send, count * elem);
+  }
+  return RingAllGather(data, EqualSegments(count, nranks_), elem);
+}
+
+bool TcpCommunicator::ReduceScatter(const void* send,
+                                    void* recv,
+                                    size_t count,
+                                    C_DataType data_type,
+                                    C_CCLReduceOp op) {
+  auto elem = DataTypeSize(data_type);
+  auto* src = static_cast<const char*>(send);
+  auto divisor = op == C_CCLReduceOp::AVG ? nranks_ : 1;
+  std::vector<char> work(src, src + nranks_ * count * elem);
+  if (!RingReduceScatter(
+          work.data(), EqualSegments(count, nranks_), data_type, op, divisor)) {
+    return false;
+  }
+  std::memcpy(recv, work.data() + rank_ * count * elem, count * elem);
+  return true;
+}
+
+bool TcpCommunicator::Send(const void* buf,
+                           size_t count,
+                           C_DataType data_type,
+                           size_t peer) {
+  if (peer == rank_ || peer >= nranks_) {
+    return false;
+  }
+  return SendTo(p2p_fds_[peer], buf, count * DataTypeSize(data_type));
+}
+
+bool TcpCommunicator::Recv(void* buf,
+                           size_t count,
+                           C_DataType data_type,
+                           size_t peer) {
+  if (peer == rank_ || peer >= nranks_) {
+    return false;
+  }
+  return RecvFrom(p2p_fds_[peer], buf, count * DataTypeSize(data_type));
+}
+
+// Dissemination: in round k every rank signals rank + 2^k and waits for
+// rank - 2^k.
+bool TcpCommunicator::Barrier() {
+  for (size_t distance = 1; distance < nranks_; distance <<= 1) {
+    char token = 0, received;
+    if (!Exchange(coll_fds_[(rank_ + distance) % nranks_],
+                  &token,
+                  1,
+                  coll_fds_[(rank_ + nranks_ - distance) % nranks_],
+                  &received,
+                  1,
+                  1,
+                  nullptr)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+}  // namespace custom_cpu
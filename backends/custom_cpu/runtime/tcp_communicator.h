@@ -0,0 +1,150 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <string>
+#include <vector>
+
+#include "runtime/collective.h"
+
+namespace custom_cpu {
+
+// Where a rank accepts connections from the other ranks.
+struct RankAddress {
+  uint32_t ip;    // network byte order
+  uint16_t port;  // network byte order
+  char host[64];  // host name, to tell whether all ranks share a host
+};
+
+// Listens for the ranks of a new communicator to announce themselves to
+// the process of rank 0. address is "ip:port" for the unique id, with the
+// ip from FLAGS_custom_cpu_ccl_host, else PADDLE_CURRENT_ENDPOINT, else
+// the host name.
+bool StartBootstrap(std::string* address);
+
+// Gives every rank the addresses of all ranks through the process that
+// started the bootstrap at address. *listen_fd is where this rank accepts
+// the connections of the others.
+bool Bootstrap(const std::string& address,
+               size_t nranks,
+               size_t rank,
+               int* listen_fd,
+               std::vector<RankAddress>* ranks);
+
+// Ranks on any hosts, connected pairwise by TCP sockets. Small messages,
+// up to FLAGS_custom_cpu_ccl_tree_threshold_kb (default 64), go by
+// recursive doubling and binomial trees, which take log(nranks) steps;
+// large ones around the ring, which moves every byte only about twice. A
+// step sends to one rank while receiving from another, in chunks of
+// FLAGS_custom_cpu_ccl_chunk_kb (default 128), and reduces every chunk as
+// it arrives. Every pair has a second connection for Send and Recv, so
+// that grouped sends can run on another thread.
+class TcpCommunicator : public Communicator {
+ public:
+  // Connects to all other ranks, taking over listen_fd; nullptr on
+  // failure.
+  static TcpCommunicator* Create(int listen_fd,
+                                 const std::vector<RankAddress>& ranks,
+                                 size_t rank);
+  ~TcpCommunicator() override;
+
+  bool AllReduce(const void* send,
+                 void* recv,
+                 size_t count,
+                 C_DataType data_type,
+                 C_CCLReduceOp op) override;
+
+  bool Reduce(const void* send,
+              void* recv,
+              size_t count,
+              C_DataType data_type,
+              C_CCLReduceOp op,
+              size_t root) override;
+
+  bool Broadcast(void* buf,
+                 size_t count,
+                 C_DataType data_type,
+                 size_t root) override;
+
+  bool AllGather(const void* send,
+                 void* recv,
+                 size_t count,
+                 C_DataType data_type) override;
+
+  bool ReduceScatter(const void* send,
+                     void* recv,
+                     size_t count,
+                     C_DataType data_type,
+                     C_CCLReduceOp op) override;
+
+  // Returns once the socket took the message.
+  bool Send(const void* buf,
+            size_t count,
+            C_DataType data_type,
+            size_t peer) override;
+  bool Recv(void* buf,
+            size_t count,
+            C_DataType data_type,
+            size_t peer) override;
+
+  bool Barrier() override;
+
+ private:
+  TcpCommunicator(size_t nranks, size_t rank);
+
+  bool Connect(int listen_fd, const std::vector<RankAddress>& ranks);
+
+  // Sends send_bytes of send_buf to to while receiving recv_bytes from
+  // from, as the sockets allow. on_chunk(offset, bytes) sees every received
+  // chunk, a multiple of elem bytes, in order. With forward recv_buf is
+  // send_buf, and only bytes received are sent on.
+  bool Exchange(int to,
+                const char* send_buf,
+                size_t send_bytes,
+                int from,
+                char* recv_buf,
+                size_t recv_bytes,
+                size_t elem,
+                const std::function<void(size_t, size_t)>& on_chunk,
+                bool forward = false);
+  bool SendTo(int fd, const void* buf, size_t bytes);
+  bool RecvFrom(int fd, void* buf, size_t bytes);
+
+  // In data, elements offsets[j] to offsets[j + 1] are segment j. Leaves
+  // segment rank op-reduced over all ranks, divided by divisor.
+  bool RingReduceScatter(char* data,
+                         const std::vector<size_t>& offsets,
+                         C_DataType data_type,
+                         C_CCLReduceOp op,
+                         size_t divisor);
+  // Gives every rank segment j of rank j.
+  bool RingAllGather(char* data,
+                     const std::vector<size_t>& offsets,
+                     size_t elem);
+  bool RecursiveDoubling(char* data,
+                         size_t count,
+                         C_DataType data_type,
+                         C_CCLReduceOp op,
+                         size_t divisor);
+
+  // Per rank, -1 for this one.
+  std::vector<int> coll_fds_;
+  std::vector<int> p2p_fds_;
+};
+
+}  // namespace custom_cpu
@@ -0,0 +1,230 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/topology.h"
+
+#include <dirent.h>
+#include <sched.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstdio>
+#include <cstdlib>
+#include <iterator>
+#include <map>
+#include <string>
+#include <thread>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+namespace {
+
+// From linux/mempolicy.h.
+constexpr int kMpolPreferred = 1;
+
+// Parses a cpu list such as "0-3,8,10-11".
+std::vector<int> ParseCpuList(const std::string& list) {
+  std::vector<int> cpus;
+  const char* p = list.c_str();
+  while (*p) {
+    char* end;
+    auto first = strtol(p, &end, 10);
+    if (end == p) {
+      ++p;
+      continue;
+    }
+    auto last = first;
+    if (*end == '-') {
+      p = end + 1;
+      last = strtol(p, &end, 10);
+    }
+    for (auto cpu = first; cpu <= last; ++cpu) {
+      cpus.push_back(static_cast<int>(cpu));
+    }
+    p = end;
+  }
+  return cpus;
+}
+
+std::string ReadLine(const std::string& path) {
+  std::string line;
+  FILE* fp = fopen(path.c_str(), "r");
+  if (fp) {
+    char buffer[4096];
+    if (fgets(buffer, sizeof(buffer), fp)) {
+      line = buffer;
+    }
+    fclose(fp);
+  }
+  return line;
+}
+
+std::vector<int> AllowedCpus() {
+  std::vector<int> cpus;
+  cpu_set_t set;
+  CPU_ZERO(&set);
+  if (sched_getaffinity(0, sizeof(set), &set) == 0) {
+    for (int cpu = 0; cpu < CPU_SETSIZE; ++cpu) {
+      if (CPU_ISSET(cpu, &set)) {
+        cpus.push_back(cpu);
+      }
+    }
+  }
+  if (cpus.empty()) {
+    for (unsigned cpu = 0; cpu < std::thread::hardware_concurrency(); ++cpu) {
+      cpus.push_back(static_cast<int>(cpu));
+    }
+  }
+  return cpus;
+}
+
+// NUMA node -> cpus, empty when sysfs has no node information.
+std::map<int, std::vector<int>> NumaNodes() {
+  std::map<int, std::vector<int>> nodes;
+  DIR* dir = opendir("/sys/devices/system/node");
+  if (!dir) {
+    return nodes;
+  }
+  while (auto* entry = readdir(dir)) {
+    int node;
+    char tail;
+    if (sscanf(entry->d_name, "node%d%c", &node, &tail) != 1) {
+      continue;
+    }
+    nodes[node] = ParseCpuList(ReadLine(
+        std::string("/sys/devices/system/node/") + entry->d_name + "/cpulist"));
+  }
+  closedir(dir);
+  return nodes;
+}
+
+std::vector<int> Intersect(std::vector<int> a, std::vector<int> b) {
+  std::sort(a.begin(), a.end());
+  std::sort(b.begin(), b.end());
+  std::vector<int> out;
+  std::set_intersection(
+      a.begin(), a.end(), b.begin(), b.end(), std::back_inserter(out));
+  return out;
+}
+
+// The node holding every cpu of cpus, -1 if they span several nodes.
+int NodeOf(const std::vector<int>& cpus,
+           const std::map<int, std::vector<int>>& nodes) {
+  for (auto& node : nodes) {
+    if (Intersect(cpus, node.second).size() == cpus.size()) {
+      return node.first;
+    }
+  }
+  return -1;
+}
+
+std::vector<LogicalDevice> DiscoverDevices() {
+  std::vector<LogicalDevice> devices;
+  auto allowed = AllowedCpus();
+  auto nodes = NumaNodes();
+
+  std::string core_sets = EnvToString("FLAGS_custom_cpu_device_cores", "");
+  size_t begin = 0;
+  while (begin < core_sets.size()) {
+    auto end = core_sets.find(';', begin);
+    if (end == std::string::npos) {
+      end = core_sets.size();
+    }
+    LogicalDevice device;
+    device.cpus =
+        Intersect(ParseCpuList(core_sets.substr(begin, end - begin)), allowed);
+    if (!device.cpus.empty()) {
+      device.numa_node = NodeOf(device.cpus, nodes);
+      device.pinned = true;
+      devices.push_back(device);
+    }
+    begin = end + 1;
+  }
+  if (!devices.empty()) {
+    return devices;
+  }
+
+  for (auto& node : nodes) {
+    LogicalDevice device;
+    device.cpus = Intersect(node.second, allowed);
+    if (!device.cpus.empty()) {
+      device.numa_node = node.first;
+      device.pinned = true;
+      devices.push_back(device);
+    }
+  }
+  if (devices.size() > 1) {
+    return devices;
+  }
+
+  LogicalDevice device;
+  device.cpus = allowed;
+  return {device, device};
+}
+
+thread_local size_t current_device = 0;
+
+}  // namespace
+
+const std::vector<LogicalDevice>& GetLogicalDevices() {
+  static const auto* devices =
+      new std::vector<LogicalDevice>(DiscoverDevices());
+  return *devices;
+}
+
+const LogicalDevice& GetLogicalDevice(size_t device_id) {
+  auto& devices = GetLogicalDevices();
+  return devices[device_id % devices.size()];
+}
+
+size_t GetCurrentDevice() { return current_device; }
+
+void SetCurrentDevice(size_t device_id) { current_device = device_id; }
+
+void BindThreadToDevice(pthread_t thread, size_t device_id) {
+  auto& device = GetLogicalDevice(device_id);
+  if (!device.pinned) {
+    return;
+  }
+  cpu_set_t set;
+  CPU_ZERO(&set);
+  for (auto cpu : device.cpus) {
+    CPU_SET(cpu, &set);
+  }
+  pthread_setaffinity_np(thread, sizeof(set), &set);
+}
+
+void BindMemoryToDevice(void* ptr, size_t size, size_t device_id) {
+  auto node = GetLogicalDevice(device_id).numa_node;
+  if (node < 0) {
+    return;
+  }
+  constexpr size_t kBits = 8 * sizeof(unsigned long);    // NOLINT
+  std::vector<unsigned long> mask(node / kBits + 1, 0);  // NOLINT
+  mask[node / kBits] = 1UL << (node % kBits);
+  // Best effort: without the permission or the support for mbind the pages
+  // are placed by the default first-touch policy.
+  syscall(SYS_mbind,
+          ptr,
+          size,
+          kMpolPreferred,
+          mask.data(),
+          mask.size() * kBits + 1,
+          0);
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,55 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <pthread.h>
+
+#include <cstddef>
+#include <vector>
+
+namespace custom_cpu {
+
+// A custom_cpu:N device: the cores its threads run on and the NUMA node its
+// memory comes from.
+struct LogicalDevice {
+  std::vector<int> cpus;
+  // -1 when the memory is not bound to a node.
+  int numa_node = -1;
+  // Whether the threads of the device are restricted to cpus.
+  bool pinned = false;
+};
+
+// The devices are, in order of precedence:
+//   - one per core set of FLAGS_custom_cpu_device_cores, a ';' separated
+//     list of cpu lists such as "0-15,32-47;16-31,48-63";
+//   - one per NUMA node with usable cores, on machines with several nodes;
+//   - otherwise two unpinned devices sharing every core, as before.
+// Cores outside the affinity mask of the process are left out.
+const std::vector<LogicalDevice>& GetLogicalDevices();
+
+const LogicalDevice& GetLogicalDevice(size_t device_id);
+
+// The device selected by SetDevice on the calling thread, 0 by default.
+size_t GetCurrentDevice();
+void SetCurrentDevice(size_t device_id);
+
+// Restricts thread to the cores of a pinned device, no-op otherwise.
+void BindThreadToDevice(pthread_t thread, size_t device_id);
+
+// Makes the pages of [ptr, ptr + size), which must not have been touched
+// yet, prefer the NUMA node of the device. ptr must be page aligned.
+void BindMemoryToDevice(void* ptr, size_t size, size_t device_id);
+
+}  // namespace custom_cpu
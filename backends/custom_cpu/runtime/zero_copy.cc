@@ -0,0 +1,77 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/zero_copy.h"
+
+#include <algorithm>
+#include <cstdint>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+bool ZeroCopyEnabled() {
+  static const bool enabled = EnvToBool("FLAGS_custom_cpu_zero_copy", false);
+  return enabled;
+}
+
+SharedBuffers& SharedBuffers::Instance() {
+  // Leaked on purpose: device memory may still be freed during static
+  // destruction.
+  static auto* buffers = new SharedBuffers();
+  return *buffers;
+}
+
+void SharedBuffers::Add(const void* ptr, size_t size) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  auto& entry = buffers_[static_cast<const char*>(ptr)];
+  entry = std::max(entry, size);
+  max_size_ = std::max(max_size_, size);
+  count_ = buffers_.size();
+}
+
+void SharedBuffers::Remove(const void* ptr, size_t size) {
+  if (count_.load(std::memory_order_relaxed) == 0) {
+    return;
+  }
+  auto begin = static_cast<const char*>(ptr);
+  std::lock_guard<std::mutex> lock(mutex_);
+  buffers_.erase(buffers_.lower_bound(begin),
+                 buffers_.lower_bound(begin + size));
+  count_ = buffers_.size();
+  if (buffers_.empty()) {
+    max_size_ = 0;
+  }
+}
+
+bool SharedBuffers::Contains(const void* ptr, size_t size) {
+  if (count_.load(std::memory_order_relaxed) == 0) {
+    return false;
+  }
+  auto begin = static_cast<const char*>(ptr);
+  auto end = begin + std::max<size_t>(size, 1);
+  std::lock_guard<std::mutex> lock(mutex_);
+  // Entries starting more than max_size_ before begin end before it.
+  auto first = reinterpret_cast<uintptr_t>(begin) > max_size_
+                   ? buffers_.lower_bound(begin - max_size_)
+                   : buffers_.begin();
+  for (auto it = first; it != buffers_.end() && it->first < end; ++it) {
+    if (it->first + it->second > begin) {
+      return true;
+    }
+  }
+  return false;
+}
+
+}  // namespace custom_cpu
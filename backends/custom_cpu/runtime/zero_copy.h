@@ -0,0 +1,59 @@
+// Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+#include <map>
+#include <mutex>
+
+namespace custom_cpu {
+
+// Device memory is ordinary host memory, so with FLAGS_custom_cpu_zero_copy
+// the memcpy_h2d and memcpy_d2h kernels let the destination tensor share
+// the allocation of the source instead of copying it.
+bool ZeroCopyEnabled();
+
+// Device memory that a host tensor aliases after a zero-copy device to host
+// transfer. A kernel writing to it in place has to write to a fresh buffer
+// instead, or the host tensor would change too. Entries are byte ranges,
+// since a sliced tensor starts inside its allocation, and are dropped when
+// the allocation holding them is freed; a stale entry only costs an
+// unnecessary copy. Host buffers aliased by a host to device transfer need
+// no entry: their place differs from the device, so allocating the output
+// of a kernel on them always yields fresh device memory.
+class SharedBuffers {
+ public:
+  static SharedBuffers& Instance();
+
+  void Add(const void* ptr, size_t size);
+  // Drops the entries within the allocation [ptr, ptr + size).
+  void Remove(const void* ptr, size_t size);
+  // True when [ptr, ptr + size) overlaps an entry.
+  bool Contains(const void* ptr, size_t size);
+
+ private:
+  SharedBuffers() = default;
+
+  std::mutex mutex_;
+  // Start to size, the largest one for entries with the same start.
+  std::map<const char*, size_t> buffers_;
+  // Bounds the entries Contains has to look at.
+  size_t max_size_ = 0;
+  // Lets Remove and Contains skip the lock while nothing is shared.
+  std::atomic<size_t> count_{0};
+};
+
+}  // namespace custom_cpu
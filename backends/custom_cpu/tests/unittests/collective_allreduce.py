@@ -0,0 +1,53 @@
+# Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# One rank of test_collective.py. The results are read right
+# after the collectives return, the way an optimizer step or x.numpy()
+# reads gradients.
+
+import numpy as np
+import paddle
+import paddle.distributed as dist
+
+paddle.set_device("custom_cpu")
+dist.init_parallel_env()
+rank = dist.get_rank()
+nranks = dist.get_world_size()
+
+# Under and over the 64 KB threshold between recursive doubling and the
+# ring on the TCP transport.
+for edge in [(100,), (64, 257)]:
+    x = paddle.full(edge, rank + 1, dtype="float32")
+    dist.all_reduce(x)
+    np.testing.assert_array_equal(x.numpy(), (nranks + 1) * nranks / 2)
+
+shape = (1024, 257)
+expected = sum(np.full(shape, r + 1, dtype="float32") for r in range(nranks))
+
+x = paddle.full(shape, rank + 1, dtype="float32")
+dist.all_reduce(x)
+np.testing.assert_array_equal(x.numpy(), expected)
+
+# A kernel reading the result, on the calling thread.
+y = paddle.full(shape, rank + 1, dtype="float32")
+dist.all_reduce(y)
+np.testing.assert_array_equal((y * 2).numpy(), expected * 2)
+
+# On the communication stream.
+z = paddle.full(shape, rank + 1, dtype="float32")
+task = dist.all_reduce(z, sync_op=False)
+task.wait()
+np.testing.assert_array_equal((z + 0).numpy(), expected)
+
+print("rank {}: ok".format(rank))
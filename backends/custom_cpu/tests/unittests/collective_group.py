@@ -0,0 +1,82 @@
+# Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# One rank of test_collective.py. Issues all_reduces of mixed dtypes and ops
+# inside one group, which the plugin fuses by (dtype, op), and checks every
+# output against the same all_reduce run on its own. Paddle does not open
+# groups for all_reduce, so the group calls exported by the plugin are used.
+
+import ctypes
+
+import numpy as np
+import paddle
+import paddle.distributed as dist
+
+paddle.set_device("custom_cpu")
+dist.init_parallel_env()
+rank = dist.get_rank()
+nranks = dist.get_world_size()
+
+
+def load_plugin():
+    with open("/proc/self/maps") as maps:
+        for line in maps:
+            path = line.split()[-1]
+            if path.endswith("libpaddle-custom-cpu.so"):
+                return ctypes.CDLL(path)
+    raise RuntimeError("the custom_cpu plugin is not loaded")
+
+
+plugin = load_plugin()
+
+# Interleaved, so a bucket collects members issued between other buckets.
+# Small integers keep every op exact whatever order the ranks reduce in.
+CASES = [
+    ([10], "float32", dist.ReduceOp.SUM),
+    ([33, 7], "int64", dist.ReduceOp.MAX),
+    ([1000], "float64", dist.ReduceOp.SUM),
+    ([40000], "float32", dist.ReduceOp.SUM),
+    ([5], "float32", dist.ReduceOp.MAX),
+    ([257], "int32", dist.ReduceOp.MIN),
+    ([64], "float64", dist.ReduceOp.PROD),
+    ([3, 3], "int64", dist.ReduceOp.MAX),
+]
+
+
+def inputs():
+    tensors = []
+    for i, (shape, dtype, op) in enumerate(CASES):
+        numel = int(np.prod(shape))
+        values = (np.arange(numel) * (i + 1) + rank) % 5 + 1
+        if op == dist.ReduceOp.MIN:
+            values = values - 3
+        tensors.append(paddle.to_tensor(values.reshape(shape).astype(dtype)))
+    return tensors
+
+
+expected = []
+for x, (_, _, op) in zip(inputs(), CASES):
+    dist.all_reduce(x, op)
+    expected.append(x.numpy())
+
+grouped = inputs()
+assert plugin.CustomCPUGroupStart() == 0
+for x, (_, _, op) in zip(grouped, CASES):
+    dist.all_reduce(x, op)
+assert plugin.CustomCPUGroupEnd() == 0
+
+for x, want in zip(grouped, expected):
+    np.testing.assert_array_equal(x.numpy(), want)
+
+print("rank {}: ok".format(rank))
@@ -0,0 +1,82 @@
+# Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# One rank of test_collective.py. Checks the results of the collectives
+# other than all_reduce. Broadcast and reduce run in place, Paddle hands the
+# plugin the same buffer to send and receive. The large size is more than
+# FLAGS_custom_cpu_ccl_buffer_mb set by the test, so it takes several rounds
+# through the shared memory slots.
+
+import numpy as np
+import paddle
+import paddle.distributed as dist
+
+paddle.set_device("custom_cpu")
+dist.init_parallel_env()
+rank = dist.get_rank()
+nranks = dist.get_world_size()
+
+# Under the TCP tree threshold, and over the shared memory buffer.
+SIZES = [1000, 3 * 2**18 + 5]
+
+
+def data(r, numel, dtype="float32"):
+    return ((np.arange(numel) % 251) + r * 7).astype(dtype)
+
+
+for numel in SIZES:
+    for root in range(nranks):
+        x = paddle.to_tensor(data(rank, numel))
+        dist.broadcast(x, root)
+        np.testing.assert_array_equal(x.numpy(), data(root, numel))
+
+    for dtype, op, reduce in [
+        ("float32", dist.ReduceOp.SUM, np.sum),
+        ("int64", dist.ReduceOp.MAX, np.max),
+        ("float64", dist.ReduceOp.MIN, np.min),
+    ]:
+        expected = reduce(
+            np.stack([data(r, numel, dtype) for r in range(nranks)]), axis=0
+        )
+        for root in range(nranks):
+            x = paddle.to_tensor(data(rank, numel, dtype))
+            dist.reduce(x, root, op)
+            if rank == root:
+                np.testing.assert_array_equal(x.numpy(), expected)
+
+    gathered = []
+    dist.all_gather(gathered, paddle.to_tensor(data(rank, numel)))
+    assert len(gathered) == nranks
+    for r in range(nranks):
+        np.testing.assert_array_equal(gathered[r].numpy(), data(r, numel))
+
+    # Every rank contributes nranks chunks, rank r keeps the sum of the r-th.
+    chunks = [paddle.to_tensor(data(rank + r, numel)) for r in range(nranks)]
+    out = paddle.empty([numel], dtype="float32")
+    dist.reduce_scatter(out, chunks)
+    expected = sum(data(r + rank, numel) for r in range(nranks))
+    np.testing.assert_array_equal(out.numpy(), expected)
+
+    # Around the ring one pair at a time, so a blocking send always has its
+    # receiver waiting.
+    for src in range(nranks):
+        dst = (src + 1) % nranks
+        if rank == src:
+            dist.send(paddle.to_tensor(data(src, numel)), dst)
+        elif rank == dst:
+            y = paddle.zeros([numel], dtype="float32")
+            dist.recv(y, src)
+            np.testing.assert_array_equal(y.numpy(), data(src, numel))
+
+print("rank {}: ok".format(rank))
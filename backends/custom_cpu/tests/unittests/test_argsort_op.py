@@ -356,6 +356,12 @@ class TestArgsort4(TestArgsort):
         self.axis = 1
 
 
+class TestArgsort5(TestArgsort):
+    def init(self):
+        self.input_shape = [16, 5000]
+        self.axis = 1
+
+
 class TestArgsortImperative(unittest.TestCase):
     def init(self):
         self.input_shape = [
@@ -115,6 +115,39 @@ class TestCastOpFp32ToBf16(OpTest):
         self.check_output()
 
 
+class TestCastOpInt64ToFp64(OpTest):
+    def setUp(self):
+        # not representable in float32, must not round through it
+        ipt = np.array([2**53, 2**40 + 3, -(2**30) - 1, 123456789], dtype="int64")
+        self.inputs = {"X": ipt}
+        self.outputs = {"Out": ipt.astype("float64")}
+        self.attrs = {
+            "in_dtype": int(core.VarDesc.VarType.INT64),
+            "out_dtype": int(core.VarDesc.VarType.FP64),
+        }
+        self.op_type = "cast"
+        self.__class__.no_need_check_grad = True
+
+    def test_check_output(self):
+        self.check_output(atol=0)
+
+
+class TestCastOpFp32ToFp16Large(OpTest):
+    def setUp(self):
+        ipt = np.random.uniform(-70000, 70000, size=[300, 1000]).astype("float32")
+        self.inputs = {"X": ipt}
+        self.outputs = {"Out": ipt.astype("float16")}
+        self.attrs = {
+            "in_dtype": int(core.VarDesc.VarType.FP32),
+            "out_dtype": int(core.VarDesc.VarType.FP16),
+        }
+        self.op_type = "cast"
+        self.__class__.no_need_check_grad = True
+
+    def test_check_output(self):
+        self.check_output(atol=1e-3)
+
+
 class TestCastOpError(unittest.TestCase):
     def test_errors(self):
         with program_guard(Program(), Program()):
@@ -0,0 +1,74 @@
+# Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import os
+import subprocess
+import sys
+import unittest
+
+from paddle.distributed.utils.launch_utils import find_free_ports
+
+
+class TestCollective(unittest.TestCase):
+    def run_ranks(self, script, nranks=2, envs=None):
+        endpoints = ["127.0.0.1:%d" % port for port in find_free_ports(nranks)]
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+        procs = []
+        for rank in range(nranks):
+            env = dict(os.environ)
+            env.pop("http_proxy", None)
+            env.pop("https_proxy", None)
+            env.update(
+                {
+                    "FLAGS_selected_custom_cpus": "0",
+                    "PADDLE_DISTRI_BACKEND": "xccl",
+                    "PADDLE_XCCL_BACKEND": "custom_cpu",
+                    "PADDLE_TRAINER_ID": str(rank),
+                    "PADDLE_CURRENT_ENDPOINT": endpoints[rank],
+                    "PADDLE_TRAINERS_NUM": str(nranks),
+                    "PADDLE_TRAINER_ENDPOINTS": ",".join(endpoints),
+                }
+            )
+            env.update(envs or {})
+            procs.append(subprocess.Popen([sys.executable, "-u", script], env=env))
+        for rank, proc in enumerate(procs):
+            self.assertEqual(proc.wait(timeout=300), 0, "rank %d failed" % rank)
+
+    def test_read_result_after_return(self):
+        self.run_ranks("collective_allreduce.py")
+
+    def test_collective_ops(self):
+        # A buffer smaller than the large payload of the script.
+        envs = {"FLAGS_custom_cpu_ccl_buffer_mb": "1"}
+        for nranks in [2, 3]:
+            self.run_ranks("collective_ops.py", nranks, envs)
+
+    def test_grouped_allreduce(self):
+        self.run_ranks("collective_group.py", nranks=3)
+
+    def test_tcp_transport(self):
+        # Three ranks take the non power of two path of recursive doubling,
+        # and every script has sizes on both sides of the 64 KB threshold
+        # between it and the ring.
+        envs = {"FLAGS_custom_cpu_ccl_transport": "tcp"}
+        here = os.path.dirname(os.path.abspath(__file__))
+        scripts = sorted(glob.glob(os.path.join(here, "collective_*.py")))
+        self.assertTrue(scripts)
+        for script in scripts:
+            self.run_ranks(os.path.basename(script), 3, envs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -74,5 +74,16 @@ class TestConcatOp2(TestConcatOp):
         self.axis = 1
 
 
+class TestConcatOpKVCache(TestConcatOp):
+    def init_test_data(self):
+        self.x0 = np.random.random((2, 4, 256, 64)).astype(self.dtype)
+        self.x1 = np.random.random((2, 4, 1, 64)).astype(self.dtype)
+        self.x2 = np.random.random((2, 4, 3, 64)).astype(self.dtype)
+        self.axis = -2
+
+    def test_check_grad(self):
+        pass
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -156,6 +156,19 @@ class TestElementwiseMulOp_broadcast_3(ElementwiseMulOp):
         self.init_kernel_type()
 
 
+class TestElementwiseMulOp_broadcast_axis_inner_one(ElementwiseMulOp):
+    def setUp(self):
+        self.op_type = "elementwise_mul"
+        self.inputs = {
+            "X": np.random.rand(2, 10, 12, 3).astype(np.float64),
+            "Y": np.random.rand(10, 1).astype(np.float64),
+        }
+
+        self.attrs = {"axis": 1}
+        self.outputs = {"Out": self.inputs["X"] * self.inputs["Y"].reshape(1, 10, 1, 1)}
+        self.init_kernel_type()
+
+
 class TestElementwiseMulOp_broadcast_4(ElementwiseMulOp):
     def setUp(self):
         self.op_type = "elementwise_mul"
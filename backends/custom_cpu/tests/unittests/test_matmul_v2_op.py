@@ -268,6 +268,90 @@ class TestMatMul2Dx3D_TransXY(TestMatMulOp):
         self.trans_y = True
 
 
+class TestMatMul4Dx4D(TestMatMulOp):
+    def config(self):
+        self.x_shape = (2, 3, 5, 6)
+        self.y_shape = (2, 3, 6, 4)
+        self.trans_x = False
+        self.trans_y = False
+
+
+class TestMatMul4Dx4DBroadcast(TestMatMulOp):
+    def config(self):
+        self.x_shape = (2, 1, 5, 6)
+        self.y_shape = (1, 3, 6, 4)
+        self.trans_x = False
+        self.trans_y = False
+
+
+class TestMatMul4Dx4DBroadcast_TransX(TestMatMulOp):
+    def config(self):
+        self.x_shape = (2, 1, 6, 5)
+        self.y_shape = (1, 3, 6, 4)
+        self.trans_x = True
+        self.trans_y = False
+
+
+class TestMatMul4Dx3DBroadcast_TransY(TestMatMulOp):
+    def config(self):
+        self.x_shape = (3, 1, 5, 6)
+        self.y_shape = (4, 2, 6)
+        self.trans_x = False
+        self.trans_y = True
+
+
+class TestMatMul1Dx4D(TestMatMulOp):
+    def config(self):
+        self.x_shape = (6,)
+        self.y_shape = (2, 3, 6, 4)
+        self.trans_x = False
+        self.trans_y = False
+
+
+class TestMatMul2Dx2DMultiTile(TestMatMulOp):
+    """
+    shapes larger than one block of the packed GEMM in every dimension
+    """
+
+    def config(self):
+        self.x_shape = (131, 300)
+        self.y_shape = (300, 530)
+        self.trans_x = False
+        self.trans_y = False
+
+    def test_check_grad(self):
+        pass
+
+
+class TestMatMul2Dx2DMultiTile_TransXY(TestMatMul2Dx2DMultiTile):
+    def config(self):
+        self.x_shape = (300, 131)
+        self.y_shape = (530, 300)
+        self.trans_x = True
+        self.trans_y = True
+
+
+class TestMatMulFp16LargeK(OpTest):
+    """
+    float16 with K spanning several blocks of the packed GEMM, which are
+    accumulated in float and rounded to float16 once
+    """
+
+    def setUp(self):
+        self.op_type = "matmul_v2"
+        self.dtype = np.float16
+        x = np.random.uniform(0, 1, (32, 2048)).astype(self.dtype)
+        y = np.random.uniform(0, 1, (2048, 40)).astype(self.dtype)
+        result = np.matmul(x.astype("float64"), y.astype("float64"))
+        self.inputs = {"X": x, "Y": y}
+        self.attrs = {"trans_x": False, "trans_y": False}
+        self.outputs = {"Out": result.astype(self.dtype)}
+
+    def test_check_output(self):
+        # One float16 ulp of results around 512.
+        self.check_output(atol=0.5, check_eager=False)
+
+
 if __name__ == "__main__":
     paddle.enable_static()
     unittest.main()
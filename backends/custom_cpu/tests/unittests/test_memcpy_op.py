@@ -0,0 +1,97 @@
+#   Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import os
+
+# Read by the plugin at the first transfer.
+os.environ["FLAGS_custom_cpu_zero_copy"] = "1"
+
+import unittest
+import numpy as np
+import paddle.base.core as core
+from paddle.base.op import Operator
+import paddle
+
+paddle.enable_static()
+
+
+class TestMemcpyZeroCopy(unittest.TestCase):
+    def setUp(self):
+        self.place = core.CustomPlace("custom_cpu", 0)
+        self.scope = core.Scope()
+        self.x = np.random.random((64, 32)).astype("float32")
+        x_tensor = self.scope.var("X").get_tensor()
+        x_tensor.set(self.x, core.CPUPlace())
+
+    def run_h2d(self):
+        op = Operator("memcpy_h2d", X="X", Out="Out", dst_place_type=1)
+        op.run(self.scope, self.place)
+        return self.scope.find_var("Out").get_tensor()
+
+    def test_h2d(self):
+        out = self.run_h2d()
+        np.testing.assert_array_equal(np.array(out), self.x)
+
+    def test_inplace_write_copies(self):
+        self.run_h2d()
+        g = np.random.random((64, 32)).astype("float32")
+        lr = np.array([0.1]).astype("float32")
+        self.scope.var("Grad").get_tensor().set(g, self.place)
+        self.scope.var("LearningRate").get_tensor().set(lr, self.place)
+        sgd_op = Operator(
+            "sgd",
+            Param="Out",
+            Grad="Grad",
+            ParamOut="Out",
+            LearningRate="LearningRate",
+        )
+        sgd_op.run(self.scope, self.place)
+
+        out = np.array(self.scope.find_var("Out").get_tensor())
+        np.testing.assert_allclose(out, self.x - lr * g, rtol=1e-6)
+        # The host tensor the input was aliased from is left untouched.
+        x = np.array(self.scope.find_var("X").get_tensor())
+        np.testing.assert_array_equal(x, self.x)
+
+    def run_add_inplace(self, x_name):
+        y = np.random.random((64, 32)).astype("float32")
+        self.scope.var("Y").get_tensor().set(y, self.place)
+        add_op = Operator("elementwise_add", X=x_name, Y="Y", Out=x_name)
+        add_op.run(self.scope, self.place)
+        return y
+
+    def test_inplace_add_after_h2d(self):
+        self.run_h2d()
+        y = self.run_add_inplace("Out")
+        out = np.array(self.scope.find_var("Out").get_tensor())
+        np.testing.assert_allclose(out, self.x + y, rtol=1e-6)
+        x = np.array(self.scope.find_var("X").get_tensor())
+        np.testing.assert_array_equal(x, self.x)
+
+    def test_inplace_add_after_d2h(self):
+        self.scope.var("D").get_tensor().set(self.x, self.place)
+        op = Operator("memcpy_d2h", X="D", Out="H", dst_place_type=0)
+        op.run(self.scope, self.place)
+        y = self.run_add_inplace("D")
+        d = np.array(self.scope.find_var("D").get_tensor())
+        np.testing.assert_allclose(d, self.x + y, rtol=1e-6)
+        # The host tensor aliasing the device buffer keeps the old values.
+        h = np.array(self.scope.find_var("H").get_tensor())
+        np.testing.assert_array_equal(h, self.x)
+
+
+if __name__ == "__main__":
+    unittest.main()
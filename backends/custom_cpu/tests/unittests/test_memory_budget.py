@@ -0,0 +1,41 @@
+#   Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import os
+
+# Read by the plugin when the first device allocator is created.
+os.environ.pop("FLAGS_custom_cpu_device_memory_limit_mb", None)
+os.environ.pop("FLAGS_custom_cpu_memory_fraction", None)
+
+import unittest
+import paddle
+
+paddle.set_device("custom_cpu")
+
+
+class TestDefaultMemoryBudget(unittest.TestCase):
+    def test_allocate_over_half_of_host(self):
+        # Without a limit flag a device may take more than the half of the
+        # host memory it reports as free. The pages are never touched.
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        numel = total // 10 * 6
+        x = paddle.empty([numel], dtype="uint8")
+        self.assertEqual(x.shape, [numel])
+        del x
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -564,6 +564,28 @@ class Test8DReduce0(Test1DReduce):
         self.outputs = {"Out": self.inputs["X"].sum(axis=tuple(self.attrs["dim"]))}
 
 
+class TestLargeReduceInner(Test1DReduce):
+    def setUp(self):
+        self.op_type = "reduce_sum"
+        self.attrs = {"dim": [1, 2]}
+        self.inputs = {"X": np.random.random((2, 300, 400)).astype("float64")}
+        self.outputs = {"Out": self.inputs["X"].sum(axis=tuple(self.attrs["dim"]))}
+
+    def test_check_grad(self):
+        pass
+
+
+class TestLargeReduceOuter(Test1DReduce):
+    def setUp(self):
+        self.op_type = "reduce_sum"
+        self.attrs = {"dim": [0]}
+        self.inputs = {"X": np.random.random((100000, 3)).astype("float64")}
+        self.outputs = {"Out": self.inputs["X"].sum(axis=tuple(self.attrs["dim"]))}
+
+    def test_check_grad(self):
+        pass
+
+
 class TestKeepDimReduce(Test1DReduce):
     def setUp(self):
         self.op_type = "reduce_sum"
@@ -82,6 +82,19 @@ class TestCase2(TestSliceOp):
         self.out = self.input[-3:3, 0:100, :, 2:-1]
 
 
+class TestCaseLarge(TestSliceOp):
+    def config(self):
+        self.input = np.random.random([8, 16, 512, 64]).astype("float32")
+        self.starts = [0, 100]
+        self.ends = [8, 400]
+        self.axes = [1, 2]
+        self.infer_flags = [1, 1]
+        self.out = self.input[:, 0:8, 100:400, :]
+
+    def test_check_grad_normal(self):
+        pass
+
+
 # 1.2 with attr(decrease)
 class TestSliceOp_decs_dim(OpTest):
     def setUp(self):
@@ -654,6 +654,40 @@ class TestSoftmaxWithCrossEntropyOpSoftLabelAxis4(TestSoftmaxWithCrossEntropyOp2
         self.use_softmax = True
 
 
+class TestSoftmaxWithCrossEntropyOpLargeVocab(TestSoftmaxWithCrossEntropyOp):
+    def initParams(self):
+        self.op_type = "softmax_with_cross_entropy"
+        self.python_api = python_api
+        self.python_out_sig = ["Loss", "Softmax"]
+        self.numeric_stable_mode = True
+        self.soft_label = False
+        self.shape = [8, 5000]
+        self.ignore_index = 7
+        self.axis = -1
+        self.dtype = np.float64
+        self.use_softmax = True
+
+    def test_check_grad(self):
+        pass
+
+
+class TestSoftmaxWithCrossEntropyOpSoftLabelWideInner(TestSoftmaxWithCrossEntropyOp2):
+    def initParams(self):
+        self.op_type = "softmax_with_cross_entropy"
+        self.python_api = python_api
+        self.python_out_sig = ["Loss", "Softmax"]
+        self.numeric_stable_mode = True
+        self.soft_label = True
+        self.shape = [2, 9, 300]
+        self.ignore_index = -1
+        self.axis = 1
+        self.dtype = np.float64
+        self.use_softmax = True
+
+    def test_check_grad(self):
+        pass
+
+
 class TestSoftmaxWithCrossEntropyOpBoundary0(TestSoftmaxWithCrossEntropyOp):
     """
     Test stable softmax with cross entropy operator will not product INF
@@ -0,0 +1,111 @@
+#   Copyright (c) 2022 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+import paddle
+from op_test import OpTest
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def strided_slice_native_forward(input, axes, starts, ends, strides):
+    index = [slice(None)] * input.ndim
+    for axis, start, end, stride in zip(axes, starts, ends, strides):
+        index[axis] = slice(start, end, stride)
+    return input[tuple(index)]
+
+
+class TestStridedSliceOp(OpTest):
+    def setUp(self):
+        self.op_type = "strided_slice"
+        self.initTestCase()
+        self.inputs = {"Input": self.input}
+        self.outputs = {
+            "Out": strided_slice_native_forward(
+                self.input, self.axes, self.starts, self.ends, self.strides
+            )
+        }
+        self.attrs = {
+            "axes": self.axes,
+            "starts": self.starts,
+            "ends": self.ends,
+            "strides": self.strides,
+            "infer_flags": self.infer_flags,
+        }
+
+    def test_check_output(self):
+        self.check_output()
+
+    def initTestCase(self):
+        self.input = np.random.rand(100)
+        self.axes = [0]
+        self.starts = [2]
+        self.ends = [7]
+        self.strides = [1]
+        self.infer_flags = [1]
+
+
+class TestStridedSliceOpStep(TestStridedSliceOp):
+    def initTestCase(self):
+        self.input = np.random.rand(100)
+        self.axes = [0]
+        self.starts = [3]
+        self.ends = [98]
+        self.strides = [3]
+        self.infer_flags = [1]
+
+
+class TestStridedSliceOpReverse(TestStridedSliceOp):
+    def initTestCase(self):
+        self.input = np.random.rand(100)
+        self.axes = [0]
+        self.starts = [-1]
+        self.ends = [-101]
+        self.strides = [-1]
+        self.infer_flags = [1]
+
+
+class TestStridedSliceOpMultiAxes(TestStridedSliceOp):
+    def initTestCase(self):
+        self.input = np.random.rand(3, 4, 5, 6)
+        self.axes = [0, 2, 3]
+        self.starts = [-1, 0, 5]
+        self.ends = [-4, 5, 0]
+        self.strides = [-2, 2, -3]
+        self.infer_flags = [1, 1, 1]
+
+
+class TestStridedSliceOpLarge(TestStridedSliceOp):
+    def initTestCase(self):
+        self.input = np.random.rand(16, 512, 64).astype("float32")
+        self.axes = [1, 2]
+        self.starts = [511, 0]
+        self.ends = [-513, 64]
+        self.strides = [-1, 2]
+        self.infer_flags = [1, 1]
+
+
+if __name__ == "__main__":
+    unittest.main()
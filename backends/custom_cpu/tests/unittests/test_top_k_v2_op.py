@@ -0,0 +1,133 @@
+# Copyright (c) 2023 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def numpy_topk(x, k=1, axis=-1, largest=True):
+    if axis < 0:
+        axis = len(x.shape) + axis
+    if largest:
+        indices = np.argsort(-x, axis=axis, kind="stable")
+    else:
+        indices = np.argsort(x, axis=axis, kind="stable")
+    indices = np.take(indices, range(k), axis=axis)
+    value = np.take_along_axis(x, indices, axis=axis)
+    return value, indices
+
+
+class TestTopkOp(OpTest):
+    def init_args(self):
+        self.k = 3
+        self.axis = 1
+        self.largest = True
+        self.input_shape = (16, 100)
+
+    def setUp(self):
+        self.op_type = "top_k_v2"
+        self.dtype = np.float64
+        self.init_args()
+        # distinct values so that the selected indices are unique
+        self.input_data = (
+            np.random.permutation(np.prod(self.input_shape))
+            .reshape(self.input_shape)
+            .astype(self.dtype)
+        )
+        self.inputs = {"X": self.input_data}
+        self.attrs = {"k": self.k, "axis": self.axis, "largest": self.largest}
+        output, indices = numpy_topk(
+            self.input_data, axis=self.axis, k=self.k, largest=self.largest
+        )
+        self.outputs = {"Out": output, "Indices": indices}
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestTopkOp1(TestTopkOp):
+    def init_args(self):
+        self.k = 3
+        self.axis = 0
+        self.largest = True
+        self.input_shape = (100, 5, 7)
+
+
+class TestTopkOp2(TestTopkOp):
+    def init_args(self):
+        self.k = 4
+        self.axis = -1
+        self.largest = False
+        self.input_shape = (6, 20)
+
+
+class TestTopkOp3(TestTopkOp):
+    def init_args(self):
+        self.k = 10
+        self.axis = -1
+        self.largest = True
+        self.input_shape = (4, 50000)
+
+
+class TestTopkOp4(TestTopkOp):
+    def init_args(self):
+        self.k = 40
+        self.axis = 1
+        self.largest = False
+        self.input_shape = (3, 60, 4)
+
+
+class TestTopKAPI(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(123)
+        self.input_data = np.random.rand(6, 7, 8)
+        self.place = paddle.CustomPlace("custom_cpu", 0)
+
+    def test_dygraph(self):
+        paddle.disable_static(self.place)
+        x = paddle.to_tensor(self.input_data)
+        for k, axis, largest in [(2, -1, True), (3, 0, False), (8, 2, True)]:
+            out, indices = paddle.topk(x, k=k, axis=axis, largest=largest)
+            value_ref, indices_ref = numpy_topk(
+                self.input_data, k=k, axis=axis, largest=largest
+            )
+            np.testing.assert_allclose(out.numpy(), value_ref)
+            np.testing.assert_array_equal(indices.numpy(), indices_ref)
+        paddle.enable_static()
+
+    def test_nan(self):
+        paddle.disable_static(self.place)
+        x = paddle.to_tensor(np.array([1.0, np.nan, 3.0, 2.0]))
+        out, indices = paddle.topk(x, k=2)
+        self.assertEqual(indices.numpy().tolist(), [1, 2])
+        out, indices = paddle.topk(x, k=2, largest=False)
+        self.assertEqual(indices.numpy().tolist(), [0, 3])
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    unittest.main()